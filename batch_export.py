@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pdf_generator import FONT_DIR
+from pdf_cache import render_pdf
+
+
+def pdf_file_name(model_name, model_id=None):
+    safe = re.sub(r'[\\/:*?"<>|\s]+', '_', model_name).strip('_') or 'model'
+    suffix = f"_{model_id}" if model_id is not None else ""
+    return f"Техпроцесс_{safe}{suffix}.pdf"
+
+
+def pdf_file_names(models):
+    # models: [(id, наименование)] -> {id: имя файла}. Разные модели могут дать одно имя
+    # ("A B", "A_B" и "A/B", или "a" и "A" в Windows) - такие получают id модели,
+    # иначе PDF одной модели молча затирает PDF другой
+    names = {model_id: pdf_file_name(name) for model_id, name in models}
+    counts = Counter(name.lower() for name in names.values())
+    return {model_id: pdf_file_name(name, model_id) if counts[names[model_id].lower()] > 1 else names[model_id]
+            for model_id, name in models}
+
+
+def _render(data, file_path, font_dir, cache):
+    # Выполняется в дочернем процессе: только рендер (или копия из кэша PDF), без обращения к БД
+    cached = render_pdf(data, file_path, font_dir, cache=cache)
+    return file_path, cached
+
+
+def export_models_batch(db, out_dir, model_names=None, workers=None, font_dir=FONT_DIR, progress_callback=None, cache=None,
+                        batch_size=1):
+    # Снимки данных читаются в текущем процессе, PDF рендерятся параллельно в пуле процессов
+    os.makedirs(out_dir, exist_ok=True)
+    models = db.get_models()
+    if model_names is None:
+        model_names = [name for _, name in models]
+    # повтор имени отрендерил бы тот же файл дважды, параллельно в двух процессах
+    model_names = list(dict.fromkeys(model_names))
+    ids = {name: model_id for model_id, name in models}
+    file_names = pdf_file_names({(ids[name], name) for name in model_names if name in ids})
+
+    started = time.perf_counter()
+    done, failed = [], []
+    cached = 0
+    # spawn, а не fork: дочерний процесс не наследует соединения SQLite, блокировки и
+    # потоки родителя (пул Qt, читатели БД), захваченные в момент форка
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {}
+        for name in model_names:
+            data = db.get_process_snapshot(name, batch_size)
+            if data is None:
+                failed.append((name, "модель не найдена"))
+                continue
+            file_path = os.path.join(out_dir, file_names[ids[name]])
+            futures[pool.submit(_render, data, file_path, font_dir, cache)] = name
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                file_path, hit = future.result()
+                done.append(file_path)
+                cached += hit
+            except Exception as e:
+                failed.append((name, str(e)))
+            if progress_callback:
+                progress_callback(len(done) + len(failed), len(model_names))
+
+    elapsed = time.perf_counter() - started
+    per_minute = len(done) / elapsed * 60 if elapsed else 0.0
+    print(f"Пакетный экспорт: {len(done)} PDF за {elapsed:.1f} с ({per_minute:.0f} док/мин), "
+          f"из кэша: {cached}, ошибок: {len(failed)}", file=sys.stderr)
+    return {'done': done, 'failed': failed, 'cached': cached, 'elapsed': elapsed, 'per_minute': per_minute}
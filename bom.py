@@ -0,0 +1,109 @@
+from collections import defaultdict
+
+
+class BOMCycleError(Exception):
+    def __init__(self, cycle):
+        super().__init__("Цикл в составе изделия: " + " -> ".join(map(str, cycle)))
+        self.cycle = cycle
+
+
+# Многоуровневый состав изделия. Деталь, код которой совпадает с названием другой модели,
+# - это сборочная единица: ссылка на модель, а не покупная/изготавливаемая деталь.
+# edges: (родитель, потомок, количество, наименование детали) между моделями;
+# parts: (model_id, id, name, code, quantity) - детали-листья. Обходы итеративные
+# и линейные по числу рёбер, размеры поддеревьев запоминаются.
+class BOMGraph:
+    def __init__(self, models, edges, parts):
+        self.names = dict(models)
+        self.children = defaultdict(list)
+        self.parents = defaultdict(list)
+        for parent, child, quantity, name in edges:
+            self.children[parent].append((child, quantity or 0, name))
+            self.parents[child].append((parent, quantity or 0))
+        self.parts = defaultdict(list)
+        for model_id, id, name, code, quantity in parts:
+            self.parts[model_id].append((id, name, code, quantity or 0))
+        self._sizes = {}
+
+    def _order(self, root, links):
+        # Модели, достижимые из root по links, в топологическом порядке (root первый)
+        state = {root: 1}  # 1 - на пути обхода, 2 - обработана
+        path, stack, order = [root], [iter(links.get(root, ()))], []
+        while stack:
+            for node, *_ in stack[-1]:
+                if state.get(node) == 1:
+                    raise BOMCycleError([self.names.get(id, id) for id in path[path.index(node):] + [node]])
+                if node not in state:
+                    state[node] = 1
+                    path.append(node)
+                    stack.append(iter(links.get(node, ())))
+                    break
+            else:
+                stack.pop()
+                node = path.pop()
+                state[node] = 2
+                order.append(node)
+        order.reverse()
+        return order
+
+    def check(self, root):
+        # BOMCycleError, если состав модели root замкнут сам на себя
+        self._order(root, self.children)
+
+    def explode(self, root, quantity=1):
+        # Суммарное количество каждой детали-листа (name, code) на quantity изделий root:
+        # множители сборок протягиваются сверху вниз в топологическом порядке
+        multiplier = defaultdict(int, {root: quantity})
+        totals = defaultdict(int)
+        for model_id in self._order(root, self.children):
+            count = multiplier[model_id]
+            for child, per_unit, _ in self.children.get(model_id, ()):
+                multiplier[child] += count * per_unit
+            for _, name, code, per_unit in self.parts.get(model_id, ()):
+                totals[(name, code)] += count * per_unit
+        return dict(totals)
+
+    def implode(self, model_id):
+        # Применяемость: {модель-предок: количество model_id на одно изделие предка}
+        per_unit = defaultdict(int, {model_id: 1})
+        for node in self._order(model_id, self.parents):
+            for parent, quantity in self.parents.get(node, ()):
+                per_unit[parent] += per_unit[node] * quantity
+        del per_unit[model_id]
+        return dict(per_unit)
+
+    def size(self, root):
+        # Число строк состава root с уровнями; размеры поддеревьев запоминаются, поэтому
+        # объём разузлования известен за линейное время, до построения строк
+        for model_id in reversed(self._order(root, self.children)):
+            if model_id not in self._sizes:
+                self._sizes[model_id] = len(self.parts.get(model_id, ())) + sum(
+                    1 + self._sizes[child] for child, *_ in self.children.get(model_id, ()))
+        return self._sizes[root]
+
+    def indented(self, root, limit=None):
+        # Строки (уровень, наименование, код, кол-во на сборку, кол-во на изделие):
+        # сборка, затем её состав с уровнем +1; не больше limit строк. Общие сборки
+        # разворачиваются в каждом вхождении, поэтому число строк может расти
+        # экспоненциально с глубиной - проверяйте size() или задавайте limit.
+        self.check(root)
+        rows = []
+        stack = [(self._lines(root), 1, 1)]
+        while stack and (limit is None or len(rows) < limit):
+            lines, level, multiplier = stack[-1]
+            line = next(lines, None)
+            if line is None:
+                stack.pop()
+                continue
+            child, name, code, quantity = line
+            rows.append((level, name, code, quantity, quantity * multiplier))
+            if child is not None:
+                stack.append((self._lines(child), level + 1, quantity * multiplier))
+        return rows
+
+    def _lines(self, model_id):
+        # Строки одного уровня: сборочные единицы (модели), затем детали
+        for child, quantity, name in self.children.get(model_id, ()):
+            yield child, name, self.names.get(child, ""), quantity
+        for _, name, code, quantity in self.parts.get(model_id, ()):
+            yield None, name, code, quantity
@@ -0,0 +1,68 @@
+from collections import defaultdict
+from labor import batch_hours
+
+
+# Загрузка оборудования и цехов по плану выпуска {model_id: количество}: каждая строка
+# плана - одна партия, Tподг учитывается один раз, Tшт - на каждую штуку.
+# aggregates - суммы по (модель, оборудование) в формате LaborRollup, links - пары
+# (model_id, workshop_id). Изменение строки плана или данных одной модели пересчитывает
+# только её вклад, а не весь план.
+class CapacityPlan:
+    def __init__(self, aggregates, links, plan=None):
+        self.aggregates = dict(aggregates)
+        self.plan = {}
+        self.equipment_load = defaultdict(float)  # equipment_id (None - без оборудования) -> ч
+        self.workshop_load = defaultdict(float)   # workshop_id -> ч
+        self._workshops = defaultdict(list)
+        for model_id, workshop_id in links:
+            self._workshops[model_id].append(workshop_id)
+        for model_id, quantity in (plan or {}).items():
+            self.set_quantity(model_id, quantity)
+
+    def _apply(self, model_id, quantity, sign):
+        if not quantity:
+            return
+        for equipment_id, _, prep_time, unit_time in self.aggregates.get(model_id, ()):
+            hours = sign * batch_hours(prep_time or 0.0, unit_time or 0.0, quantity)
+            self.equipment_load[equipment_id] += hours
+            for workshop_id in self._workshops[model_id]:
+                self.workshop_load[workshop_id] += hours
+
+    def set_quantity(self, model_id, quantity):
+        old = self.plan.get(model_id, 0)
+        if quantity == old:
+            return
+        self._apply(model_id, old, -1)
+        self._apply(model_id, quantity, 1)
+        if quantity:
+            self.plan[model_id] = quantity
+        else:
+            self.plan.pop(model_id, None)
+
+    def update_model(self, model_id, rows, workshop_ids=None):
+        # Новые суммы модели после правки маршрута (и, если переданы, её цеха)
+        quantity = self.plan.get(model_id, 0)
+        self._apply(model_id, quantity, -1)
+        self.aggregates[model_id] = rows
+        if workshop_ids is not None:
+            self._workshops[model_id] = list(workshop_ids)
+        self._apply(model_id, quantity, 1)
+
+    def workshop_ids(self, model_id):
+        return list(self._workshops.get(model_id, ()))
+
+    def equipment_rows(self, names, hours_available=None):
+        # (id, наименование, загрузка ч, загрузка в долях от фонда hours_available или None)
+        return self._rows(self.equipment_load, names, hours_available)
+
+    def workshop_rows(self, names, hours_available=None):
+        return self._rows(self.workshop_load, names, hours_available)
+
+    def _rows(self, loads, names, hours_available):
+        rows = []
+        for id, name in names.items():
+            load = loads.get(id, 0.0)
+            if abs(load) < 1e-9:
+                continue
+            rows.append((id, name, load, load / hours_available if hours_available else None))
+        return rows
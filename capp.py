@@ -0,0 +1,247 @@
+import argparse
+import os
+import re
+import sys
+from capp_db import CAPPDatabase
+from bom import BOMCycleError
+from labor import NO_EQUIPMENT
+from metrics import timed
+
+# Консольный режим без Qt: python -m capp export --model X --out dir/
+#                          python -m capp import-bom file.xlsx --model X
+#                          python -m capp labor --by workshops --batch-size 50
+#                          python -m capp bom --model X [--totals | --where-used]
+#                          python -m capp where-used --part CODE | --equipment NAME | --operation CODE
+#                          python -m capp capacity plan.csv --hours 1900
+#                          python -m capp workshops --model X [--set ID ... | --clear]
+#                          python -m capp maintenance [--pages N] [--full]
+
+
+def cmd_export(db, args):
+    # reportlab подгружается только для экспорта
+    from batch_export import export_models_batch, pdf_file_name
+    from pdf_cache import PDFCache, render_pdf
+
+    cache = PDFCache(enabled=False) if args.no_cache else None
+    models = None if args.all else args.model
+    if not models and not args.all:
+        print("Укажите --model или --all", file=sys.stderr)
+        return 2
+    if models and len(models) == 1:
+        data = db.get_process_snapshot(models[0], args.batch_size)
+        if data is None:
+            print(f"Модель {models[0]} не найдена", file=sys.stderr)
+            return 1
+        os.makedirs(args.out, exist_ok=True)
+        file_path = os.path.join(args.out, pdf_file_name(models[0]))
+        cached = render_pdf(data, file_path, cache=cache)
+        print(f"PDF сохранён: {file_path}" + (" (из кэша, дата формирования - первого рендера)" if cached else ""),
+              file=sys.stderr)
+        return 0
+    result = export_models_batch(db, args.out, models, workers=args.workers, cache=cache, batch_size=args.batch_size)
+    for name, error in result['failed']:
+        print(f"{name}: {error}", file=sys.stderr)
+    return 1 if result['failed'] else 0
+
+
+def cmd_import_bom(db, args):
+    if not db.get_model_id(args.model):
+        if not args.create:
+            print(f"Модель {args.model} не найдена (используйте --create)", file=sys.stderr)
+            return 1
+        db.insert_model(args.model)
+    imported = db.import_from_excel(args.file, args.model, chunk_size=args.chunk_size)
+    return 0 if imported else 1
+
+
+def cmd_labor(db, args):
+    # Сводка трудоёмкости в TSV - открывается в табличном редакторе
+    rollup = db.get_labor_rollup(args.batch_size)
+    if rollup is None:
+        return 1
+    print("\t".join(["Наименование", "Операций", "Tподг, ч", "Tшт, мин", "Партия, шт", "Итого, ч"]))
+    for _, name, count, prep_time, unit_time, batch_size, total in getattr(rollup, args.by) + [rollup.total]:
+        print(f"{name}\t{count}\t{prep_time:.2f}\t{unit_time:.2f}\t{batch_size}\t{total:.2f}")
+    return 0
+
+
+def cmd_bom(db, args):
+    # Состав с уровнями, сводная потребность в деталях (--totals) или применяемость (--where-used)
+    model_id = db.get_model_id(args.model)
+    graph = db.get_bom() if model_id else None
+    if graph is None:
+        print(f"Модель {args.model} не найдена", file=sys.stderr)
+        return 1
+    try:
+        if args.where_used:
+            print("\t".join(["Модель", "Количество"]))
+            for ancestor, quantity in graph.implode(model_id).items():
+                print(f"{graph.names.get(ancestor, ancestor)}\t{quantity:g}")
+        elif args.totals:
+            print("\t".join(["Наименование", "Код", "Количество"]))
+            for (name, code), quantity in sorted(graph.explode(model_id, args.quantity).items(), key=lambda item: (item[0][0] or "", item[0][1] or "")):
+                print(f"{name}\t{code or ''}\t{quantity:g}")
+        else:
+            print("\t".join(["Уровень", "Наименование", "Код", "На сборку", "На изделие"]))
+            limit = args.limit if args.limit > 0 else None  # 0 и меньше - все строки
+            for level, name, code, quantity, total in graph.indented(model_id, limit):
+                print(f"{level}\t{'  ' * (level - 1)}{name}\t{code or ''}\t{quantity:g}\t{total * args.quantity:g}")
+            size = graph.size(model_id)
+            if limit and size > limit:
+                print(f"... показано {limit} из {size} строк (--limit)", file=sys.stderr)
+    except BOMCycleError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_where_used(db, args):
+    # Модели, где встречается деталь, оборудование или операция справочника
+    if args.part is not None:
+        rows = db.where_used_part(args.part)
+        print("\t".join(["Модель", "Позиций", "Количество"]))
+        for _, name, count, quantity in rows:
+            print(f"{name}\t{count}\t{quantity:g}")
+    else:
+        rows = db.where_used_equipment(args.equipment) if args.equipment is not None else db.where_used_operation(args.operation)
+        print("\t".join(["Модель", "Операций"]))
+        for _, name, count in rows:
+            print(f"{name}\t{count}")
+    return 0
+
+
+def cmd_capacity(db, args):
+    # План выпуска - строки "модель;количество" (разделитель ; , или табуляция)
+    models = {name: id for id, name in db.get_models()}
+    plan = {}
+    with open(args.plan, encoding="utf-8-sig") as f:
+        for line in f:
+            fields = re.split(r"[;,\t]", line.strip())
+            if len(fields) < 2 or not fields[1].strip().isdigit():
+                continue
+            name, quantity = fields[0].strip(), int(fields[1])
+            if name not in models:
+                print(f"Модель {name} не найдена", file=sys.stderr)
+                return 1
+            plan[models[name]] = plan.get(models[name], 0) + quantity
+    capacity = db.get_capacity_plan(plan)
+    if capacity is None:
+        return 1
+    equipment = {row[0]: row[1] for row in db.get_equipment()}
+    equipment[None] = NO_EQUIPMENT
+    workshops = {row[0]: row[1] for row in db.get_workshop()}
+    print("\t".join(["Наименование", "Загрузка, ч", "Загрузка, %"]))
+    for _, name, load, share in capacity.equipment_rows(equipment, args.hours) + capacity.workshop_rows(workshops, args.hours):
+        print(f"{name}\t{load:.2f}\t" + (f"{share * 100:.1f}" if share is not None else ""))
+    return 0
+
+
+def cmd_workshops(db, args):
+    # Цеха модели (для сводок трудоёмкости и загрузки); без связей модель относится ко всем цехам
+    model_id = db.get_model_id(args.model)
+    if not model_id:
+        print(f"Модель {args.model} не найдена", file=sys.stderr)
+        return 1
+    if args.set or args.clear:
+        known = {row[0] for row in db.get_workshop()}
+        unknown = [id for id in args.set or () if id not in known]
+        if unknown:
+            print("Цеха не найдены: " + ", ".join(map(str, unknown)), file=sys.stderr)
+            return 1
+        if not db.set_model_workshops(model_id, args.set or ()):
+            return 1
+    print("\t".join(["id", "Цех", "Участок", "РМ"]))
+    for id, workshop, section, rm in db.get_model_workshops(model_id):
+        print(f"{id}\t{workshop}\t{section or ''}\t{rm or ''}")
+    return 0
+
+
+def cmd_maintenance(db, args):
+    report = db.maintenance(vacuum_pages=args.pages, full_vacuum=args.full)
+    removed = report['removed']
+    for table, count in sorted(removed.items()):
+        print(f"{table}: удалено висячих строк {count}")
+    if not removed:
+        print("Висячих строк нет")
+    reclaimed = report['reclaimed_pages'] * report['page_size']
+    print(f"Освобождено {reclaimed / 1024 / 1024:.1f} МБ, свободных страниц было {report['free_pages']}, "
+          f"стало {report['free_pages_after']}")
+    if not report['incremental']:
+        print("БД без auto_vacuum = INCREMENTAL: место возвращается только полным VACUUM (--full)")
+    print(f"Время: {report['elapsed']:.2f} с")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="capp", description="CAPP: генерация и экспорт техпроцессов без GUI")
+    parser.add_argument("--db", default="capp.db", help="путь к базе данных (по умолчанию capp.db)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="экспорт техпроцессов в PDF")
+    export.add_argument("--model", action="append", help="модель (можно указать несколько раз)")
+    export.add_argument("--all", action="store_true", help="все модели из БД")
+    export.add_argument("--out", default=".", help="папка для PDF")
+    export.add_argument("--workers", type=int, default=None, help="число процессов для пакетного экспорта")
+    export.add_argument("--no-cache", action="store_true", help="рендерить заново, не используя кэш PDF "
+                        "(PDF из кэша - прежний документ с датой первого формирования)")
+    export.add_argument("--batch-size", type=int, default=1, help="размер партии для расчёта трудоёмкости, шт")
+    export.set_defaults(func=cmd_export)
+
+    import_bom = sub.add_parser("import-bom", help="импорт спецификации из Excel")
+    import_bom.add_argument("file", help="файл .xlsx с листом 'Лист1'")
+    import_bom.add_argument("--model", required=True, help="модель, в которую импортировать")
+    import_bom.add_argument("--create", action="store_true", help="создать модель, если её нет")
+    import_bom.add_argument("--chunk-size", type=int, default=1000, help="размер пачки вставки")
+    import_bom.set_defaults(func=cmd_import_bom)
+
+    labor = sub.add_parser("labor", help="трудоёмкость по моделям, цехам или оборудованию (TSV)")
+    labor.add_argument("--by", choices=["models", "workshops", "equipment"], default="models", help="группировка")
+    labor.add_argument("--batch-size", type=int, default=1, help="размер партии, шт")
+    labor.set_defaults(func=cmd_labor)
+
+    bom = sub.add_parser("bom", help="многоуровневый состав изделия (TSV)")
+    bom.add_argument("--model", required=True, help="модель-изделие")
+    bom.add_argument("--quantity", type=int, default=1, help="количество изделий")
+    bom.add_argument("--totals", action="store_true", help="суммарная потребность в деталях")
+    bom.add_argument("--where-used", action="store_true", help="в какие модели входит и сколько")
+    bom.add_argument("--limit", type=int, default=10000, help="не больше N строк состава с уровнями (0 - все)")
+    bom.set_defaults(func=cmd_bom)
+
+    where_used = sub.add_parser("where-used", help="в каких моделях используется деталь, оборудование или операция (TSV)")
+    target = where_used.add_mutually_exclusive_group(required=True)
+    target.add_argument("--part", help="код детали")
+    target.add_argument("--equipment", help="наименование оборудования")
+    target.add_argument("--operation", help="код операции справочника")
+    where_used.set_defaults(func=cmd_where_used)
+
+    capacity = sub.add_parser("capacity", help="загрузка оборудования и цехов по плану выпуска (TSV)")
+    capacity.add_argument("plan", help="файл плана: строки 'модель;количество'")
+    capacity.add_argument("--hours", type=float, default=None, help="фонд времени единицы оборудования, ч")
+    capacity.set_defaults(func=cmd_capacity)
+
+    workshops = sub.add_parser("workshops", help="цеха модели: показать или закрепить (TSV)")
+    workshops.add_argument("--model", required=True, help="модель")
+    link = workshops.add_mutually_exclusive_group()
+    link.add_argument("--set", type=int, nargs="+", metavar="ID", help="закрепить модель за цехами (id из списка цехов)")
+    link.add_argument("--clear", action="store_true", help="снять связи: модель относится ко всем цехам")
+    workshops.set_defaults(func=cmd_workshops)
+
+    maintenance = sub.add_parser("maintenance", help="удаление висячих строк, VACUUM и ANALYZE")
+    maintenance.add_argument("--pages", type=int, default=None, help="освободить не больше N страниц (по умолчанию все)")
+    maintenance.add_argument("--full", action="store_true", help="полный VACUUM с переводом БД в инкрементальный режим")
+    maintenance.set_defaults(func=cmd_maintenance)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = CAPPDatabase(args.db)
+    try:
+        with timed('capp ' + args.command):
+            return args.func(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1481 @@
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from db_pool import ConnectionManager
+from labor import LaborRollup
+from metrics import timed
+from capacity import CapacityPlan
+from bom import BOMCycleError, BOMGraph
+from operation_index import OperationIndex
+from snapshot_cache import SnapshotCache
+
+
+# Полнотекстовый поиск: одна таблица FTS5 на детали, операции и оборудование.
+# rowid = id * 4 + код типа, поэтому триггеры удаляют запись по rowid без сканирования.
+# Префиксные индексы 1-3 символа: иначе запрос из первой буквы собирает в памяти списки
+# всех слов на эту букву - сотни мс на миллионе строк.
+SEARCH_TABLE_V2 = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        name, body, model_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+"""
+SEARCH_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        name, body, model_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+    )
+"""
+# (таблица, код типа, наименование, поля текста, model_id); {ref} - new./old./имя таблицы
+SEARCH_SOURCES_V2 = [
+    ('parts', 1, "{ref}name", ["{ref}code"], "{ref}model_id"),
+    ('operations', 2, "{ref}name", ["{ref}code", "{ref}description", "{ref}equipment"], "{ref}model_id"),
+    ('equipment', 3, "{ref}name", ["{ref}article", "{ref}note"], "NULL"),
+]
+SEARCH_SOURCES = [
+    ('operation_catalog', 0, "{ref}name", ["{ref}code"], "NULL"),
+    ('route_operations', 2,
+     "(SELECT name FROM operation_catalog WHERE id = {ref}catalog_id)",
+     ["(SELECT code FROM operation_catalog WHERE id = {ref}catalog_id)", "{ref}description",
+      "(SELECT name FROM equipment WHERE id = {ref}equipment_id)"],
+     "{ref}model_id"),
+]
+SEARCH_KINDS = {0: 'operation_catalog', 1: 'parts', 2: 'operations', 3: 'equipment'}
+# Сколько последних совпадений ранжируется для слишком общих запросов
+SEARCH_RANK_WINDOW = 10000
+
+
+def search_values(source, ref):
+    table, kind, name, fields, model = source
+    body = " || ' ' || ".join(f"coalesce({field}, '')" for field in fields)
+    return f"{ref}id * 4 + {kind}, coalesce({name}, ''), {body}, {model}".replace("{ref}", ref)
+
+
+def search_triggers(sources, backfill=True):
+    statements = []
+    for source in sources:
+        table, kind = source[:2]
+        insert = f"INSERT INTO search_index (rowid, name, body, model_id) VALUES ({search_values(source, 'new.')});"
+        delete = f"DELETE FROM search_index WHERE rowid = old.id * 4 + {kind};"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        ]
+        if backfill:
+            statements += search_backfill([source])
+    return statements
+
+
+def search_backfill(sources):
+    return [f"INSERT INTO search_index (rowid, name, body, model_id) SELECT {search_values(source, source[0] + '.')} FROM {source[0]}"
+            for source in sources]
+
+
+def search_refresh_trigger(table, column):
+    # Переименование в справочнике меняет текст всех операций маршрутов, которые на него ссылаются
+    source = SEARCH_SOURCES[1]
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_search_routes AFTER UPDATE ON {table} BEGIN
+            DELETE FROM search_index WHERE rowid IN (SELECT id * 4 + 2 FROM route_operations WHERE {column} = new.id);
+            INSERT INTO search_index (rowid, name, body, model_id)
+            SELECT {search_values(source, 'route_operations.')} FROM route_operations WHERE {column} = new.id;
+        END
+    """
+
+
+# Ревизии данных для кэша снимков техпроцесса: scope = id модели для её деталей,
+# операций и реквизитов, scope 0 - общие справочники (операции, расцеховка, оборудование).
+REVISION_SCOPES_V3 = [
+    # (таблица, scope при вставке, при удалении, при обновлении)
+    ('parts', ["new.model_id"], ["old.model_id"], ["new.model_id", "old.model_id"]),
+    ('operations', ["new.model_id"], ["old.model_id"], ["new.model_id", "old.model_id"]),
+    ('document_details', ["new.model_id"], ["old.model_id"], ["new.model_id", "old.model_id"]),
+    ('models', [], [], ["new.id"]),
+    ('workshop', ["0"], ["0"], ["0"]),
+    ('equipment', ["0"], ["0"], ["0"]),
+]
+REVISION_SCOPES = [
+    ('route_operations', ["new.model_id"], ["old.model_id"], ["new.model_id", "old.model_id"]),
+    ('model_workshops', ["new.model_id"], ["old.model_id"], ["new.model_id", "old.model_id"]),
+    ('operation_catalog', ["0"], ["0"], ["0"]),
+]
+
+
+def revision_triggers(scopes_by_table):
+    statements = []
+    for table, *events in scopes_by_table:
+        for event, scopes in zip(("INSERT", "DELETE", "UPDATE"), events):
+            if not scopes:
+                continue
+            rest = "".join(f" UNION SELECT {scope}" for scope in scopes[1:])
+            statements.append(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_revision_{event.lower()} AFTER {event} ON {table} BEGIN
+                    INSERT INTO revisions (scope, revision)
+                    SELECT scope, 1 FROM (SELECT {scopes[0]} AS scope{rest}) WHERE scope IS NOT NULL
+                    ON CONFLICT (scope) DO UPDATE SET revision = revision + 1;
+                END
+            """)
+    return statements
+
+
+# Нормализация операций: справочник operation_catalog (код + наименование), операции
+# маршрута route_operations со ссылками на справочник и оборудование, связь модель-цех.
+# Старая таблица operations переносится с сохранением id и удаляется.
+NORMALIZE_OPERATIONS = [
+    """
+    CREATE TABLE operation_catalog (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT NOT NULL DEFAULT '',
+        name TEXT NOT NULL,
+        UNIQUE (code, name)
+    )
+    """,
+    """
+    INSERT OR IGNORE INTO operation_catalog (id, code, name)
+    SELECT id, coalesce(code, ''), name FROM operations WHERE model_id IS NULL ORDER BY id
+    """,
+    """
+    INSERT OR IGNORE INTO operation_catalog (code, name)
+    SELECT DISTINCT coalesce(code, ''), name FROM operations WHERE model_id IS NOT NULL
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_equipment_name ON equipment (name)",
+    """
+    INSERT INTO equipment (name)
+    SELECT DISTINCT equipment FROM operations
+    WHERE model_id IS NOT NULL AND coalesce(equipment, '') != ''
+      AND equipment NOT IN (SELECT name FROM equipment)
+    """,
+    """
+    CREATE TABLE route_operations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model_id INTEGER NOT NULL,
+        number TEXT,
+        catalog_id INTEGER NOT NULL,
+        description TEXT,
+        equipment_id INTEGER,
+        document TEXT,
+        prep_time REAL DEFAULT 0.0,
+        unit_time REAL DEFAULT 0.0,
+        FOREIGN KEY (model_id) REFERENCES models(id),
+        FOREIGN KEY (catalog_id) REFERENCES operation_catalog(id),
+        FOREIGN KEY (equipment_id) REFERENCES equipment(id)
+    )
+    """,
+    """
+    INSERT INTO route_operations (id, model_id, number, catalog_id, description, equipment_id, document, prep_time, unit_time)
+    SELECT o.id, o.model_id, o.number,
+           (SELECT c.id FROM operation_catalog c WHERE c.code = coalesce(o.code, '') AND c.name = o.name),
+           o.description,
+           (SELECT min(e.id) FROM equipment e WHERE e.name = o.equipment),
+           o.document, o.prep_time, o.unit_time
+    FROM operations o WHERE o.model_id IS NOT NULL ORDER BY o.id
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_route_operations_model ON route_operations (model_id)",
+    "CREATE INDEX IF NOT EXISTS idx_route_operations_catalog ON route_operations (catalog_id)",
+    "CREATE INDEX IF NOT EXISTS idx_route_operations_equipment ON route_operations (equipment_id)",
+    """
+    CREATE TABLE model_workshops (
+        model_id INTEGER NOT NULL,
+        workshop_id INTEGER NOT NULL,
+        PRIMARY KEY (model_id, workshop_id),
+        FOREIGN KEY (model_id) REFERENCES models(id),
+        FOREIGN KEY (workshop_id) REFERENCES workshop(id)
+    ) WITHOUT ROWID
+    """,
+    # вместе с таблицей удаляются её индексы и триггеры поиска/ревизий
+    "DROP TABLE operations",
+    "DELETE FROM search_index WHERE rowid % 4 = 2",
+]
+
+
+# Каскадное удаление: таблицы со ссылкой на модель (и связь модель-цех) пересоздаются
+# с ON DELETE CASCADE. SQLite не меняет ограничения ALTER TABLE, поэтому таблица
+# копируется в новую с теми же id, старая удаляется вместе с индексами и триггерами.
+# Ссылки на справочники остаются без каскада: используемые записи удалять нельзя.
+CASCADE_TABLES = [
+    ('parts', """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model_id INTEGER REFERENCES models(id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        code TEXT,
+        quantity INTEGER
+    """, "id, model_id, name, code, quantity", ""),
+    ('document_details', """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model_id INTEGER REFERENCES models(id) ON DELETE CASCADE,
+        organization TEXT NOT NULL,
+        product_code TEXT,
+        document_code TEXT,
+        developed_by TEXT,
+        checked_by TEXT
+    """, "id, model_id, organization, product_code, document_code, developed_by, checked_by", ""),
+    ('route_operations', """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+        number TEXT,
+        catalog_id INTEGER NOT NULL REFERENCES operation_catalog(id),
+        description TEXT,
+        equipment_id INTEGER REFERENCES equipment(id),
+        document TEXT,
+        prep_time REAL DEFAULT 0.0,
+        unit_time REAL DEFAULT 0.0
+    """, "id, model_id, number, catalog_id, description, equipment_id, document, prep_time, unit_time", ""),
+    ('model_workshops', """
+        model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+        workshop_id INTEGER NOT NULL REFERENCES workshop(id) ON DELETE CASCADE,
+        PRIMARY KEY (model_id, workshop_id)
+    """, "model_id, workshop_id", " WITHOUT ROWID"),
+]
+
+
+def cascade_migration():
+    # Триггеры справочников ссылаются на route_operations - без них пересоздание проходит
+    # RENAME без ошибок разбора схемы; после переноса все триггеры создаются заново.
+    statements = [
+        "DROP TRIGGER IF EXISTS operation_catalog_search_routes",
+        "DROP TRIGGER IF EXISTS equipment_search_routes",
+    ]
+    for table, columns, names, options in CASCADE_TABLES:
+        statements += [
+            f"CREATE TABLE {table}_new ({columns}){options}",
+            f"INSERT INTO {table}_new ({names}) SELECT {names} FROM {table}",
+            f"DROP TABLE {table}",
+            f"ALTER TABLE {table}_new RENAME TO {table}",
+        ]
+    tables = [table for table, *_ in CASCADE_TABLES]
+    return statements + [
+        "CREATE INDEX IF NOT EXISTS idx_parts_model ON parts (model_id)",
+        "CREATE INDEX IF NOT EXISTS idx_document_details_model ON document_details (model_id)",
+        "CREATE INDEX IF NOT EXISTS idx_route_operations_model ON route_operations (model_id)",
+        "CREATE INDEX IF NOT EXISTS idx_route_operations_catalog ON route_operations (catalog_id)",
+        "CREATE INDEX IF NOT EXISTS idx_route_operations_equipment ON route_operations (equipment_id)",
+        "CREATE INDEX IF NOT EXISTS idx_model_workshops_workshop ON model_workshops (workshop_id)",
+    ] + search_triggers([SEARCH_SOURCES_V2[0], SEARCH_SOURCES[1]], backfill=False) + [
+        search_refresh_trigger('operation_catalog', 'catalog_id'),
+        search_refresh_trigger('equipment', 'equipment_id'),
+    ] + revision_triggers([scope for scope in REVISION_SCOPES_V3 + REVISION_SCOPES if scope[0] in tables])
+
+
+# Суммы трудоёмкости по (модель, оборудование) ведутся триггерами на route_operations,
+# поэтому сводка по всем моделям читает сотни тысяч готовых сумм вместо миллиона операций.
+# Операции без оборудования учитываются под equipment_id = 0.
+LABOR_TOTALS = [
+    """
+    CREATE TABLE labor_totals (
+        model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+        equipment_id INTEGER NOT NULL,
+        operations INTEGER NOT NULL DEFAULT 0,
+        prep_time REAL NOT NULL DEFAULT 0.0,
+        unit_time REAL NOT NULL DEFAULT 0.0,
+        PRIMARY KEY (model_id, equipment_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    INSERT INTO labor_totals (model_id, equipment_id, operations, prep_time, unit_time)
+    SELECT model_id, coalesce(equipment_id, 0), count(*), total(prep_time), total(unit_time)
+    FROM route_operations GROUP BY 1, 2
+    """,
+]
+LABOR_ADD = """
+    INSERT INTO labor_totals (model_id, equipment_id, operations, prep_time, unit_time)
+    VALUES (new.model_id, coalesce(new.equipment_id, 0), 1, coalesce(new.prep_time, 0.0), coalesce(new.unit_time, 0.0))
+    ON CONFLICT (model_id, equipment_id) DO UPDATE SET operations = operations + 1,
+        prep_time = prep_time + excluded.prep_time, unit_time = unit_time + excluded.unit_time;
+"""
+LABOR_SUBTRACT = """
+    UPDATE labor_totals SET operations = operations - 1,
+        prep_time = prep_time - coalesce(old.prep_time, 0.0), unit_time = unit_time - coalesce(old.unit_time, 0.0)
+    WHERE model_id = old.model_id AND equipment_id = coalesce(old.equipment_id, 0);
+    DELETE FROM labor_totals WHERE model_id = old.model_id AND equipment_id = coalesce(old.equipment_id, 0) AND operations <= 0;
+"""
+LABOR_TOTALS += [
+    f"CREATE TRIGGER IF NOT EXISTS route_operations_labor_insert AFTER INSERT ON route_operations BEGIN {LABOR_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS route_operations_labor_delete AFTER DELETE ON route_operations BEGIN {LABOR_SUBTRACT} END",
+    f"""CREATE TRIGGER IF NOT EXISTS route_operations_labor_update
+        AFTER UPDATE OF model_id, equipment_id, prep_time, unit_time ON route_operations BEGIN {LABOR_SUBTRACT} {LABOR_ADD} END""",
+]
+
+
+# Миграции схемы: (версия, SQL). Текущая версия хранится в PRAGMA user_version,
+# при открытии БД применяются все миграции с версией выше текущей.
+SCHEMA_MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS idx_parts_model ON parts (model_id)",
+        "CREATE INDEX IF NOT EXISTS idx_operations_model ON operations (model_id)",
+        "CREATE INDEX IF NOT EXISTS idx_operations_catalog ON operations (code, name) WHERE model_id IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_document_details_model ON document_details (model_id)",
+    ]),
+    (2, [SEARCH_TABLE_V2] + search_triggers(SEARCH_SOURCES_V2)),
+    (3, ["CREATE TABLE IF NOT EXISTS revisions (scope INTEGER PRIMARY KEY, revision INTEGER NOT NULL DEFAULT 0)"]
+        + revision_triggers(REVISION_SCOPES_V3)),
+    (4, NORMALIZE_OPERATIONS + search_triggers(SEARCH_SOURCES)
+        + [search_refresh_trigger('operation_catalog', 'catalog_id'), search_refresh_trigger('equipment', 'equipment_id')]
+        + revision_triggers(REVISION_SCOPES)),
+    (5, cascade_migration()),
+    (6, LABOR_TOTALS),
+    # применяемость детали по коду (where_used_part) и вхождения сборок в get_bom
+    (7, ["CREATE INDEX IF NOT EXISTS idx_parts_code ON parts (code)"]),
+    # индекс поиска с префиксами из одной буквы; триггеры ссылаются на таблицу по имени
+    (8, ["DROP TABLE search_index", SEARCH_TABLE]
+        + search_backfill([SEARCH_SOURCES[0], SEARCH_SOURCES_V2[0], SEARCH_SOURCES[1], SEARCH_SOURCES_V2[2]])),
+]
+
+# Применяемость записей справочников в маршрутах: колонка route_operations
+WHERE_USED_COLUMNS = {'operation_catalog': 'catalog_id', 'equipment': 'equipment_id'}
+
+def json_ids(ids):
+    # Список id одним параметром для WHERE id IN (SELECT value FROM json_each(?))
+    return "[" + ",".join(map(str, ids)) + "]"
+
+
+# Больше строк многоуровневого состава в PDF не выводится
+BOM_ROW_LIMIT = 5000
+
+# Запросы строк, которые возвращают get_* и get_row: (SELECT ... FROM ..., колонка id)
+ROW_QUERIES = {
+    'parts': ("SELECT id, name, code, quantity FROM parts", "id"),
+    'operations': ("""
+        SELECT r.id, r.number, c.code, c.name, r.description, e.name, r.document, r.prep_time, r.unit_time
+        FROM route_operations r
+        JOIN operation_catalog c ON c.id = r.catalog_id
+        LEFT JOIN equipment e ON e.id = r.equipment_id
+    """, "r.id"),
+    'operation_catalog': ("SELECT id, code, name FROM operation_catalog", "id"),
+    'workshop': ("SELECT id, workshop_name, section, rm FROM workshop", "id"),
+    'equipment': ("SELECT id, name, article, note FROM equipment", "id"),
+    'document_details': ("SELECT id, organization, product_code, document_code, developed_by, checked_by FROM document_details", "id"),
+}
+
+
+class CAPPDatabase:
+    def __init__(self, db_name="capp.db"):
+        try:
+            self.pool = ConnectionManager(db_name)
+            self.conn = self.pool.writer
+            self.cursor = self.conn.cursor()
+            self._tx = threading.local()  # depth и events транзакции потока, см. transaction()
+            self._listeners = []
+            self._operation_index = None
+            self.snapshots = SnapshotCache()
+            self._labor = {}  # model_id -> (ревизия, суммы трудоёмкости), см. get_labor_rollup
+            self._bom = (None, None)  # (ревизии всех моделей, BOMGraph), см. get_bom
+            self.subscribe(self._on_operations_change)
+            self.create_tables()
+            print("База данных успешно инициализирована.", file=sys.stderr)
+        except sqlite3.Error as e:
+            print(f"Ошибка базы данных: {e}", file=sys.stderr)
+            raise
+
+    def create_tables(self):
+        # BEGIN IMMEDIATE: исходные таблицы и версия схемы читаются под блокировкой записи,
+        # иначе соседний процесс, открывший ту же БД, мог бы уже перенести operations
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self._create_base_tables()
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self.migrate()
+
+    def _create_base_tables(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS models (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS parts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model_id INTEGER,
+                name TEXT NOT NULL,
+                code TEXT,
+                quantity INTEGER,
+                FOREIGN KEY (model_id) REFERENCES models(id)
+            )
+        ''')
+        if self.schema_version() < 4:
+            # Исходная таблица операций; миграция 4 переносит её в operation_catalog/route_operations
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS operations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    model_id INTEGER,
+                    number TEXT,
+                    code TEXT,
+                    name TEXT NOT NULL,
+                    description TEXT,
+                    equipment TEXT,
+                    document TEXT,
+                    prep_time REAL DEFAULT 0.0,
+                    unit_time REAL DEFAULT 0.0,
+                    FOREIGN KEY (model_id) REFERENCES models(id)
+                )
+            ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS workshop (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                workshop_name TEXT NOT NULL,
+                section TEXT,
+                rm TEXT
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS equipment (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                article TEXT,
+                note TEXT
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS document_details (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model_id INTEGER,
+                organization TEXT NOT NULL,
+                product_code TEXT,
+                document_code TEXT,
+                developed_by TEXT,
+                checked_by TEXT,
+                FOREIGN KEY (model_id) REFERENCES models(id)
+            )
+        ''')
+
+    def schema_version(self):
+        return self.cursor.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self):
+        version = self.schema_version()
+        # Пересоздание таблиц с внешними ключами идёт при отключённой проверке:
+        # PRAGMA foreign_keys не действует внутри транзакции, поэтому переключается здесь
+        self.cursor.execute("PRAGMA foreign_keys = OFF")
+        try:
+            for target, statements in SCHEMA_MIGRATIONS:
+                if target <= version:
+                    continue
+                try:
+                    # Шаг - под блокировкой записи, версия перечитывается внутри: несколько
+                    # процессов, открывших старую БД одновременно, применяют его один раз
+                    self.cursor.execute("BEGIN IMMEDIATE")
+                    version = self.schema_version()
+                    if target <= version:
+                        self.conn.commit()
+                        continue
+                    for sql in statements:
+                        self.cursor.execute(sql)
+                    self.cursor.execute(f"PRAGMA user_version = {int(target)}")
+                    self.conn.commit()
+                    print(f"Схема БД обновлена до версии {target}", file=sys.stderr)
+                except sqlite3.Error:
+                    self.conn.rollback()
+                    raise
+                version = target
+        finally:
+            self.cursor.execute("PRAGMA foreign_keys = ON")
+
+    @contextmanager
+    def transaction(self):
+        # Любая запись идёт через писателя под его блокировкой: запись другого потока ждёт
+        # конца транзакции, а не попадает в неё. Вложенные блоки одного потока фиксируются
+        # один раз на выходе из внешнего; глубина и отложенные события - свои у потока.
+        # Методы записи внутри внешнего блока не глотают sqlite3.Error, а пробрасывают её:
+        # откат и результат решает внешний вызывающий, иначе зафиксировалась бы часть записей.
+        with self.pool.write() as conn:
+            depth = getattr(self._tx, "depth", 0)
+            if not depth:
+                self._tx.events = []
+            self._tx.depth = depth + 1
+            try:
+                yield self
+            except Exception:
+                self._tx.depth = depth
+                if not depth:
+                    conn.rollback()
+                    self._tx.events = []
+                raise
+            self._tx.depth = depth
+            if not depth:
+                conn.commit()
+                events, self._tx.events = self._tx.events, []
+                self._dispatch(dict.fromkeys(events))
+
+    # Уведомления об изменениях: callback(table, action, row_id, model_id), где action -
+    # 'insert' / 'update' / 'delete' для одной строки или 'reset' после пакетной вставки.
+    # Внутри transaction() события копятся и рассылаются после фиксации.
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, table, action, row_id=None, model_id=None):
+        event = (table, action, row_id, model_id)
+        if self._in_transaction():
+            self._tx.events.append(event)
+        else:
+            self._dispatch([event])
+
+    def _dispatch(self, events):
+        for event in events:
+            for callback in list(self._listeners):
+                try:
+                    callback(*event)
+                except Exception as e:
+                    print(f"Ошибка обработчика изменений БД: {e}", file=sys.stderr)
+
+    def _in_transaction(self):
+        # Транзакция открыта этим потоком; фоновые потоки при этом читают через свои соединения
+        return getattr(self._tx, "depth", 0) > 0
+
+    def _cursor(self, sql, params=()):
+        # Чтение идёт через соединение текущего потока и не ждёт писателя;
+        # внутри транзакции читаем через писателя, чтобы видеть свои изменения.
+        conn = self.conn if self._in_transaction() else self.pool.reader()
+        return conn.execute(sql, params)
+
+    def _query(self, sql, params=(), lazy=False):
+        # lazy=True - итератор строк по мере чтения (db_pool.LazyRows на своём соединении);
+        # внутри транзакции строки читаются сразу через писателя
+        if lazy and not self._in_transaction():
+            return self.pool.lazy(sql, params)
+        return self._cursor(sql, params).fetchall()
+
+    def insert_model(self, name):
+        try:
+            with self.transaction():
+                self.cursor.execute("INSERT OR IGNORE INTO models (name) VALUES (?)", (name,))
+                row_id = self.cursor.lastrowid
+                if self.cursor.rowcount > 0:
+                    self._notify('models', 'insert', row_id)
+            return row_id
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка вставки модели: {e}", file=sys.stderr)
+            return None
+
+    def clone_model(self, src_id, new_name):
+        # Копия техпроцесса под новым именем: дочерние строки копируются INSERT ... SELECT
+        # на стороне SQLite одной транзакцией. Возвращает id новой модели или None.
+        try:
+            with self.transaction():
+                self.cursor.execute("INSERT INTO models (name) VALUES (?)", (new_name,))
+                new_id = self.cursor.lastrowid
+                self.cursor.execute("""
+                    INSERT INTO parts (model_id, name, code, quantity)
+                    SELECT ?, name, code, quantity FROM parts WHERE model_id = ? ORDER BY id
+                """, (new_id, src_id))
+                self.cursor.execute("""
+                    INSERT INTO route_operations (model_id, number, catalog_id, description, equipment_id, document, prep_time, unit_time)
+                    SELECT ?, number, catalog_id, description, equipment_id, document, prep_time, unit_time
+                    FROM route_operations WHERE model_id = ? ORDER BY id
+                """, (new_id, src_id))
+                self.cursor.execute("""
+                    INSERT INTO document_details (model_id, organization, product_code, document_code, developed_by, checked_by)
+                    SELECT ?, organization, product_code, document_code, developed_by, checked_by
+                    FROM document_details WHERE model_id = ? ORDER BY id
+                """, (new_id, src_id))
+                self.cursor.execute("""
+                    INSERT INTO model_workshops (model_id, workshop_id)
+                    SELECT ?, workshop_id FROM model_workshops WHERE model_id = ?
+                """, (new_id, src_id))
+                self._notify('models', 'insert', new_id)
+            return new_id
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка копирования модели: {e}", file=sys.stderr)
+            return None
+
+    def insert_part(self, model_id, name, code, quantity):
+        try:
+            with self.transaction():
+                self.cursor.execute("INSERT INTO parts (model_id, name, code, quantity) VALUES (?, ?, ?, ?)",
+                                   (model_id, name, code, quantity))
+                row_id = self.cursor.lastrowid
+                self._notify('parts', 'insert', row_id, model_id)
+            return row_id
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка вставки детали: {e}", file=sys.stderr)
+            return None
+
+    def _catalog_id(self, code, name):
+        # id операции справочника по коду и наименованию, новая пара добавляется в справочник
+        self.cursor.execute("INSERT OR IGNORE INTO operation_catalog (code, name) VALUES (?, ?)", (code or "", name))
+        if self.cursor.rowcount > 0:
+            self._notify('operation_catalog', 'insert', self.cursor.lastrowid)
+            return self.cursor.lastrowid
+        return self.cursor.execute("SELECT id FROM operation_catalog WHERE code = ? AND name = ?",
+                                   (code or "", name)).fetchone()[0]
+
+    def _equipment_id(self, name):
+        # id оборудования по наименованию; незнакомое наименование добавляется в справочник
+        if not name:
+            return None
+        row = self.cursor.execute("SELECT min(id) FROM equipment WHERE name = ?", (name,)).fetchone()
+        if row[0] is not None:
+            return row[0]
+        self.cursor.execute("INSERT INTO equipment (name) VALUES (?)", (name,))
+        self._notify('equipment', 'insert', self.cursor.lastrowid)
+        return self.cursor.lastrowid
+
+    def insert_operation(self, model_id, number, code, name, description, equipment="", prep_time=0.0, unit_time=0.0):
+        try:
+            with self.transaction():
+                catalog_id = self._catalog_id(code, name)
+                equipment_id = self._equipment_id(equipment)
+                self.cursor.execute("""
+                    INSERT INTO route_operations (model_id, number, catalog_id, description, equipment_id, prep_time, unit_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (model_id, number, catalog_id, description, equipment_id, prep_time, unit_time))
+                row_id = self.cursor.lastrowid
+                self._notify('operations', 'insert', row_id, model_id)
+            return row_id
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка вставки операции: {e}", file=sys.stderr)
+            return None
+
+    def insert_parts_many(self, model_id, rows):
+        # rows: итерируемое из (name, code, quantity)
+        try:
+            with self.transaction():
+                self.cursor.executemany("INSERT INTO parts (model_id, name, code, quantity) VALUES (?, ?, ?, ?)",
+                                        ((model_id, name, code, quantity) for name, code, quantity in rows))
+                count = self.cursor.rowcount
+                self._notify('parts', 'reset', None, model_id)
+            return count
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка пакетной вставки деталей: {e}", file=sys.stderr)
+            return 0
+
+    def insert_operations_many(self, model_id, rows):
+        # rows: итерируемое из (number, code, name, description, equipment, prep_time, unit_time).
+        # Сначала недостающие записи справочников, затем операции со ссылками на них.
+        rows = [(number, code or "", name, description, equipment or "", prep_time, unit_time)
+                for number, code, name, description, equipment, prep_time, unit_time in rows]
+        try:
+            with self.transaction():
+                changes = self.conn.total_changes
+                self.cursor.executemany("INSERT OR IGNORE INTO operation_catalog (code, name) VALUES (?, ?)",
+                                        {(row[1], row[2]) for row in rows})
+                if self.conn.total_changes != changes:
+                    self._notify('operation_catalog', 'reset')
+                changes = self.conn.total_changes
+                self.cursor.executemany("""
+                    INSERT INTO equipment (name) SELECT ?1 WHERE NOT EXISTS (SELECT 1 FROM equipment WHERE name = ?1)
+                """, ((name,) for name in {row[4] for row in rows} if name))
+                if self.conn.total_changes != changes:
+                    self._notify('equipment', 'reset')
+                self.cursor.executemany("""
+                    INSERT INTO route_operations (model_id, number, catalog_id, description, equipment_id, prep_time, unit_time)
+                    VALUES (?, ?, (SELECT id FROM operation_catalog WHERE code = ? AND name = ?), ?,
+                            (SELECT min(id) FROM equipment WHERE name = ?), ?, ?)
+                """, ((model_id, *row) for row in rows))
+                count = self.cursor.rowcount
+                self._notify('operations', 'reset', None, model_id)
+            return count
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка пакетной вставки операций: {e}", file=sys.stderr)
+            return 0
+
+    def insert_catalog_operation(self, code, name):
+        try:
+            with self.transaction():
+                self.cursor.execute("INSERT OR IGNORE INTO operation_catalog (code, name) VALUES (?, ?)", (code or "", name))
+                row_id = self.cursor.lastrowid
+                if self.cursor.rowcount > 0:
+                    self._notify('operation_catalog', 'insert', row_id)
+            return row_id
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка вставки операции в справочник: {e}", file=sys.stderr)
+            return None
+
+    def insert_workshop(self, workshop_name, section, rm):
+        try:
+            with self.transaction():
+                self.cursor.execute("INSERT INTO workshop (workshop_name, section, rm) VALUES (?, ?, ?)",
+                                   (workshop_name, section, rm))
+                row_id = self.cursor.lastrowid
+                self._notify('workshop', 'insert', row_id)
+            return row_id
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка вставки данных расцеховки: {e}", file=sys.stderr)
+            return None
+
+    def insert_equipment(self, name, article, note):
+        try:
+            with self.transaction():
+                self.cursor.execute("INSERT INTO equipment (name, article, note) VALUES (?, ?, ?)",
+                                   (name, article, note))
+                row_id = self.cursor.lastrowid
+                self._notify('equipment', 'insert', row_id)
+            return row_id
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка вставки оборудования: {e}", file=sys.stderr)
+            return None
+
+    def insert_document_details(self, model_id, organization, product_code, document_code, developed_by, checked_by):
+        try:
+            with self.transaction():
+                self.cursor.execute("INSERT INTO document_details (model_id, organization, product_code, document_code, developed_by, checked_by) VALUES (?, ?, ?, ?, ?, ?)",
+                                   (model_id, organization, product_code, document_code, developed_by, checked_by))
+                row_id = self.cursor.lastrowid
+                self._notify('document_details', 'insert', row_id, model_id)
+            return row_id
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка вставки реквизитов документа: {e}", file=sys.stderr)
+            return None
+
+    def update_model(self, id, name):
+        try:
+            with self.transaction():
+                self.cursor.execute("UPDATE models SET name = ? WHERE id = ?", (name, id))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('models', 'update', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка обновления модели: {e}", file=sys.stderr)
+            return False
+
+    def update_part(self, id, name, code, quantity):
+        try:
+            with self.transaction():
+                self.cursor.execute("UPDATE parts SET name = ?, code = ?, quantity = ? WHERE id = ?", (name, code, quantity, id))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('parts', 'update', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка обновления детали: {e}", file=sys.stderr)
+            return False
+
+    def update_operation(self, id, number, code, name, description, equipment="", prep_time=0.0, unit_time=0.0):
+        try:
+            with self.transaction():
+                catalog_id = self._catalog_id(code, name)
+                equipment_id = self._equipment_id(equipment)
+                self.cursor.execute("""
+                    UPDATE route_operations SET number = ?, catalog_id = ?, description = ?, equipment_id = ?,
+                                                prep_time = ?, unit_time = ?
+                    WHERE id = ?
+                """, (number, catalog_id, description, equipment_id, prep_time, unit_time, id))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('operations', 'update', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка обновления операции: {e}", file=sys.stderr)
+            return False
+
+    def _notify_routes(self, column, id):
+        # Операции маршрутов показывают наименования из справочников: обновить модели-пользователи
+        for (model_id,) in self.cursor.execute(
+                f"SELECT DISTINCT model_id FROM route_operations WHERE {column} = ?", (id,)).fetchall():
+            self._notify('operations', 'reset', None, model_id)
+
+    def update_catalog_operation(self, id, code, name):
+        # Меняет код/наименование во всех маршрутах, где операция используется
+        try:
+            with self.transaction():
+                self.cursor.execute("UPDATE operation_catalog SET code = ?, name = ? WHERE id = ?", (code or "", name, id))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('operation_catalog', 'update', id)
+                    self._notify_routes('catalog_id', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка обновления операции справочника: {e}", file=sys.stderr)
+            return False
+
+    def update_workshop(self, id, workshop_name, section, rm):
+        try:
+            with self.transaction():
+                self.cursor.execute("UPDATE workshop SET workshop_name = ?, section = ?, rm = ? WHERE id = ?", 
+                                   (workshop_name, section, rm, id))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('workshop', 'update', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка обновления данных расцеховки: {e}", file=sys.stderr)
+            return False
+
+    def update_equipment(self, id, name, article, note):
+        try:
+            with self.transaction():
+                self.cursor.execute("UPDATE equipment SET name = ?, article = ?, note = ? WHERE id = ?", 
+                                   (name, article, note, id))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('equipment', 'update', id)
+                    self._notify_routes('equipment_id', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка обновления оборудования: {e}", file=sys.stderr)
+            return False
+
+    def update_document_details(self, id, organization, product_code, document_code, developed_by, checked_by):
+        try:
+            with self.transaction():
+                self.cursor.execute("UPDATE document_details SET organization = ?, product_code = ?, document_code = ?, developed_by = ?, checked_by = ? WHERE id = ?",
+                                   (organization, product_code, document_code, developed_by, checked_by, id))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('document_details', 'update', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка обновления реквизитов документа: {e}", file=sys.stderr)
+            return False
+
+    def delete_model(self, id):
+        return self.delete_models([id]) > 0
+
+    def delete_models(self, ids):
+        # Детали, операции, реквизиты и связи с цехами удаляются каскадно (ON DELETE CASCADE)
+        # по индексам model_id; все модели - одной транзакцией. Возвращает число удалённых.
+        try:
+            deleted = []
+            with self.transaction():
+                for id in ids:
+                    self.cursor.execute("DELETE FROM models WHERE id = ?", (id,))
+                    if self.cursor.rowcount > 0:
+                        deleted.append(id)
+                        # каскад увеличил ревизию удалённой модели, она больше не нужна
+                        self.cursor.execute("DELETE FROM revisions WHERE scope = ?", (id,))
+                for id in deleted:
+                    for table in ('parts', 'operations', 'document_details'):
+                        self._notify(table, 'reset', None, id)
+                    self._notify('models', 'delete', id)
+            return len(deleted)
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка удаления модели: {e}", file=sys.stderr)
+            return 0
+
+    def delete_part(self, id):
+        try:
+            with self.transaction():
+                self.cursor.execute("DELETE FROM parts WHERE id = ?", (id,))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('parts', 'delete', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка удаления детали: {e}", file=sys.stderr)
+            return False
+
+    def delete_operation(self, id):
+        try:
+            with self.transaction():
+                self.cursor.execute("DELETE FROM route_operations WHERE id = ?", (id,))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('operations', 'delete', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка удаления операции: {e}", file=sys.stderr)
+            return False
+
+    def is_used(self, column, id):
+        return bool(self._query(f"SELECT 1 FROM route_operations WHERE {column} = ? LIMIT 1", (id,)))
+
+    # Применяемость (обратный индекс): модели, где встречается деталь, оборудование или
+    # операция, - [(model_id, модель, вхождений, ...)] по имени модели. Каждый запрос - поиск
+    # по индексу (idx_parts_code, idx_route_operations_catalog/_equipment), без обхода моделей.
+    def where_used_part(self, code):
+        # [(model_id, модель, позиций состава, всего шт)]
+        try:
+            return self._query("""
+                SELECT m.id, m.name, count(*), coalesce(sum(p.quantity), 0)
+                FROM parts p JOIN models m ON m.id = p.model_id
+                WHERE p.code = ? GROUP BY p.model_id ORDER BY m.name
+            """, (code,))
+        except sqlite3.Error as e:
+            print(f"Ошибка поиска применяемости детали: {e}", file=sys.stderr)
+            return []
+
+    def where_used_equipment(self, name):
+        # [(model_id, модель, операций)]; одноимённое оборудование учитывается вместе
+        return self._where_used_routes('equipment_id', "SELECT id FROM equipment WHERE name = ?", (name,))
+
+    def where_used_operation(self, code):
+        # [(model_id, модель, операций)] по всем наименованиям операции с этим кодом
+        return self._where_used_routes('catalog_id', "SELECT id FROM operation_catalog WHERE code = ?", (code,))
+
+    def where_used(self, table, id):
+        # Применяемость записи справочника table по её id (панель EditDBDialog)
+        if table == 'workshop':
+            try:
+                return self._query("""
+                    SELECT m.id, m.name, 1 FROM model_workshops w JOIN models m ON m.id = w.model_id
+                    WHERE w.workshop_id = ? ORDER BY m.name
+                """, (id,))
+            except sqlite3.Error as e:
+                print(f"Ошибка поиска применяемости: {e}", file=sys.stderr)
+                return []
+        return self._where_used_routes(WHERE_USED_COLUMNS[table], "?", (id,))
+
+    def _where_used_routes(self, column, ids, params):
+        try:
+            return self._query(f"""
+                SELECT m.id, m.name, count(*) FROM route_operations r JOIN models m ON m.id = r.model_id
+                WHERE r.{column} IN ({ids}) GROUP BY r.model_id ORDER BY m.name
+            """, params)
+        except sqlite3.Error as e:
+            print(f"Ошибка поиска применяемости: {e}", file=sys.stderr)
+            return []
+
+    def delete_catalog_operation(self, id):
+        # Операцию, на которую ссылаются маршруты, удалить нельзя
+        try:
+            with self.transaction():
+                if self.is_used('catalog_id', id):
+                    return False
+                self.cursor.execute("DELETE FROM operation_catalog WHERE id = ?", (id,))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('operation_catalog', 'delete', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка удаления операции справочника: {e}", file=sys.stderr)
+            return False
+
+    def delete_workshop(self, id):
+        try:
+            with self.transaction():
+                # связи с моделями удаляются каскадно
+                self.cursor.execute("DELETE FROM workshop WHERE id = ?", (id,))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('workshop', 'delete', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка удаления данных расцеховки: {e}", file=sys.stderr)
+            return False
+
+    def delete_equipment(self, id):
+        # Оборудование, на которое ссылаются маршруты, удалить нельзя
+        try:
+            with self.transaction():
+                if self.is_used('equipment_id', id):
+                    return False
+                self.cursor.execute("DELETE FROM equipment WHERE id = ?", (id,))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('equipment', 'delete', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка удаления оборудования: {e}", file=sys.stderr)
+            return False
+
+    def delete_document_details(self, id):
+        try:
+            with self.transaction():
+                self.cursor.execute("DELETE FROM document_details WHERE id = ?", (id,))
+                changed = self.cursor.rowcount > 0
+                if changed:
+                    self._notify('document_details', 'delete', id)
+            return changed
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка удаления реквизитов документа: {e}", file=sys.stderr)
+            return False
+
+    def get_models(self):
+        try:
+            return self._query("SELECT id, name FROM models")
+        except sqlite3.Error as e:
+            print(f"Ошибка получения моделей: {e}", file=sys.stderr)
+            return []
+
+    def get_model_id(self, name):
+        try:
+            result = self._query("SELECT id FROM models WHERE name = ?", (name,))
+            return result[0][0] if result else None
+        except sqlite3.Error as e:
+            print(f"Ошибка получения ID модели: {e}", file=sys.stderr)
+            return None
+
+    def _rows(self, table, where="", params=(), lazy=False, after=None):
+        # after - id последней уже показанной строки: продолжение списка по ключу (id > after)
+        sql, id_column = ROW_QUERIES[table]
+        if after is not None:
+            where = f"{where} AND {id_column} > ?" if where else f"WHERE {id_column} > ?"
+            params = tuple(params) + (after,)
+        return self._query(f"{sql} {where} ORDER BY {id_column}", params, lazy)
+
+    def get_parts(self, model_id, lazy=False, after=None):
+        try:
+            return self._rows('parts', "WHERE model_id = ?", (model_id,), lazy, after)
+        except sqlite3.Error as e:
+            print(f"Ошибка получения деталей: {e}", file=sys.stderr)
+            return []
+
+    def get_operations(self, model_id, lazy=False, after=None):
+        # Операции маршрута модели с кодом/наименованием из справочника и именем оборудования
+        try:
+            return self._rows('operations', "WHERE r.model_id = ?", (model_id,), lazy, after)
+        except sqlite3.Error as e:
+            print(f"Ошибка получения операций: {e}", file=sys.stderr)
+            return []
+
+    def get_operation_catalog(self, lazy=False, after=None):
+        try:
+            return self._rows('operation_catalog', lazy=lazy, after=after)
+        except sqlite3.Error as e:
+            print(f"Ошибка получения справочника операций: {e}", file=sys.stderr)
+            return []
+
+    def get_workshop(self, lazy=False, after=None):
+        try:
+            return self._rows('workshop', lazy=lazy, after=after)
+        except sqlite3.Error as e:
+            print(f"Ошибка получения данных расцеховки: {e}", file=sys.stderr)
+            return []
+
+    def get_equipment(self, lazy=False, after=None):
+        try:
+            return self._rows('equipment', lazy=lazy, after=after)
+        except sqlite3.Error as e:
+            print(f"Ошибка получения оборудования: {e}", file=sys.stderr)
+            return []
+
+    def get_document_details(self, model_id, lazy=False, after=None):
+        try:
+            return self._rows('document_details', "WHERE model_id = ?", (model_id,), lazy, after)
+        except sqlite3.Error as e:
+            print(f"Ошибка получения реквизитов документа: {e}", file=sys.stderr)
+            return []
+
+    def get_model_workshops(self, model_id):
+        # Цеха модели; пока модель ни с одним цехом не связана - все цеха, как до связи
+        try:
+            rows = self._rows('workshop', "WHERE id IN (SELECT workshop_id FROM model_workshops WHERE model_id = ?)", (model_id,))
+            return rows or self.get_workshop()
+        except sqlite3.Error as e:
+            print(f"Ошибка получения цехов модели: {e}", file=sys.stderr)
+            return []
+
+    def set_model_workshops(self, model_id, workshop_ids):
+        try:
+            with self.transaction():
+                self.cursor.execute("DELETE FROM model_workshops WHERE model_id = ?", (model_id,))
+                self.cursor.executemany("INSERT OR IGNORE INTO model_workshops (model_id, workshop_id) VALUES (?, ?)",
+                                        ((model_id, workshop_id) for workshop_id in workshop_ids))
+            return True
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Ошибка связи модели с цехами: {e}", file=sys.stderr)
+            return False
+
+    def get_model_equipment(self, model_id):
+        # Оборудование, которое используется в маршруте модели
+        try:
+            return self._rows('equipment', "WHERE id IN (SELECT equipment_id FROM route_operations WHERE model_id = ?)", (model_id,))
+        except sqlite3.Error as e:
+            print(f"Ошибка получения оборудования модели: {e}", file=sys.stderr)
+            return []
+
+    def operation_index(self):
+        # Кэш индекса справочника операций, сбрасывается только при его изменении
+        if self._operation_index is None:
+            self._operation_index = OperationIndex(self.get_operation_catalog(lazy=True))
+        return self._operation_index
+
+    def _on_operations_change(self, table, action, row_id, model_id):
+        if table == 'operation_catalog':
+            self._operation_index = None
+
+    def search(self, text, limit=50):
+        # Поиск по мере ввода: последнее слово ищется как префикс. Сначала идут совпадения
+        # в наименовании, затем в остальном тексте; внутри - сначала более короткие
+        # тексты (точнее совпадение), затем новые записи. Если совпадений больше
+        # SEARCH_RANK_WINDOW, ранжируются только последние добавленные из них.
+        # Результат: [(таблица, id, model_id, модель, наименование, текст)].
+        terms = re.findall(r"\w+", text)
+        if not terms:
+            return []
+        query = " ".join(f'"{term}"' for term in terms) + "*"
+        try:
+            hits = self._search_ranked(f"name : ({query})", "name", limit)
+            if len(hits) < limit:
+                seen = {(kind, row_id) for kind, row_id, *_ in hits}
+                hits += [hit for hit in self._search_ranked(query, "body", limit)
+                         if (hit[0], hit[1]) not in seen][:limit - len(hits)]
+            return [(SEARCH_KINDS[kind], *rest) for kind, *rest in hits]
+        except sqlite3.Error as e:
+            print(f"Ошибка поиска: {e}", file=sys.stderr)
+            return []
+
+    def _search_ranked(self, query, column, limit):
+        # Ранг - длина колонки совпадения, без bm25: тот читает частоту каждого слова
+        # запроса по всему индексу, и частое слово стоит десятки мс даже при паре
+        # совпадений. Каждое совпадение читается из индекса: если их больше окна,
+        # ранжируем только последние SEARCH_RANK_WINDOW (отсечка по rowid дешёвая).
+        edge = self._query("SELECT rowid FROM search_index WHERE search_index MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                           (query, SEARCH_RANK_WINDOW - 1))
+        min_rowid = edge[0][0] if edge else 0
+        return self._query(f'''
+            SELECT s.kind, s.id, s.model_id, m.name, s.name, s.body
+            FROM (SELECT rowid % 4 AS kind, rowid / 4 AS id, model_id, name, body,
+                         length({column}) AS score, length(name) + length(body) AS size, rowid
+                  FROM search_index WHERE search_index MATCH ? AND rowid >= ?
+                  ORDER BY score, size, rowid DESC LIMIT ?) s
+            LEFT JOIN models m ON m.id = s.model_id
+            ORDER BY s.score, s.size, s.rowid DESC
+        ''', (query, min_rowid, limit))
+
+    def get_row(self, table, row_id):
+        try:
+            sql, id_column = ROW_QUERIES[table]
+            rows = self._query(f"{sql} WHERE {id_column} = ?", (row_id,))
+            return rows[0] if rows else None
+        except sqlite3.Error as e:
+            print(f"Ошибка получения строки {table}: {e}", file=sys.stderr)
+            return None
+
+    def get_revision(self, model_id):
+        # (ревизия данных модели, ревизия общих справочников) - растут с каждой записью
+        rows = self._query("""
+            SELECT coalesce(max(CASE WHEN scope = ? THEN revision END), 0),
+                   coalesce(max(CASE WHEN scope = 0 THEN revision END), 0)
+            FROM revisions WHERE scope IN (?, 0)
+        """, (model_id, model_id))
+        return rows[0]
+
+    def get_process_snapshot(self, model_name, batch_size=1):
+        # Данные техпроцесса для pdf_generator.generate_pdf (строки - кортежи get_*).
+        # Снимок берётся из кэша по (model_id, ревизия); словарь каждый раз новый,
+        # секции - общие кортежи, их не изменяют. 'labor' - трудоёмкость партии
+        # batch_size шт по оборудованию и итог (строки LaborRollup), 'bom' - состав
+        # с уровнями, если в спецификации есть другие модели (BOMGraph.indented).
+        with timed('get_process_snapshot', model=model_name) as span:
+            model_id = self.get_model_id(model_name)
+            if not model_id:
+                return None
+            if self._in_transaction():
+                # незафиксированные данные не кэшируем: при откате ревизия повторится
+                snapshot = self._build_snapshot(model_id, model_name)
+            else:
+                revision = self.get_revision(model_id)
+                snapshot = self.snapshots.get((model_id, revision), lambda: self._build_snapshot(model_id, model_name))
+            span.mark('snapshot')
+            rollup = self.get_labor_rollup(batch_size, [model_id])
+            labor = tuple(rollup.equipment) + (rollup.total,) if rollup and rollup.total[2] else ()
+            span.mark('labor')
+            bom = self._indented_bom(model_id)
+            span.mark('bom')
+            return dict(snapshot, labor=labor, bom=bom, timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    def _indented_bom(self, model_id):
+        # Многоуровневый состав для PDF; у модели без сборочных единиц он совпадает со спецификацией
+        if not self.has_subassemblies(model_id):
+            return ()
+        graph = self.get_bom()
+        if graph is None:
+            return ()
+        try:
+            rows = graph.indented(model_id, BOM_ROW_LIMIT)
+            size = graph.size(model_id)
+        except BOMCycleError as e:
+            print(e, file=sys.stderr)
+            return ()
+        if size > len(rows):
+            rows.append((None, f"... ещё {size - len(rows)} строк, см. capp bom", None, None, None))
+        return tuple(rows)
+
+    def _build_snapshot(self, model_id, model_name):
+        return {
+            'model': model_name,
+            'parts': tuple(self.get_parts(model_id)),
+            'operations': tuple(self.get_operations(model_id)),
+            'workshops': tuple(self.get_model_workshops(model_id)),
+            'equipment': tuple(self.get_model_equipment(model_id)),
+            'document_details': tuple(self.get_document_details(model_id)),
+        }
+
+    def _labor_aggregates(self, model_ids):
+        # Суммы Tподг/Tшт по (модель, оборудование) из labor_totals; перечитываются только
+        # модели, ревизия которых изменилась. Ревизии читаются до данных: запись между
+        # запросами даст лишний пересчёт в следующий раз, но не устаревшие суммы.
+        revisions = dict(self._query("SELECT scope, revision FROM revisions WHERE scope IN (SELECT value FROM json_each(?))",
+                                     (json_ids(model_ids),)))
+        cached = self._labor
+        stale = [id for id in model_ids if cached.get(id, (None,))[0] != revisions.get(id, 0)]
+        fresh = {id: [] for id in stale}
+        if stale:
+            for model_id, *row in self._query("""
+                    SELECT model_id, nullif(equipment_id, 0), operations, prep_time, unit_time FROM labor_totals
+                    WHERE model_id IN (SELECT value FROM json_each(?))
+                    """, (json_ids(stale),)):
+                if model_id in fresh:
+                    fresh[model_id].append(tuple(row))
+            if not self._in_transaction():
+                # незафиксированные данные не кэшируем: при откате ревизия повторится
+                updated = dict(cached)
+                updated.update((id, (revisions.get(id, 0), rows)) for id, rows in fresh.items())
+                self._labor = updated
+        return {id: fresh[id] if id in fresh else cached[id][1] for id in model_ids}
+
+    def get_labor_rollup(self, batch_size=1, model_ids=None):
+        # Трудоёмкость партии batch_size шт по моделям (все или model_ids), цехам и оборудованию.
+        # Наименования читаются только для оборудования и цехов этих моделей: сводка по одной
+        # модели (снимок техпроцесса, смена партии) не зависит от размера справочников.
+        try:
+            if model_ids is None:
+                models = dict(self.get_models())
+                # кэш удалённых моделей не нужен
+                self._labor = {id: value for id, value in self._labor.items() if id in models}
+            else:
+                models = dict(self._query("SELECT id, name FROM models WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id",
+                                          (json_ids(model_ids),)))
+            links = self._workshop_links(list(models))
+            aggregates = self._labor_aggregates(list(models))
+            workshops = self._names('workshop', 'workshop_name', {workshop_id for _, workshop_id in links})
+            equipment = self._names('equipment', 'name', {row[0] for rows in aggregates.values() for row in rows if row[0] is not None})
+            return LaborRollup(aggregates, models, workshops, equipment, links, batch_size)
+        except sqlite3.Error as e:
+            print(f"Ошибка расчёта трудоёмкости: {e}", file=sys.stderr)
+            return None
+
+    def _workshop_links(self, model_ids):
+        # Пары (model_id, workshop_id) для сумм по цехам. Модель без связей относится ко всем
+        # цехам - так её цеха показывает get_model_workshops, и сводки с этим совпадают
+        return self._query("""
+            SELECT model_id, workshop_id FROM model_workshops WHERE model_id IN (SELECT value FROM json_each(?1))
+            UNION ALL
+            SELECT m.value, w.id FROM json_each(?1) m CROSS JOIN workshop w
+            WHERE NOT EXISTS (SELECT 1 FROM model_workshops l WHERE l.model_id = m.value)
+            ORDER BY 1, 2
+        """, (json_ids(model_ids),))
+
+    def _names(self, table, column, ids):
+        # {id: наименование} в порядке справочника для выбранных id
+        return dict(self._query(f"SELECT id, {column} FROM {table} WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id",
+                                (json_ids(ids),)))
+
+    def get_capacity_plan(self, plan):
+        # Загрузка оборудования и цехов по плану выпуска {model_id: количество}
+        try:
+            return CapacityPlan(self._labor_aggregates(list(plan)), self._workshop_links(list(plan)), plan)
+        except sqlite3.Error as e:
+            print(f"Ошибка расчёта загрузки оборудования: {e}", file=sys.stderr)
+            return None
+
+    def refresh_capacity_plan(self, capacity, model_ids=None):
+        # Пересчитать вклад моделей плана (или model_ids - например, новой строки плана),
+        # суммы или цеха которых изменились: неизменённые суммы отдаются из кэша тем же объектом
+        try:
+            ids = list(capacity.plan) if model_ids is None else list(model_ids)
+            workshops = defaultdict(list)
+            for model_id, workshop_id in self._workshop_links(ids):
+                workshops[model_id].append(workshop_id)
+            for model_id, rows in self._labor_aggregates(ids).items():
+                if rows is not capacity.aggregates.get(model_id) or workshops[model_id] != capacity.workshop_ids(model_id):
+                    capacity.update_model(model_id, rows, workshops[model_id])
+            return True
+        except sqlite3.Error as e:
+            print(f"Ошибка пересчёта загрузки оборудования: {e}", file=sys.stderr)
+            return False
+
+    def get_bom(self):
+        # Граф состава изделий по всем моделям: деталь с кодом, равным названию модели, -
+        # вхождение этой модели. Граф и запомненные поддеревья живут, пока не изменится
+        # ни одна модель (ревизии читаются до данных, как в _labor_aggregates).
+        try:
+            key = tuple(self._query("SELECT scope, revision FROM revisions WHERE scope != 0 ORDER BY scope"))
+            key += tuple(self._query("SELECT count(*), max(id) FROM models"))
+            cached_key, graph = self._bom
+            if cached_key != key or self._in_transaction():
+                rows = self._query("""
+                    SELECT p.model_id, m.id, p.id, p.name, p.code, p.quantity
+                    FROM parts p LEFT JOIN models m ON m.name = p.code
+                    WHERE p.model_id IS NOT NULL
+                """)
+                graph = BOMGraph(self.get_models(),
+                                 [(model_id, child, quantity, name) for model_id, child, _, name, _, quantity in rows if child],
+                                 [(model_id, id, name, code, quantity) for model_id, child, id, name, code, quantity in rows if not child])
+                if not self._in_transaction():
+                    self._bom = (key, graph)
+            return graph
+        except sqlite3.Error as e:
+            print(f"Ошибка построения состава изделий: {e}", file=sys.stderr)
+            return None
+
+    def has_subassemblies(self, model_id):
+        return bool(self._query("SELECT 1 FROM parts p JOIN models m ON m.name = p.code WHERE p.model_id = ? LIMIT 1", (model_id,)))
+
+    def import_from_excel(self, file_path, current_model=None, chunk_size=1000, progress_callback=None):
+        # Потоковый импорт: read-only книга, позиции колонок и ID модели определяются один раз,
+        # строки вставляются пачками по chunk_size в одной транзакции.
+        try:
+            model_id = self.get_model_id(current_model) if current_model else None
+            if not model_id:
+                print("Ошибка: модель для импорта не выбрана или не найдена", file=sys.stderr)
+                return 0
+            import openpyxl  # тяжёлый импорт, нужен только для импорта спецификаций
+            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                if 'Лист1' not in wb.sheetnames:
+                    print("Ошибка: Лист 'Лист1' не найден", file=sys.stderr)
+                    return 0
+                ws = wb['Лист1']
+                rows = ws.iter_rows(values_only=True)
+                headers = list(next(rows, ()))
+                required = ['№', 'Номенклатура', 'Количество']
+                if not all(col in headers for col in required):
+                    print("Ошибка: В листе 'Лист1' отсутствуют колонки: №, Номенклатура, Количество", file=sys.stderr)
+                    return 0
+                code_idx, name_idx, qty_idx = [headers.index(col) for col in required]
+                last_idx = max(code_idx, name_idx, qty_idx)
+
+                imported = 0
+                chunk = []
+                started = time.perf_counter()
+                with self.transaction():
+                    for row in rows:
+                        if len(row) <= last_idx:
+                            continue
+                        name, quantity = row[name_idx], row[qty_idx]
+                        if name and quantity is not None:
+                            chunk.append((name, row[code_idx], quantity))
+                        if len(chunk) >= chunk_size:
+                            imported += self.insert_parts_many(model_id, chunk)
+                            chunk = []
+                            if progress_callback:
+                                progress_callback(imported, imported / max(time.perf_counter() - started, 1e-9))
+                    if chunk:
+                        imported += self.insert_parts_many(model_id, chunk)
+                elapsed = max(time.perf_counter() - started, 1e-9)
+                if progress_callback:
+                    progress_callback(imported, imported / elapsed)
+                print(f"Импортировано строк: {imported} ({imported / elapsed:.0f} строк/с)", file=sys.stderr)
+                return imported
+            finally:
+                wb.close()
+        except Exception as e:
+            print(f"Ошибка импорта из Excel: {e}", file=sys.stderr)
+            return 0
+
+    def sweep_orphans(self):
+        # Висячие строки: ссылка на удалённую модель (или другой каскадный родитель) в любой
+        # таблице БД, включая таблицы старого main, ревизии удалённых моделей и записи поиска
+        # без исходной строки. Возвращает {таблица: число удалённых строк}.
+        removed = {}
+        with self.transaction():
+            tables = [name for (name,) in self.cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()]
+            for table in tables:
+                for fk in self.cursor.execute(f'PRAGMA foreign_key_list("{table}")').fetchall():
+                    parent, column, parent_column, on_delete = fk[2], fk[3], fk[4] or "id", fk[6]
+                    if parent != 'models' and on_delete != 'CASCADE':
+                        continue
+                    self.cursor.execute(f"""
+                        DELETE FROM "{table}" WHERE "{column}" IS NOT NULL
+                        AND "{column}" NOT IN (SELECT "{parent_column}" FROM "{parent}")
+                    """)
+                    if self.cursor.rowcount > 0:
+                        removed[table] = removed.get(table, 0) + self.cursor.rowcount
+            self.cursor.execute("DELETE FROM revisions WHERE scope != 0 AND scope NOT IN (SELECT id FROM models)")
+            if self.cursor.rowcount > 0:
+                removed['revisions'] = self.cursor.rowcount
+            count = 0
+            for kind, table in ((0, 'operation_catalog'), (1, 'parts'), (2, 'route_operations'), (3, 'equipment')):
+                self.cursor.execute(f"DELETE FROM search_index WHERE rowid % 4 = {kind} AND rowid / 4 NOT IN (SELECT id FROM {table})")
+                count += self.cursor.rowcount
+            if count:
+                removed['search_index'] = count
+        return removed
+
+    def _pragma(self, name):
+        return self.cursor.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def maintenance(self, vacuum_pages=None, full_vacuum=False):
+        # Обслуживание: удаление висячих строк, возврат свободных страниц и обновление
+        # статистики планировщика. Без full_vacuum всё инкрементально: incremental_vacuum
+        # освобождает не больше vacuum_pages страниц (None - все свободные), ANALYZE
+        # ограничен analysis_limit, индекс поиска сливается порциями.
+        started = time.perf_counter()
+        report = {'removed': self.sweep_orphans()}
+        with self.pool.write():
+            self.conn.commit()
+            pages = self._pragma("page_count")
+            report['free_pages'] = self._pragma("freelist_count")
+            if full_vacuum:
+                # Полный VACUUM заодно переводит старую БД в auto_vacuum = INCREMENTAL
+                self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                self.cursor.execute("VACUUM")
+            elif self._pragma("auto_vacuum") == 2:
+                # executescript выполняет прагму до конца: execute освобождает одну страницу за шаг
+                self.cursor.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages or 0)})")
+            report['incremental'] = self._pragma("auto_vacuum") == 2
+            # Размер сразу после очистки: слияние индекса поиска и ANALYZE ниже могут
+            # занять новые страницы, и разница с концом обслуживания бывает отрицательной
+            report['reclaimed_pages'] = max(0, pages - self._pragma("page_count"))
+            self.cursor.execute("INSERT INTO search_index (search_index, rank) VALUES ('merge', 500)")
+            self.cursor.execute("PRAGMA analysis_limit = 1000")
+            self.cursor.execute("ANALYZE")
+            self.conn.commit()
+            self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            report['free_pages_after'] = self._pragma("freelist_count")
+            report['page_size'] = self._pragma("page_size")
+        report['elapsed'] = time.perf_counter() - started
+        return report
+
+    def release_reader(self):
+        # Вызывать в конце фоновой задачи пула потоков, читавшей из БД
+        self.pool.release_reader()
+
+    def close(self):
+        self.pool.close()
@@ -1,365 +1,45 @@
 import sys
 import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QLabel, QComboBox, QPushButton, QTableWidget, QTableWidgetItem, 
+                             QLabel, QComboBox, QPushButton, 
                              QFileDialog, QMessageBox, QDialog, QFormLayout, QTabWidget, 
-                             QInputDialog, QLineEdit, QDoubleSpinBox, QSpacerItem, QSizePolicy, 
-                             QGroupBox, QScrollArea, QFrame)
-from PyQt5.QtCore import Qt
-import sqlite3
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import mm
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
+                             QInputDialog, QLineEdit, QDoubleSpinBox, QSpinBox, QSpacerItem, QSizePolicy, 
+                             QGroupBox, QScrollArea, QFrame, QProgressBar, QCompleter)
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QStringListModel, QTimer, pyqtSignal
 from datetime import datetime
-import openpyxl
 import traceback
+from capp_db import CAPPDatabase, SEARCH_RANK_WINDOW
+from batch_export import export_models_batch
+from pdf_generator import ExportCancelled, FONT_DIR
+from pdf_cache import PDFCache, render_pdf
+from table_models import make_table_view, current_row, text, hours
+from metrics import timed
 
 
-class CAPPDatabase:
-    def __init__(self, db_name="capp.db"):
-        try:
-            self.conn = sqlite3.connect(db_name)
-            self.cursor = self.conn.cursor()
-            self.create_tables()
-            print("База данных успешно инициализирована.")
-        except sqlite3.Error as e:
-            print(f"Ошибка базы данных: {e}")
-            raise
-
-    def create_tables(self):
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS models (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS parts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                model_id INTEGER,
-                name TEXT NOT NULL,
-                code TEXT,
-                quantity INTEGER,
-                FOREIGN KEY (model_id) REFERENCES models(id)
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS operations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                model_id INTEGER,
-                number TEXT,
-                code TEXT,
-                name TEXT NOT NULL,
-                description TEXT,
-                equipment TEXT,
-                document TEXT,
-                prep_time REAL DEFAULT 0.0,
-                unit_time REAL DEFAULT 0.0,
-                FOREIGN KEY (model_id) REFERENCES models(id)
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS workshop (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                workshop_name TEXT NOT NULL,
-                section TEXT,
-                rm TEXT
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS equipment (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                article TEXT,
-                note TEXT
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS document_details (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                model_id INTEGER,
-                organization TEXT NOT NULL,
-                product_code TEXT,
-                document_code TEXT,
-                developed_by TEXT,
-                checked_by TEXT,
-                FOREIGN KEY (model_id) REFERENCES models(id)
-            )
-        ''')
-        self.conn.commit()
-
-    def insert_model(self, name):
-        try:
-            self.cursor.execute("INSERT OR IGNORE INTO models (name) VALUES (?)", (name,))
-            self.conn.commit()
-            return self.cursor.lastrowid
-        except sqlite3.Error as e:
-            print(f"Ошибка вставки модели: {e}")
-            return None
-
-    def insert_part(self, model_id, name, code, quantity):
-        try:
-            self.cursor.execute("INSERT INTO parts (model_id, name, code, quantity) VALUES (?, ?, ?, ?)",
-                               (model_id, name, code, quantity))
-            self.conn.commit()
-            return self.cursor.lastrowid
-        except sqlite3.Error as e:
-            print(f"Ошибка вставки детали: {e}")
-            return None
-
-    def insert_operation(self, model_id, number, code, name, description, equipment="", prep_time=0.0, unit_time=0.0):
-        try:
-            self.cursor.execute("""
-                INSERT INTO operations (model_id, number, code, name, description, equipment, prep_time, unit_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (model_id, number, code, name, description, equipment, prep_time, unit_time))
-            self.conn.commit()
-            return self.cursor.lastrowid
-        except sqlite3.Error as e:
-            print(f"Ошибка вставки операции: {e}")
-            return None
-
-    def insert_workshop(self, workshop_name, section, rm):
-        try:
-            self.cursor.execute("INSERT INTO workshop (workshop_name, section, rm) VALUES (?, ?, ?)",
-                               (workshop_name, section, rm))
-            self.conn.commit()
-            return self.cursor.lastrowid
-        except sqlite3.Error as e:
-            print(f"Ошибка вставки данных расцеховки: {e}")
-            return None
-
-    def insert_equipment(self, name, article, note):
-        try:
-            self.cursor.execute("INSERT INTO equipment (name, article, note) VALUES (?, ?, ?)",
-                               (name, article, note))
-            self.conn.commit()
-            return self.cursor.lastrowid
-        except sqlite3.Error as e:
-            print(f"Ошибка вставки оборудования: {e}")
-            return None
-
-    def insert_document_details(self, model_id, organization, product_code, document_code, developed_by, checked_by):
-        try:
-            self.cursor.execute("INSERT INTO document_details (model_id, organization, product_code, document_code, developed_by, checked_by) VALUES (?, ?, ?, ?, ?, ?)",
-                               (model_id, organization, product_code, document_code, developed_by, checked_by))
-            self.conn.commit()
-            return self.cursor.lastrowid
-        except sqlite3.Error as e:
-            print(f"Ошибка вставки реквизитов документа: {e}")
-            return None
-
-    def update_model(self, id, name):
-        try:
-            self.cursor.execute("UPDATE models SET name = ? WHERE id = ?", (name, id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка обновления модели: {e}")
-            return False
-
-    def update_part(self, id, name, code, quantity):
-        try:
-            self.cursor.execute("UPDATE parts SET name = ?, code = ?, quantity = ? WHERE id = ?", (name, code, quantity, id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка обновления детали: {e}")
-            return False
-
-    def update_operation(self, id, number, code, name, description, equipment="", prep_time=0.0, unit_time=0.0):
-        try:
-            self.cursor.execute("""
-                UPDATE operations SET number = ?, code = ?, name = ?, description = ?, equipment = ?, prep_time = ?, unit_time = ?
-                WHERE id = ?
-            """, (number, code, name, description, equipment, prep_time, unit_time, id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка обновления операции: {e}")
-            return False
-
-    def update_workshop(self, id, workshop_name, section, rm):
-        try:
-            self.cursor.execute("UPDATE workshop SET workshop_name = ?, section = ?, rm = ? WHERE id = ?", 
-                               (workshop_name, section, rm, id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка обновления данных расцеховки: {e}")
-            return False
-
-    def update_equipment(self, id, name, article, note):
-        try:
-            self.cursor.execute("UPDATE equipment SET name = ?, article = ?, note = ? WHERE id = ?", 
-                               (name, article, note, id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка обновления оборудования: {e}")
-            return False
-
-    def update_document_details(self, id, organization, product_code, document_code, developed_by, checked_by):
-        try:
-            self.cursor.execute("UPDATE document_details SET organization = ?, product_code = ?, document_code = ?, developed_by = ?, checked_by = ? WHERE id = ?",
-                               (organization, product_code, document_code, developed_by, checked_by, id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка обновления реквизитов документа: {e}")
-            return False
-
-    def delete_model(self, id):
-        try:
-            self.cursor.execute("DELETE FROM parts WHERE model_id = ?", (id,))
-            self.cursor.execute("DELETE FROM operations WHERE model_id = ?", (id,))
-            self.cursor.execute("DELETE FROM document_details WHERE model_id = ?", (id,))
-            self.cursor.execute("DELETE FROM models WHERE id = ?", (id,))
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            print(f"Ошибка удаления модели: {e}")
-            return False
-
-    def delete_part(self, id):
-        try:
-            self.cursor.execute("DELETE FROM parts WHERE id = ?", (id,))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка удаления детали: {e}")
-            return False
-
-    def delete_operation(self, id):
-        try:
-            self.cursor.execute("DELETE FROM operations WHERE id = ?", (id,))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка удаления операции: {e}")
-            return False
-
-    def delete_workshop(self, id):
-        try:
-            self.cursor.execute("DELETE FROM workshop WHERE id = ?", (id,))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка удаления данных расцеховки: {e}")
-            return False
-
-    def delete_equipment(self, id):
-        try:
-            self.cursor.execute("DELETE FROM equipment WHERE id = ?", (id,))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка удаления оборудования: {e}")
-            return False
-
-    def delete_document_details(self, id):
-        try:
-            self.cursor.execute("DELETE FROM document_details WHERE id = ?", (id,))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Ошибка удаления реквизитов документа: {e}")
-            return False
-
-    def get_models(self):
-        try:
-            self.cursor.execute("SELECT id, name FROM models")
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"Ошибка получения моделей: {e}")
-            return []
-
-    def get_model_id(self, name):
-        try:
-            self.cursor.execute("SELECT id FROM models WHERE name = ?", (name,))
-            result = self.cursor.fetchone()
-            return result[0] if result else None
-        except sqlite3.Error as e:
-            print(f"Ошибка получения ID модели: {e}")
-            return None
-
-    def get_parts(self, model_id):
-        try:
-            self.cursor.execute("SELECT id, name, code, quantity FROM parts WHERE model_id = ?", (model_id,))
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"Ошибка получения деталей: {e}")
-            return []
-
-    def get_operations(self, model_id=None):
-        try:
-            if model_id is None:
-                self.cursor.execute("SELECT id, number, code, name, description, equipment, document, prep_time, unit_time FROM operations WHERE model_id IS NULL")
-                return self.cursor.fetchall()
-            else:
-                self.cursor.execute("SELECT id, number, code, name, description, equipment, document, prep_time, unit_time FROM operations WHERE model_id = ?", (model_id,))
-                return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"Ошибка получения операций: {e}")
-            return []
+class PrefixCompleter(QCompleter):
+    # Варианты для автодополнения берутся из PrefixIndex на каждый введённый префикс
+    def __init__(self, prefix_index, parent=None):
+        super().__init__(parent)
+        self.prefix_index = prefix_index
+        self.setModel(QStringListModel(self))
+        self.setCaseSensitivity(Qt.CaseInsensitive)
 
-    def get_workshop(self):
-        try:
-            self.cursor.execute("SELECT id, workshop_name, section, rm FROM workshop")
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"Ошибка получения данных расцеховки: {e}")
-            return []
+    def splitPath(self, path):
+        self.model().setStringList(self.prefix_index.complete(path))
+        return [path]
 
-    def get_equipment(self):
-        try:
-            self.cursor.execute("SELECT id, name, article, note FROM equipment")
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"Ошибка получения оборудования: {e}")
-            return []
 
-    def get_document_details(self, model_id):
-        try:
-            self.cursor.execute("SELECT id, organization, product_code, document_code, developed_by, checked_by FROM document_details WHERE model_id = ?", (model_id,))
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"Ошибка получения реквизитов документа: {e}")
-            return []
+# Списки кодов и наименований для выпадающих списков общие для всех диалогов
+# и пересобираются только вместе с индексом справочника.
+_catalog_models = {}
 
-    def import_from_excel(self, file_path, current_model=None):
-        try:
-            wb = openpyxl.load_workbook(file_path)
-            imported = False
-            if 'Лист1' in wb.sheetnames:
-                ws = wb['Лист1']
-                headers = [cell.value for cell in ws[1] if cell.value]
-                required = ['№', 'Номенклатура', 'Количество']
-                if all(col in headers for col in required):
-                    for row in ws.iter_rows(min_row=2, values_only=True):
-                        code, name, quantity = [row[headers.index(col)] for col in required]
-                        if name and quantity is not None:
-                            if current_model:
-                                model_id = self.get_model_id(current_model)
-                                if model_id:
-                                    self.insert_part(model_id, name, code, quantity)
-                                    imported = true
-                else:
-                    print("Ошибка: В листе 'Лист1' отсутствуют колонки: №, Номенклатура, Количество")
-            else:
-                print("Ошибка: Лист 'Лист1' не найден")
-            return imported
-        except Exception as e:
-            print(f"Ошибка импорта из Excel: {e}")
-            return False
 
-    def close(self):
-        self.conn.close()
+def catalog_models(index):
+    if _catalog_models.get('index') is not index:
+        _catalog_models['index'] = index
+        _catalog_models['codes'] = QStringListModel(index.codes.values)
+        _catalog_models['names'] = QStringListModel(index.names.values)
+    return _catalog_models['codes'], _catalog_models['names']
 
 
 class OperationDialog(QDialog):
@@ -427,31 +107,26 @@ class OperationDialog(QDialog):
             self.name_combo.currentTextChanged.connect(self.sync_code)
 
     def populate_combos(self):
-        operations = self.db.get_operations()
-        self.code_combo.clear()
-        self.name_combo.clear()
-        self.operation_map = {}
-        for op in operations:
-            code = op[2] or ""
-            name = op[3] or ""
-            self.operation_map[code] = name
-            self.operation_map[name] = code
-            if code and self.code_combo.findText(code) == -1:
-                self.code_combo.addItem(code)
-            if name and self.name_combo.findText(name) == -1:
-                self.name_combo.addItem(name)
+        self.index = self.db.operation_index()
+        codes, names = catalog_models(self.index)
+        # setModel заменяет модель completer'а, поэтому свой completer ставим после.
+        # Модели общие для всех диалогов: Enter не должен дописывать в них введённый текст
+        for combo in (self.code_combo, self.name_combo):
+            combo.setInsertPolicy(QComboBox.NoInsert)
+        self.code_combo.setModel(codes)
+        self.code_combo.setCompleter(PrefixCompleter(self.index.codes, self.code_combo))
+        self.name_combo.setModel(names)
+        self.name_combo.setCompleter(PrefixCompleter(self.index.names, self.name_combo))
 
     def sync_name(self, code):
-        if code in self.operation_map:
-            name = self.operation_map[code]
-            if name and self.name_combo.currentText() != name:
-                self.name_combo.setCurrentText(name)
+        name = self.index.code_to_name.get(code)
+        if name and self.name_combo.currentText() != name:
+            self.name_combo.setCurrentText(name)
 
     def sync_code(self, name):
-        if name in self.operation_map:
-            code = self.operation_map[name]
-            if code and self.code_combo.currentText() != code:
-                self.code_combo.setCurrentText(code)
+        code = self.index.name_to_code.get(name)
+        if code and self.code_combo.currentText() != code:
+            self.code_combo.setCurrentText(code)
 
     def get_values(self):
         if self.is_edit_db:
@@ -575,6 +250,17 @@ class DocumentDetailsDialog(QDialog):
                 self.checked_by_input.text())
 
 
+# Сколько моделей перечислять в предупреждении о применяемости записи справочника
+WHERE_USED_PREVIEW = 10
+
+
+def used_in_text(used):
+    names = ", ".join(name for _, name, _ in used[:WHERE_USED_PREVIEW])
+    if len(used) > WHERE_USED_PREVIEW:
+        names += f" и ещё {len(used) - WHERE_USED_PREVIEW}"
+    return f"Используется в моделях ({len(used)}): {names}."
+
+
 class EditDBDialog(QDialog):
     def __init__(self, db, parent=None):
         super().__init__(parent)
@@ -598,6 +284,21 @@ class EditDBDialog(QDialog):
         self.tab_widget.addTab(self.equipment_tab, "Оборудование")
         self.setup_equipment_tab()
 
+        # Применяемость выбранной записи: модели, которые на неё ссылаются
+        where_used_group = QGroupBox("Где используется")
+        where_used_layout = QVBoxLayout()
+        self.where_used_table = make_table_view(['Модель', 'Вхождений'], [(1, text), (2, text)])
+        self.where_used_table.setMaximumHeight(150)
+        where_used_layout.addWidget(self.where_used_table)
+        where_used_group.setLayout(where_used_layout)
+        layout.addWidget(where_used_group)
+
+        self.catalog_views = [(self.operations_table, 'operation_catalog'), (self.workshop_table, 'workshop'),
+                              (self.equipment_table, 'equipment')]
+        for view, _ in self.catalog_views:
+            view.selectionModel().currentRowChanged.connect(self.update_where_used)
+        self.tab_widget.currentChanged.connect(self.update_where_used)
+
         buttons = QHBoxLayout()
         close_button = QPushButton("Закрыть")
         close_button.setStyleSheet("font-size: 14px; padding: 8px; background-color: #FF9800; color: white; border-radius: 5px;")
@@ -608,11 +309,7 @@ class EditDBDialog(QDialog):
 
     def setup_operations_tab(self):
         layout = QVBoxLayout()
-        self.operations_table = QTableWidget()
-        self.operations_table.setColumnCount(2)
-        self.operations_table.setHorizontalHeaderLabels(['Код', 'Наименование'])
-        self.operations_table.horizontalHeader().setStretchLastSection(True)
-        self.operations_table.setStyleSheet("font-size: 14px; color: #333;")
+        self.operations_table = make_table_view(['Код', 'Наименование'], [(1, text), (2, text)])
         layout.addWidget(self.operations_table)
         buttons = QHBoxLayout()
         add_button = QPushButton("Добавить")
@@ -633,11 +330,7 @@ class EditDBDialog(QDialog):
 
     def setup_workshop_tab(self):
         layout = QVBoxLayout()
-        self.workshop_table = QTableWidget()
-        self.workshop_table.setColumnCount(3)
-        self.workshop_table.setHorizontalHeaderLabels(['Цех', 'Участок', 'РМ'])
-        self.workshop_table.horizontalHeader().setStretchLastSection(True)
-        self.workshop_table.setStyleSheet("font-size: 14px; color: #333;")
+        self.workshop_table = make_table_view(['Цех', 'Участок', 'РМ'], [(1, text), (2, text), (3, text)])
         layout.addWidget(self.workshop_table)
         buttons = QHBoxLayout()
         add_button = QPushButton("Добавить")
@@ -658,11 +351,7 @@ class EditDBDialog(QDialog):
 
     def setup_equipment_tab(self):
         layout = QVBoxLayout()
-        self.equipment_table = QTableWidget()
-        self.equipment_table.setColumnCount(3)
-        self.equipment_table.setHorizontalHeaderLabels(['Наименование', 'Артикул', 'Примечание'])
-        self.equipment_table.horizontalHeader().setStretchLastSection(True)
-        self.equipment_table.setStyleSheet("font-size: 14px; color: #333;")
+        self.equipment_table = make_table_view(['Наименование', 'Артикул', 'Примечание'], [(1, text), (2, text), (3, text)])
         layout.addWidget(self.equipment_table)
         buttons = QHBoxLayout()
         add_button = QPushButton("Добавить")
@@ -681,74 +370,86 @@ class EditDBDialog(QDialog):
         self.equipment_tab.setLayout(layout)
         self.update_equipment_table()
 
+    # Таблицы загружаются один раз, дальше модели сами правят изменённые строки
+    # по уведомлениям CAPPDatabase
     def update_operations_table(self):
-        operations = self.db.get_operations()
-        self.operations_table.setRowCount(len(operations))
-        for row, (id, _, code, name, _, _, _, _, _) in enumerate(operations):
-            self.operations_table.setItem(row, 0, QTableWidgetItem(code or ""))
-            self.operations_table.setItem(row, 1, QTableWidgetItem(name))
-            self.operations_table.item(row, 0).setData(Qt.UserRole, id)
+        self.operations_table.model().watch(self.db, 'operation_catalog', None, lambda after=None: self.db.get_operation_catalog(lazy=True, after=after))
 
     def update_workshop_table(self):
-        workshops = self.db.get_workshop()
-        self.workshop_table.setRowCount(len(workshops))
-        for row, (id, workshop_name, section, rm) in enumerate(workshops):
-            self.workshop_table.setItem(row, 0, QTableWidgetItem(workshop_name))
-            self.workshop_table.setItem(row, 1, QTableWidgetItem(section or ""))
-            self.workshop_table.setItem(row, 2, QTableWidgetItem(rm or ""))
-            self.workshop_table.item(row, 0).setData(Qt.UserRole, id)
+        self.workshop_table.model().watch(self.db, 'workshop', None, lambda after=None: self.db.get_workshop(lazy=True, after=after))
 
     def update_equipment_table(self):
-        equipment = self.db.get_equipment()
-        self.equipment_table.setRowCount(len(equipment))
-        for row, (id, name, article, note) in enumerate(equipment):
-            self.equipment_table.setItem(row, 0, QTableWidgetItem(name))
-            self.equipment_table.setItem(row, 1, QTableWidgetItem(article or ""))
-            self.equipment_table.setItem(row, 2, QTableWidgetItem(note or ""))
-            self.equipment_table.item(row, 0).setData(Qt.UserRole, id)
+        self.equipment_table.model().watch(self.db, 'equipment', None, lambda after=None: self.db.get_equipment(lazy=True, after=after))
+
+    def done(self, result):
+        for view in (self.operations_table, self.workshop_table, self.equipment_table):
+            view.model().unwatch()
+        super().done(result)
+
+    def update_where_used(self, *args):
+        view, table = self.catalog_views[self.tab_widget.currentIndex()]
+        row = current_row(view)
+        self.where_used_table.model().set_source(self.db.where_used(table, row[0]) if row else ())
+
+    def confirm_in_use(self, table, id, consequence):
+        # Предупреждение перед правкой записи, на которую ссылаются модели
+        used = self.db.where_used(table, id)
+        if not used:
+            return True
+        reply = QMessageBox.question(self, "Запись используется", f"{used_in_text(used)}\n{consequence} Продолжить?",
+                                     QMessageBox.Yes | QMessageBox.No)
+        return reply == QMessageBox.Yes
+
+    def refuse_in_use(self, table, id, name):
+        # Записи, на которые ссылаются маршруты, не удаляются - показываем, где они нужны
+        used = self.db.where_used(table, id)
+        if used:
+            QMessageBox.warning(self, "Ошибка", f"'{name}' нельзя удалить. {used_in_text(used)}")
+        return bool(used)
 
     def add_operation(self):
         dialog = OperationDialog(self, is_edit_db=True, db=self.db)
         if dialog.exec_() == QDialog.Accepted:
             code, name = dialog.get_values()
             if name:
-                # Добавление в справочник операций
-                self.db.cursor.execute("INSERT OR IGNORE INTO operations (model_id, code, name) VALUES (NULL, ?, ?)", (code, name))
-                self.db.conn.commit()
-                self.update_operations_table()
+                self.db.insert_catalog_operation(code, name)
                 QMessageBox.information(self, "Успех", f"Операция '{name}' добавлена в справочник!")
             else:
                 QMessageBox.warning(self, "Предупреждение", "Заполните поле 'Наименование'!")
 
     def edit_operation(self):
-        row = self.operations_table.currentRow()
-        if row >= 0:
-            old_code = self.operations_table.item(row, 0).text()
-            old_name = self.operations_table.item(row, 1).text()
+        row = current_row(self.operations_table)
+        if row:
+            op_id, old_code, old_name = row
             dialog = OperationDialog(self, is_edit_db=True, db=self.db)
-            dialog.code_combo.setCurrentText(old_code)
+            dialog.code_combo.setCurrentText(old_code or "")
             dialog.name_combo.setCurrentText(old_name)
             if dialog.exec_() == QDialog.Accepted:
                 code, name = dialog.get_values()
                 if name:
-                    op_id = self.operations_table.item(row, 0).data(Qt.UserRole)
-                    self.db.cursor.execute("UPDATE operations SET code = ?, name = ? WHERE id = ?", (code, name, op_id))
-                    self.db.conn.commit()
-                    self.update_operations_table()
-                    QMessageBox.information(self, "Успех", "Операция обновлена!")
+                    if (code, name) != (old_code or "", old_name) and not self.confirm_in_use(
+                            'operation_catalog', op_id, "Изменение отразится во всех их техпроцессах."):
+                        return
+                    if self.db.update_catalog_operation(op_id, code, name):
+                        QMessageBox.information(self, "Успех", "Операция обновлена!")
+                    else:
+                        QMessageBox.critical(self, "Ошибка", "Операция не обновлена: такие код и наименование "
+                                                             "уже есть в справочнике или операция удалена.")
                 else:
                     QMessageBox.warning(self, "Предупреждение", "Заполните поле 'Наименование'!")
 
     def delete_operation(self):
-        row = self.operations_table.currentRow()
-        if row >= 0:
-            name = self.operations_table.item(row, 1).text()
+        row = current_row(self.operations_table)
+        if row:
+            op_id, name = row[0], row[2]
+            if self.refuse_in_use('operation_catalog', op_id, name):
+                return
             reply = QMessageBox.question(self, "Подтверждение", f"Удалить операцию '{name}' из справочника?", QMessageBox.Yes | QMessageBox.No)
             if reply == QMessageBox.Yes:
-                op_id = self.operations_table.item(row, 0).data(Qt.UserRole)
-                self.db.delete_operation(op_id)
-                self.update_operations_table()
-                QMessageBox.information(self, "Успех", "Операция удалена!")
+                if self.db.delete_catalog_operation(op_id):
+                    QMessageBox.information(self, "Успех", "Операция удалена!")
+                else:
+                    QMessageBox.warning(self, "Ошибка", f"Операция '{name}' используется в техпроцессах и не может быть удалена.")
 
     def add_workshop(self):
         dialog = WorkshopDialog(self)
@@ -756,38 +457,38 @@ class EditDBDialog(QDialog):
             workshop_name, section, rm = dialog.get_values()
             if workshop_name:
                 self.db.insert_workshop(workshop_name, section, rm)
-                self.update_workshop_table()
                 QMessageBox.information(self, "Успех", f"Цех '{workshop_name}' добавлен!")
             else:
                 QMessageBox.warning(self, "Предупреждение", "Заполните поле 'Цех'!")
 
     def edit_workshop(self):
-        row = self.workshop_table.currentRow()
-        if row >= 0:
-            old_name = self.workshop_table.item(row, 0).text()
+        row = current_row(self.workshop_table)
+        if row:
+            ws_id, old_name, old_section, old_rm = row
             dialog = WorkshopDialog(self)
             dialog.workshop_input.setText(old_name)
-            dialog.section_input.setText(self.workshop_table.item(row, 1).text())
-            dialog.rm_input.setText(self.workshop_table.item(row, 2).text())
+            dialog.section_input.setText(old_section or "")
+            dialog.rm_input.setText(old_rm or "")
             if dialog.exec_() == QDialog.Accepted:
                 workshop_name, section, rm = dialog.get_values()
                 if workshop_name:
-                    ws_id = self.workshop_table.item(row, 0).data(Qt.UserRole)
+                    if (workshop_name, section, rm) != (old_name, old_section or "", old_rm or "") and not self.confirm_in_use(
+                            'workshop', ws_id, "Изменение отразится во всех их техпроцессах."):
+                        return
                     self.db.update_workshop(ws_id, workshop_name, section, rm)
-                    self.update_workshop_table()
                     QMessageBox.information(self, "Успех", "Данные обновлены!")
                 else:
                     QMessageBox.warning(self, "Предупреждение", "Заполните поле 'Цех'!")
 
     def delete_workshop(self):
-        row = self.workshop_table.currentRow()
-        if row >= 0:
-            name = self.workshop_table.item(row, 0).text()
+        row = current_row(self.workshop_table)
+        if row:
+            ws_id, name = row[0], row[1]
+            if not self.confirm_in_use('workshop', ws_id, "Связи этих моделей с цехом будут удалены."):
+                return
             reply = QMessageBox.question(self, "Подтверждение", f"Удалить '{name}'?", QMessageBox.Yes | QMessageBox.No)
             if reply == QMessageBox.Yes:
-                ws_id = self.workshop_table.item(row, 0).data(Qt.UserRole)
                 self.db.delete_workshop(ws_id)
-                self.update_workshop_table()
                 QMessageBox.information(self, "Успех", "Удалено!")
 
     def add_equipment(self):
@@ -796,39 +497,76 @@ class EditDBDialog(QDialog):
             name, article, note = dialog.get_values()
             if name:
                 self.db.insert_equipment(name, article, note)
-                self.update_equipment_table()
                 QMessageBox.information(self, "Успех", f"Оборудование '{name}' добавлено!")
             else:
                 QMessageBox.warning(self, "Предупреждение", "Заполните поле 'Наименование'!")
 
     def edit_equipment(self):
-        row = self.equipment_table.currentRow()
-        if row >= 0:
-            old_name = self.equipment_table.item(row, 0).text()
+        row = current_row(self.equipment_table)
+        if row:
+            eq_id, old_name, old_article, old_note = row
             dialog = EquipmentDialog(self)
             dialog.name_input.setText(old_name)
-            dialog.article_input.setText(self.equipment_table.item(row, 1).text())
-            dialog.note_input.setText(self.equipment_table.item(row, 2).text())
+            dialog.article_input.setText(old_article or "")
+            dialog.note_input.setText(old_note or "")
             if dialog.exec_() == QDialog.Accepted:
                 name, article, note = dialog.get_values()
                 if name:
-                    eq_id = self.equipment_table.item(row, 0).data(Qt.UserRole)
+                    if (name, article, note) != (old_name, old_article or "", old_note or "") and not self.confirm_in_use(
+                            'equipment', eq_id, "Изменение отразится во всех их техпроцессах."):
+                        return
                     self.db.update_equipment(eq_id, name, article, note)
-                    self.update_equipment_table()
                     QMessageBox.information(self, "Успех", "Оборудование обновлено!")
                 else:
                     QMessageBox.warning(self, "Предупреждение", "Заполните поле 'Наименование'!")
 
     def delete_equipment(self):
-        row = self.equipment_table.currentRow()
-        if row >= 0:
-            name = self.equipment_table.item(row, 0).text()
+        row = current_row(self.equipment_table)
+        if row:
+            eq_id, name = row[0], row[1]
+            if self.refuse_in_use('equipment', eq_id, name):
+                return
             reply = QMessageBox.question(self, "Подтверждение", f"Удалить '{name}'?", QMessageBox.Yes | QMessageBox.No)
             if reply == QMessageBox.Yes:
-                eq_id = self.equipment_table.item(row, 0).data(Qt.UserRole)
-                self.db.delete_equipment(eq_id)
-                self.update_equipment_table()
-                QMessageBox.information(self, "Успех", "Удалено!")
+                if self.db.delete_equipment(eq_id):
+                    QMessageBox.information(self, "Успех", "Удалено!")
+                else:
+                    QMessageBox.warning(self, "Ошибка", f"Оборудование '{name}' используется в техпроцессах и не может быть удалено.")
+
+
+class ModelDataSignals(QObject):
+    loaded = pyqtSignal(int, object)
+
+
+class ModelDataWorker(QRunnable):
+    # Строки модели для EditTPDialog: поток пула читает через своё соединение
+    # (CAPPDatabase._cursor) и закрывает его в конце задачи; устаревший запрос
+    # бросается между запросами к БД
+    def __init__(self, db, model_name, request_id, is_current):
+        super().__init__()
+        self.db = db
+        self.model_name = model_name
+        self.request_id = request_id
+        self.is_current = is_current
+        self.signals = ModelDataSignals()
+
+    def run(self):
+        try:
+            with timed('load_model_data', model=self.model_name):
+                data = {'model_id': self.db.get_model_id(self.model_name)}
+                if data['model_id']:
+                    for table, load in (('parts', self.db.get_parts), ('operations', self.db.get_operations),
+                                        ('document_details', self.db.get_document_details)):
+                        if not self.is_current(self.request_id):
+                            return
+                        data[table] = load(data['model_id'])
+        except Exception:
+            print(traceback.format_exc())
+            return
+        finally:
+            self.db.release_reader()
+        if self.is_current(self.request_id):
+            self.signals.loaded.emit(self.request_id, data)
 
 
 class EditTPDialog(QDialog):
@@ -850,6 +588,10 @@ class EditTPDialog(QDialog):
         add_model_btn.clicked.connect(self.add_model)
         top_layout.addWidget(add_model_btn)
 
+        clone_model_btn = QPushButton("Копировать")
+        clone_model_btn.clicked.connect(self.clone_model)
+        top_layout.addWidget(clone_model_btn)
+
         layout.addLayout(top_layout)
 
         self.tab_widget = QTabWidget()
@@ -867,7 +609,15 @@ class EditTPDialog(QDialog):
         self.tab_widget.addTab(self.document_details_tab, "Реквизиты")
         self.setup_document_details_tab()
 
-        self.model_combo.currentTextChanged.connect(self.load_model_data)
+        # Модель загружается в фоне после паузы в переборе списка; ответ на
+        # устаревший запрос (пользователь уже выбрал другую модель) отбрасывается
+        self.thread_pool = QThreadPool.globalInstance()
+        self.load_request = 0
+        self.load_timer = QTimer(self)
+        self.load_timer.setSingleShot(True)
+        self.load_timer.setInterval(150)
+        self.load_timer.timeout.connect(self.load_model_data)
+        self.model_combo.currentTextChanged.connect(self.schedule_model_load)
 
         buttons = QHBoxLayout()
         close_button = QPushButton("Закрыть")
@@ -878,14 +628,11 @@ class EditTPDialog(QDialog):
         self.setLayout(layout)
 
         if self.model_combo.count() > 0:
-            self.load_model_data(self.model_combo.currentText())
+            self.load_model_data()
 
     def setup_parts_tab(self):
         layout = QVBoxLayout()
-        self.parts_table = QTableWidget()
-        self.parts_table.setColumnCount(4)
-        self.parts_table.setHorizontalHeaderLabels(['ID', 'Номер', 'Номенклатура', 'Кол-во'])
-        self.parts_table.hideColumn(0)
+        self.parts_table = make_table_view(['Номер', 'Номенклатура', 'Кол-во'], [(2, text), (1, text), (3, text)], style="")
         layout.addWidget(self.parts_table)
 
         buttons = QHBoxLayout()
@@ -903,10 +650,9 @@ class EditTPDialog(QDialog):
 
     def setup_operations_tab(self):
         layout = QVBoxLayout()
-        self.operations_table = QTableWidget()
-        self.operations_table.setColumnCount(8)
-        self.operations_table.setHorizontalHeaderLabels(['ID', '№', 'Код', 'Наименование', 'Описание', 'Оборудование', 'Tподг, ч', 'Tшт, мин'])
-        self.operations_table.hideColumn(0)
+        self.operations_table = make_table_view(
+            ['№', 'Код', 'Наименование', 'Описание', 'Оборудование', 'Tподг, ч', 'Tшт, мин'],
+            [(1, text), (2, text), (3, text), (4, text), (5, text), (7, hours), (8, hours)], style="")
         layout.addWidget(self.operations_table)
 
         buttons = QHBoxLayout()
@@ -924,10 +670,9 @@ class EditTPDialog(QDialog):
 
     def setup_document_details_tab(self):
         layout = QVBoxLayout()
-        self.document_details_table = QTableWidget()
-        self.document_details_table.setColumnCount(6)
-        self.document_details_table.setHorizontalHeaderLabels(['ID', 'Организация', 'Изделие', 'Документ', 'Разработал', 'Проверил'])
-        self.document_details_table.hideColumn(0)
+        self.document_details_table = make_table_view(
+            ['Организация', 'Изделие', 'Документ', 'Разработал', 'Проверил'],
+            [(1, text), (2, text), (3, text), (4, text), (5, text)], style="")
         layout.addWidget(self.document_details_table)
 
         buttons = QHBoxLayout()
@@ -943,46 +688,35 @@ class EditTPDialog(QDialog):
         layout.addLayout(buttons)
         self.document_details_tab.setLayout(layout)
 
-    def load_model_data(self, model_name):
-        model_id = self.db.get_model_id(model_name)
-        if not model_id:
-            return
+    def schedule_model_load(self):
+        self.load_request += 1
+        self.load_timer.start()
 
-        # Спецификация
-        parts = self.db.get_parts(model_id)
-        self.parts_table.setRowCount(len(parts))
-        for row, (id, name, code, qty) in enumerate(parts):
-            self.parts_table.setItem(row, 0, QTableWidgetItem(str(id)))
-            self.parts_table.setItem(row, 1, QTableWidgetItem(code or ""))
-            self.parts_table.setItem(row, 2, QTableWidgetItem(name))
-            self.parts_table.setItem(row, 3, QTableWidgetItem(str(qty)))
-            self.parts_table.item(row, 0).setData(Qt.UserRole, id)
+    def is_current_load(self, request_id):
+        return request_id == self.load_request
 
-        # Операции
-        operations = self.db.get_operations(model_id)
-        self.operations_table.setRowCount(len(operations))
-        for row, (id, number, code, name, desc, equip, _, prep, unit) in enumerate(operations):
-            self.operations_table.setItem(row, 0, QTableWidgetItem(str(id)))
-            self.operations_table.setItem(row, 1, QTableWidgetItem(number or ""))
-            self.operations_table.setItem(row, 2, QTableWidgetItem(code or ""))
-            self.operations_table.setItem(row, 3, QTableWidgetItem(name))
-            self.operations_table.setItem(row, 4, QTableWidgetItem(desc or ""))
-            self.operations_table.setItem(row, 5, QTableWidgetItem(equip or ""))
-            self.operations_table.setItem(row, 6, QTableWidgetItem(f"{prep:.2f}"))
-            self.operations_table.setItem(row, 7, QTableWidgetItem(f"{unit:.2f}"))
-            self.operations_table.item(row, 0).setData(Qt.UserRole, id)
-
-        # Реквизиты
-        details = self.db.get_document_details(model_id)
-        self.document_details_table.setRowCount(len(details))
-        for row, (id, org, prod, doc, dev, check) in enumerate(details):
-            self.document_details_table.setItem(row, 0, QTableWidgetItem(str(id)))
-            self.document_details_table.setItem(row, 1, QTableWidgetItem(org))
-            self.document_details_table.setItem(row, 2, QTableWidgetItem(prod or ""))
-            self.document_details_table.setItem(row, 3, QTableWidgetItem(doc or ""))
-            self.document_details_table.setItem(row, 4, QTableWidgetItem(dev or ""))
-            self.document_details_table.setItem(row, 5, QTableWidgetItem(check or ""))
-            self.document_details_table.item(row, 0).setData(Qt.UserRole, id)
+    def load_model_data(self):
+        self.load_request += 1
+        worker = ModelDataWorker(self.db, self.model_combo.currentText(), self.load_request, self.is_current_load)
+        worker.signals.loaded.connect(self.on_model_data_loaded)
+        self.thread_pool.start(worker)
+
+    def on_model_data_loaded(self, request_id, data):
+        model_id = data['model_id']
+        if not self.is_current_load(request_id) or not model_id:
+            return
+        # Строки уже прочитаны в фоне; правки приходят уведомлениями БД,
+        # после пакетных изменений источник перечитывается курсором
+        self.parts_table.model().watch(self.db, 'parts', model_id, lambda after=None: self.db.get_parts(model_id, lazy=True, after=after), data['parts'])
+        self.operations_table.model().watch(self.db, 'operations', model_id, lambda after=None: self.db.get_operations(model_id, lazy=True, after=after), data['operations'])
+        self.document_details_table.model().watch(self.db, 'document_details', model_id, lambda after=None: self.db.get_document_details(model_id, lazy=True, after=after), data['document_details'])
+
+    def done(self, result):
+        self.load_timer.stop()
+        self.load_request += 1
+        for view in (self.parts_table, self.operations_table, self.document_details_table):
+            view.model().unwatch()
+        super().done(result)
 
     def add_model(self):
         name, ok = QInputDialog.getText(self, "Добавить модель", "Название модели:")
@@ -994,6 +728,21 @@ class EditTPDialog(QDialog):
             else:
                 QMessageBox.critical(self, "Ошибка", "Модель уже существует!")
 
+    def clone_model(self):
+        # Новый вариант изделия на основе выбранной модели
+        src_name = self.model_combo.currentText()
+        src_id = self.db.get_model_id(src_name)
+        if not src_id:
+            return
+        name, ok = QInputDialog.getText(self, "Копировать модель", "Название новой модели:", text=f"{src_name} (копия)")
+        if ok and name:
+            if self.db.clone_model(src_id, name):
+                self.model_combo.addItem(name)
+                self.model_combo.setCurrentText(name)
+                QMessageBox.information(self, "Успех", f"Модель '{name}' создана на основе '{src_name}'!")
+            else:
+                QMessageBox.critical(self, "Ошибка", "Модель с таким названием уже существует!")
+
     def add_part(self):
         model_name = self.model_combo.currentText()
         model_id = self.db.get_model_id(model_name)
@@ -1006,15 +755,13 @@ class EditTPDialog(QDialog):
                 quantity, ok = QInputDialog.getInt(self, "Добавить деталь", "Количество:", min=1)
                 if ok:
                     self.db.insert_part(model_id, name, code, quantity)
-                    self.load_model_data(model_name)
 
     def edit_part(self):
-        row = self.parts_table.currentRow()
-        if row >= 0:
-            part_id = self.parts_table.item(row, 0).data(Qt.UserRole)
-            name = self.parts_table.item(row, 2).text()
-            code = self.parts_table.item(row, 1).text()
-            qty = int(self.parts_table.item(row, 3).text())
+        row = current_row(self.parts_table)
+        if row:
+            part_id, name, code, qty = row
+            code = code or ""
+            qty = int(qty or 1)
             new_name, ok = QInputDialog.getText(self, "Редактировать", "Название:", text=name)
             if ok:
                 new_code, ok = QInputDialog.getText(self, "Редактировать", "Код:", text=code)
@@ -1022,14 +769,11 @@ class EditTPDialog(QDialog):
                     new_qty, ok = QInputDialog.getInt(self, "Редактировать", "Количество:", value=qty, min=1)
                     if ok:
                         self.db.update_part(part_id, new_name, new_code, new_qty)
-                        self.load_model_data(self.model_combo.currentText())
 
     def delete_part(self):
-        row = self.parts_table.currentRow()
-        if row >= 0:
-            part_id = self.parts_table.item(row, 0).data(Qt.UserRole)
-            self.db.delete_part(part_id)
-            self.load_model_data(self.model_combo.currentText())
+        row = current_row(self.parts_table)
+        if row:
+            self.db.delete_part(row[0])
 
     def add_operation(self):
         model_name = self.model_combo.currentText()
@@ -1041,32 +785,28 @@ class EditTPDialog(QDialog):
             number, code, name, desc, equip, prep, unit = dialog.get_values()
             if name:
                 self.db.insert_operation(model_id, number, code, name, desc, equip, prep, unit)
-                self.load_model_data(model_name)
 
     def edit_operation(self):
-        row = self.operations_table.currentRow()
-        if row >= 0:
-            op_id = self.operations_table.item(row, 0).data(Qt.UserRole)
+        row = current_row(self.operations_table)
+        if row:
+            op_id, number, code, name, desc, equip, _, prep, unit = row
             dialog = OperationDialog(self, is_edit_db=False, db=self.db)
-            dialog.number_input.setText(self.operations_table.item(row, 1).text())
-            dialog.code_combo.setCurrentText(self.operations_table.item(row, 2).text())
-            dialog.name_combo.setCurrentText(self.operations_table.item(row, 3).text())
-            dialog.description_input.setText(self.operations_table.item(row, 4).text())
-            dialog.equipment_combo.setCurrentText(self.operations_table.item(row, 5).text())
-            dialog.prep_time_input.setValue(float(self.operations_table.item(row, 6).text() or 0))
-            dialog.unit_time_input.setValue(float(self.operations_table.item(row, 7).text() or 0))
+            dialog.number_input.setText(number or "")
+            dialog.code_combo.setCurrentText(code or "")
+            dialog.name_combo.setCurrentText(name)
+            dialog.description_input.setText(desc or "")
+            dialog.equipment_combo.setCurrentText(equip or "")
+            dialog.prep_time_input.setValue(float(prep or 0))
+            dialog.unit_time_input.setValue(float(unit or 0))
             if dialog.exec_() == QDialog.Accepted:
                 number, code, name, desc, equip, prep, unit = dialog.get_values()
                 if name:
                     self.db.update_operation(op_id, number, code, name, desc, equip, prep, unit)
-                    self.load_model_data(self.model_combo.currentText())
 
     def delete_operation(self):
-        row = self.operations_table.currentRow()
-        if row >= 0:
-            op_id = self.operations_table.item(row, 0).data(Qt.UserRole)
-            self.db.delete_operation(op_id)
-            self.load_model_data(self.model_combo.currentText())
+        row = current_row(self.operations_table)
+        if row:
+            self.db.delete_operation(row[0])
 
     def add_document_details(self):
         model_name = self.model_combo.currentText()
@@ -1078,30 +818,108 @@ class EditTPDialog(QDialog):
             org, prod, doc, dev, check = dialog.get_values()
             if org:
                 self.db.insert_document_details(model_id, org, prod, doc, dev, check)
-                self.load_model_data(model_name)
 
     def edit_document_details(self):
-        row = self.document_details_table.currentRow()
-        if row >= 0:
-            det_id = self.document_details_table.item(row, 0).data(Qt.UserRole)
+        row = current_row(self.document_details_table)
+        if row:
+            det_id, org, prod, doc, dev, check = row
             dialog = DocumentDetailsDialog(self)
-            dialog.organization_input.setText(self.document_details_table.item(row, 1).text())
-            dialog.product_code_input.setText(self.document_details_table.item(row, 2).text())
-            dialog.document_code_input.setText(self.document_details_table.item(row, 3).text())
-            dialog.developed_by_input.setText(self.document_details_table.item(row, 4).text())
-            dialog.checked_by_input.setText(self.document_details_table.item(row, 5).text())
+            dialog.organization_input.setText(org)
+            dialog.product_code_input.setText(prod or "")
+            dialog.document_code_input.setText(doc or "")
+            dialog.developed_by_input.setText(dev or "")
+            dialog.checked_by_input.setText(check or "")
             if dialog.exec_() == QDialog.Accepted:
                 org, prod, doc, dev, check = dialog.get_values()
                 if org:
                     self.db.update_document_details(det_id, org, prod, doc, dev, check)
-                    self.load_model_data(self.model_combo.currentText())
 
     def delete_document_details(self):
-        row = self.document_details_table.currentRow()
-        if row >= 0:
-            det_id = self.document_details_table.item(row, 0).data(Qt.UserRole)
-            self.db.delete_document_details(det_id)
-            self.load_model_data(self.model_combo.currentText())
+        row = current_row(self.document_details_table)
+        if row:
+            self.db.delete_document_details(row[0])
+
+
+SEARCH_KIND_LABELS = {'parts': "Деталь", 'operations': "Операция", 'operation_catalog': "Операция (справочник)",
+                      'equipment': "Оборудование"}
+
+
+def search_kind(table):
+    return SEARCH_KIND_LABELS.get(table, table)
+
+
+def pdf_font_dir():
+    font_dir = os.path.join(os.path.dirname(__file__), 'fonts')
+    if os.path.exists(os.path.join(font_dir, 'DejaVuSans.ttf')):
+        return font_dir
+    return FONT_DIR
+
+
+class PDFExportSignals(QObject):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(str, bool)  # путь, PDF взят из кэша
+    failed = pyqtSignal(str, str)
+    cancelled = pyqtSignal(str)
+
+
+class PDFExportWorker(QRunnable):
+    def __init__(self, process_data, file_path, cache=None):
+        super().__init__()
+        self.process_data = process_data
+        self.file_path = file_path
+        self.cache = cache
+        self.signals = PDFExportSignals()
+        self.progress = 0
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        try:
+            cached = render_pdf(self.process_data, self.file_path, pdf_font_dir(),
+                                progress_callback=self.signals.progress.emit,
+                                is_cancelled=self.is_cancelled, cache=self.cache)
+        except ExportCancelled:
+            if os.path.exists(self.file_path):
+                os.remove(self.file_path)
+            self.signals.cancelled.emit(self.file_path)
+        except Exception as e:
+            print(traceback.format_exc())
+            self.signals.failed.emit(self.file_path, str(e))
+        else:
+            self.signals.finished.emit(self.file_path, cached)
+
+
+class BatchExportSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class BatchExportWorker(QRunnable):
+    def __init__(self, db, out_dir, model_names=None, batch_size=1):
+        super().__init__()
+        self.db = db
+        self.out_dir = out_dir
+        self.model_names = model_names
+        self.batch_size = batch_size
+        self.signals = BatchExportSignals()
+
+    def run(self):
+        try:
+            result = export_models_batch(self.db, self.out_dir, self.model_names,
+                                         progress_callback=self.signals.progress.emit, batch_size=self.batch_size)
+        except Exception as e:
+            print(traceback.format_exc())
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            self.db.release_reader()
 
 
 class CAPPWindow(QMainWindow):
@@ -1145,6 +963,12 @@ class CAPPWindow(QMainWindow):
         export_btn.clicked.connect(self.export_to_pdf)
         button_layout.addWidget(export_btn)
 
+        batch_export_btn = QPushButton("Пакетный экспорт")
+        batch_export_btn.setStyleSheet("font-size: 14px; background-color: #808080; color: white; border-radius: 5px;")
+        batch_export_btn.setFixedSize(200, 40)
+        batch_export_btn.clicked.connect(self.batch_export)
+        button_layout.addWidget(batch_export_btn)
+
         button_layout.addSpacerItem(QSpacerItem(20, 0, QSizePolicy.Expanding, QSizePolicy.Minimum))
         layout.addLayout(button_layout)
 
@@ -1157,9 +981,47 @@ class CAPPWindow(QMainWindow):
         self.model_combo = QComboBox()
         self.model_combo.setStyleSheet("font-size: 14px; padding: 5px;")
         input_layout.addWidget(self.model_combo)
+        batch_label = QLabel("Партия, шт:")
+        batch_label.setStyleSheet("font-size: 14px; font-weight: bold; color: #333;")
+        input_layout.addWidget(batch_label)
+        self.batch_size_spin = QSpinBox()
+        self.batch_size_spin.setRange(1, 1000000)
+        self.batch_size_spin.setStyleSheet("font-size: 14px; padding: 5px;")
+        self.batch_size_spin.valueChanged.connect(self.update_labor)
+        input_layout.addWidget(self.batch_size_spin)
         self.update_model_combo()
         layout.addLayout(input_layout)
 
+        # Поиск по всем моделям
+        search_layout = QHBoxLayout()
+        search_label = QLabel("Поиск:")
+        search_label.setStyleSheet("font-size: 14px; font-weight: bold; color: #333;")
+        search_label.setFixedWidth(100)
+        search_layout.addWidget(search_label)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Деталь, код, операция, оборудование...")
+        self.search_input.setToolTip(
+            "Поиск по всем моделям, последнее слово - начало слова. Совпадения в наименовании выше.\n"
+            f"Если совпадений больше {SEARCH_RANK_WINDOW}, ранжируются только {SEARCH_RANK_WINDOW} последних "
+            "добавленных записей - уточните запрос.")
+        self.search_input.setStyleSheet("font-size: 14px; padding: 5px;")
+        search_layout.addWidget(self.search_input)
+        layout.addLayout(search_layout)
+
+        self.search_results = make_table_view(['Тип', 'Модель', 'Наименование', 'Подробно'],
+                                              [(0, search_kind), (3, text), (4, text), (5, text)])
+        self.search_results.setMaximumHeight(180)
+        self.search_results.hide()
+        self.search_results.doubleClicked.connect(self.open_search_result)
+        layout.addWidget(self.search_results)
+
+        # Запрос уходит после паузы в наборе, а не на каждую букву
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
+
         separator = QFrame()
         separator.setFrameShape(QFrame.HLine)
         separator.setFrameShadow(QFrame.Sunken)
@@ -1181,11 +1043,7 @@ class CAPPWindow(QMainWindow):
         parts_group.setCheckable(True)
         parts_group.setChecked(True)
         parts_layout = QVBoxLayout()
-        self.parts_table = QTableWidget()
-        self.parts_table.setColumnCount(3)
-        self.parts_table.setHorizontalHeaderLabels(['Номер', 'Номенклатура', 'Количество'])
-        self.parts_table.horizontalHeader().setStretchLastSection(True)
-        self.parts_table.setStyleSheet("font-size: 14px; color: #333;")
+        self.parts_table = make_table_view(['Номер', 'Номенклатура', 'Количество'], [(2, text), (1, text), (3, text)])
         parts_scroll = QScrollArea()
         parts_scroll.setWidgetResizable(True)
         parts_scroll.setWidget(self.parts_table)
@@ -1204,11 +1062,9 @@ class CAPPWindow(QMainWindow):
         operations_group.setCheckable(True)
         operations_group.setChecked(True)
         operations_layout = QVBoxLayout()
-        self.operations_table = QTableWidget()
-        self.operations_table.setColumnCount(6)
-        self.operations_table.setHorizontalHeaderLabels(['№', 'Код', 'Наименование', 'Оборудование', 'Tподг, ч', 'Tшт, мин'])
-        self.operations_table.horizontalHeader().setStretchLastSection(True)
-        self.operations_table.setStyleSheet("font-size: 14px; color: #333;")
+        self.operations_table = make_table_view(
+            ['№', 'Код', 'Наименование', 'Оборудование', 'Tподг, ч', 'Tшт, мин'],
+            [(1, text), (2, text), (3, text), (5, text), (7, hours), (8, hours)])
         operations_scroll = QScrollArea()
         operations_scroll.setWidgetResizable(True)
         operations_scroll.setWidget(self.operations_table)
@@ -1221,17 +1077,34 @@ class CAPPWindow(QMainWindow):
         separator.setFrameShadow(QFrame.Sunken)
         layout.addWidget(separator)
 
+        # Трудоёмкость
+        labor_group = QGroupBox("Трудоёмкость")
+        labor_group.setStyleSheet("QGroupBox { font-size: 16px; font-weight: bold; color: #2E7D32; }")
+        labor_group.setCheckable(True)
+        labor_group.setChecked(True)
+        labor_layout = QVBoxLayout()
+        self.labor_table = make_table_view(
+            ['Оборудование', 'Операций', 'Tподг, ч', 'Tшт, мин', 'Партия, шт', 'Итого, ч'],
+            [(1, text), (2, text), (3, hours), (4, hours), (5, text), (6, hours)])
+        labor_scroll = QScrollArea()
+        labor_scroll.setWidgetResizable(True)
+        labor_scroll.setWidget(self.labor_table)
+        labor_layout.addWidget(labor_scroll)
+        labor_group.setLayout(labor_layout)
+        layout.addWidget(labor_group)
+
+        separator = QFrame()
+        separator.setFrameShape(QFrame.HLine)
+        separator.setFrameShadow(QFrame.Sunken)
+        layout.addWidget(separator)
+
         # Расцеховка
         workshop_group = QGroupBox("Расцеховка")
         workshop_group.setStyleSheet("QGroupBox { font-size: 16px; font-weight: bold; color: #2E7D32; }")
         workshop_group.setCheckable(True)
         workshop_group.setChecked(True)
         workshop_layout = QVBoxLayout()
-        self.workshop_table = QTableWidget()
-        self.workshop_table.setColumnCount(3)
-        self.workshop_table.setHorizontalHeaderLabels(['Цех', 'Участок', 'РМ'])
-        self.workshop_table.horizontalHeader().setStretchLastSection(True)
-        self.workshop_table.setStyleSheet("font-size: 14px; color: #333;")
+        self.workshop_table = make_table_view(['Цех', 'Участок', 'РМ'], [(1, text), (2, text), (3, text)])
         workshop_scroll = QScrollArea()
         workshop_scroll.setWidgetResizable(True)
         workshop_scroll.setWidget(self.workshop_table)
@@ -1250,11 +1123,7 @@ class CAPPWindow(QMainWindow):
         equipment_group.setCheckable(True)
         equipment_group.setChecked(True)
         equipment_layout = QVBoxLayout()
-        self.equipment_table = QTableWidget()
-        self.equipment_table.setColumnCount(3)
-        self.equipment_table.setHorizontalHeaderLabels(['Наименование', 'Артикул', 'Примечание'])
-        self.equipment_table.horizontalHeader().setStretchLastSection(True)
-        self.equipment_table.setStyleSheet("font-size: 14px; color: #333;")
+        self.equipment_table = make_table_view(['Наименование', 'Артикул', 'Примечание'], [(1, text), (2, text), (3, text)])
         equipment_scroll = QScrollArea()
         equipment_scroll.setWidgetResizable(True)
         equipment_scroll.setWidget(self.equipment_table)
@@ -1264,6 +1133,29 @@ class CAPPWindow(QMainWindow):
 
         layout.addSpacerItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
 
+        # Фоновый экспорт PDF
+        self.thread_pool = QThreadPool.globalInstance()
+        self.export_workers = []
+        self.export_progress = QProgressBar()
+        self.export_progress.setFixedWidth(250)
+        self.cancel_export_btn = QPushButton("Отменить экспорт")
+        self.cancel_export_btn.clicked.connect(self.cancel_exports)
+        self.statusBar().addPermanentWidget(self.export_progress)
+        self.statusBar().addPermanentWidget(self.cancel_export_btn)
+        self.update_export_status()
+
+    def run_search(self):
+        query = self.search_input.text().strip()
+        hits = self.db.search(query) if query else []
+        self.search_results.model().set_source(hits)
+        self.search_results.setVisible(bool(query))
+
+    def open_search_result(self, index):
+        model_name = self.search_results.model().row(index.row())[3]
+        if model_name:
+            self.model_combo.setCurrentText(model_name)
+            self.generate_process()
+
     def update_model_combo(self):
         self.model_combo.clear()
         self.model_combo.addItems([name for _, name in self.db.get_models()])
@@ -1283,59 +1175,33 @@ class CAPPWindow(QMainWindow):
             QMessageBox.warning(self, "Ошибка", "Выберите модель!")
             return
 
-        model_id = self.db.get_model_id(model)
-        if not model_id:
-            QMessageBox.critical(self, "Ошибка", f"Модель {model} не найдена!")
-            return
-
-        parts = self.db.get_parts(model_id)
-        operations = self.db.get_operations(model_id)
-        workshops = self.db.get_workshop()
-        equipment = self.db.get_equipment()
-        document_details = self.db.get_document_details(model_id)
+        with timed('generate_process', model=model):
+            # Пока данные модели не менялись, снимок берётся из кэша без запросов к таблицам
+            data = self.db.get_process_snapshot(model, self.batch_size_spin.value())
+            if data is None:
+                QMessageBox.critical(self, "Ошибка", f"Модель {model} не найдена!")
+                return
 
-        self.model_label.setText(f"Модель: {model}")
+            self.model_label.setText(f"Модель: {model}")
 
-        # Спецификация
-        self.parts_table.setRowCount(len(parts))
-        for row, (id, name, code, qty) in enumerate(parts):
-            self.parts_table.setItem(row, 0, QTableWidgetItem(code or ""))
-            self.parts_table.setItem(row, 1, QTableWidgetItem(name))
-            self.parts_table.setItem(row, 2, QTableWidgetItem(str(qty)))
+            # Модели таблиц отображают те же кортежи, что уходят в PDF, без копирования в ячейки
+            self.parts_table.model().set_source(data['parts'])
+            self.operations_table.model().set_source(data['operations'])
+            self.workshop_table.model().set_source(data['workshops'])
+            self.equipment_table.model().set_source(data['equipment'])
+            self.labor_table.model().set_source(data['labor'])
 
-        # Операции
-        self.operations_table.setRowCount(len(operations))
-        for row, (id, number, code, name, _, equip, _, prep, unit) in enumerate(operations):
-            self.operations_table.setItem(row, 0, QTableWidgetItem(number or ""))
-            self.operations_table.setItem(row, 1, QTableWidgetItem(code or ""))
-            self.operations_table.setItem(row, 2, QTableWidgetItem(name))
-            self.operations_table.setItem(row, 3, QTableWidgetItem(equip or ""))
-            self.operations_table.setItem(row, 4, QTableWidgetItem(f"{prep:.2f}"))
-            self.operations_table.setItem(row, 5, QTableWidgetItem(f"{unit:.2f}"))
+        self.process_data = data
 
-        # Расцеховка
-        self.workshop_table.setRowCount(len(workshops))
-        for row, (id, w, s, r) in enumerate(workshops):
-            self.workshop_table.setItem(row, 0, QTableWidgetItem(w))
-            self.workshop_table.setItem(row, 1, QTableWidgetItem(s or ""))
-            self.workshop_table.setItem(row, 2, QTableWidgetItem(r or ""))
-
-        # Оборудование
-        self.equipment_table.setRowCount(len(equipment))
-        for row, (id, name, art, note) in enumerate(equipment):
-            self.equipment_table.setItem(row, 0, QTableWidgetItem(name))
-            self.equipment_table.setItem(row, 1, QTableWidgetItem(art or ""))
-            self.equipment_table.setItem(row, 2, QTableWidgetItem(note or ""))
-
-        self.process_data = {
-            'model': model,
-            'parts': parts,
-            'operations': operations,
-            'workshops': workshops,
-            'equipment': equipment,
-            'document_details': document_details,
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+    def update_labor(self):
+        # Пересчёт партии: суммы модели берутся из кэша трудоёмкости, снимок не перечитывается
+        if not hasattr(self, 'process_data'):
+            return
+        model_id = self.db.get_model_id(self.process_data['model'])
+        rollup = self.db.get_labor_rollup(self.batch_size_spin.value(), [model_id]) if model_id else None
+        labor = tuple(rollup.equipment) + (rollup.total,) if rollup and rollup.total[2] else ()
+        self.process_data = dict(self.process_data, labor=labor)
+        self.labor_table.model().set_source(labor)
 
     def export_to_pdf(self):
         if not hasattr(self, 'process_data'):
@@ -1350,184 +1216,91 @@ class CAPPWindow(QMainWindow):
         if not file_path:
             return
 
-        try:
-            # --- Шрифт ---
-            font_dir = os.path.join(os.path.dirname(__file__), 'fonts')
-            os.makedirs(font_dir, exist_ok=True)
-            font_path = os.path.join(font_dir, 'DejaVuSans.ttf')
-            if not os.path.exists(font_path):
-                font_path = os.path.join(os.getcwd(), 'DejaVuSans.ttf')
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('DejaVu', font_path))
-                font_name = 'DejaVu'
-            else:
-                font_name = 'Helvetica'
-                print("Шрифт DejaVu не найден, используется Helvetica")
-
-            # --- Стили ---
-            styles = getSampleStyleSheet()
-            styles.add(ParagraphStyle(name='TitleCenter', fontName=font_name, fontSize=16, alignment=TA_CENTER, spaceAfter=20))
-            styles.add(ParagraphStyle(name='Header', fontName=font_name, fontSize=12, leading=14, spaceAfter=8))
-            styles.add(ParagraphStyle(name='Footer', fontName=font_name, fontSize=9, alignment=TA_RIGHT))
-            styles.add(ParagraphStyle(name='CellText', fontName=font_name, fontSize=9, leading=10, alignment=TA_LEFT))
-
-            # --- Документ ---
-            pdf_doc = SimpleDocTemplate(file_path, pagesize=A4, topMargin=20*mm, bottomMargin=20*mm, leftMargin=15*mm, rightMargin=15*mm)
-            story = []
-
-            # --- Логотип ---
-            logo_path = os.path.join(os.path.dirname(__file__), 'logo.png')
-            if os.path.exists(logo_path):
-                logo = Image(logo_path, width=50*mm, height=20*mm)
-                logo.hAlign = 'CENTER'
-                story.append(logo)
-                story.append(Spacer(1, 5*mm))
-
-            # --- Заголовок ---
-            story.append(Paragraph("ТЕХНОЛОГИЧЕСКИЙ ПРОЦЕСС", styles['TitleCenter']))
-            story.append(Paragraph(f"Модель: <b>{self.process_data['model']}</b>", styles['TitleCenter']))
-            story.append(Spacer(1, 10*mm))
-
-            # --- Реквизиты ---
-            details = self.process_data.get('document_details', [])
-            if details:
-                data = [["Параметр", "Значение"]]
-                for _, org, prod, doc, dev, check in details:
-                    data += [
-                        ["Организация", org or "—"],
-                        ["Обозначение изделия", prod or "—"],
-                        ["Обозначение документа", doc or "—"],
-                        ["Разработал", dev or "—"],
-                        ["Проверил", check or "—"]
-                    ]
-                table = Table(data, colWidths=[50*mm, 120*mm])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2E7D32')),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-                    ('FONTNAME', (0,0), (-1,0), font_name),
-                    ('FONTSIZE', (0,0), (-1,0), 11),
-                    ('FONTNAME', (0,1), (-1,-1), font_name),
-                    ('FONTSIZE', (0,1), (-1,-1), 10),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                ]))
-                story.append(Paragraph("Реквизиты документа", styles['Header']))
-                story.append(table)
-                story.append(Spacer(1, 8*mm))
-
-            # --- Спецификация ---
-            parts = self.process_data.get('parts', [])
-            if parts:
-                data = [["№", "Номенклатура", "Код", "Кол-во"]]
-                for i, (_, name, code, qty) in enumerate(parts, 1):
-                    name_para = Paragraph(name, styles['CellText']) if len(name) > 30 else name
-                    data.append([str(i), name_para, code or "—", str(qty)])
-                table = Table(data, colWidths=[15*mm, 100*mm, 35*mm, 20*mm], rowHeights=12*mm)
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#4CAF50')),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                    ('FONTNAME', (0,0), (-1,0), font_name),
-                    ('FONTSIZE', (0,0), (-1,0), 11),
-                    ('FONTNAME', (0,1), (-1,-1), font_name),
-                    ('FONTSIZE', (0,1), (-1,-1), 9),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                ]))
-                story.append(Paragraph("Спецификация", styles['Header']))
-                story.append(table)
-                story.append(Spacer(1, 8*mm))
-
-            # --- Операции ---
-            operations = self.process_data.get('operations', [])
-            if operations:
-                data = [["№", "Код", "Наименование", "Оборудование", "Tподг, ч", "Tшт, мин"]]
-                for i, (_, number, code, name, _, equip, _, prep, unit) in enumerate(operations, 1):
-                    name_para = Paragraph(name, styles['CellText']) if len(name) > 25 else name
-                    equip_para = Paragraph(equip, styles['CellText']) if equip and len(equip) > 20 else (equip or "—")
-                    data.append([number or str(i), code or "—", name_para, equip_para, f"{prep:.2f}", f"{unit:.2f}"])
-                table = Table(data, colWidths=[15*mm, 25*mm, 60*mm, 50*mm, 20*mm, 20*mm], rowHeights=14*mm)
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2196F3')),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (3,-1), 'CENTER'),
-                    ('ALIGN', (4,0), (-1,-1), 'CENTER'),
-                    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                    ('FONTNAME', (0,0), (-1,0), font_name),
-                    ('FONTSIZE', (0,0), (-1,0), 11),
-                    ('FONTNAME', (0,1), (-1,-1), font_name),
-                    ('FONTSIZE', (0,1), (-1,-1), 9),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                ]))
-                story.append(Paragraph("Операции", styles['Header']))
-                story.append(table)
-                story.append(Spacer(1, 8*mm))
-
-            # --- Расцеховка ---
-            workshops = self.process_data.get('workshops', [])
-            if workshops:
-                data = [["Цех", "Участок", "РМ"]]
-                for _, w, s, r in workshops:
-                    data.append([w or "—", s or "—", r or "—"])
-                table = Table(data, colWidths=[60*mm, 60*mm, 60*mm])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#FF9800')),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('FONTNAME', (0,0), (-1,0), font_name),
-                    ('FONTSIZE', (0,0), (-1,0), 11),
-                    ('FONTNAME', (0,1), (-1,-1), font_name),
-                    ('FONTSIZE', (0,1), (-1,-1), 10),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                ]))
-                story.append(Paragraph("Расцеховка", styles['Header']))
-                story.append(table)
-                story.append(Spacer(1, 8*mm))
-
-            # --- Оборудование ---
-            equipment = self.process_data.get('equipment', [])
-            if equipment:
-                data = [["Наименование", "Артикул", "Примечание"]]
-                for _, name, art, note in equipment:
-                    name_para = Paragraph(name, styles['CellText']) if len(name) > 30 else name
-                    note_para = Paragraph(note, styles['CellText']) if note and len(note) > 30 else (note or "—")
-                    data.append([name_para, art or "—", note_para])
-                table = Table(data, colWidths=[70*mm, 50*mm, 60*mm], rowHeights=12*mm)
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#9C27B0')),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-                    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                    ('FONTNAME', (0,0), (-1,0), font_name),
-                    ('FONTSIZE', (0,0), (-1,0), 11),
-                    ('FONTNAME', (0,1), (-1,-1), font_name),
-                    ('FONTSIZE', (0,1), (-1,-1), 9),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                ]))
-                story.append(Paragraph("Оборудование", styles['Header']))
-                story.append(table)
-
-            # --- Подвал ---
-            story.append(Spacer(1, 15*mm))
-            story.append(Paragraph(f"Дата формирования: {self.process_data['timestamp']}", styles['Footer']))
-
-            # --- Генерация с нумерацией ---
-            pdf_doc.build(
-                story,
-                onFirstPage=self.add_page_number,
-                onLaterPages=self.add_page_number
-            )
-            QMessageBox.information(self, "Успех", f"PDF сохранён:\n{file_path}")
+        # Свежий снимок из кэша: если после генерации данные правили, в PDF уйдут актуальные
+        data = self.db.get_process_snapshot(self.process_data['model'], self.batch_size_spin.value()) or self.process_data
+
+        self.start_export(data, file_path)
+
+    def start_export(self, data, file_path, cache=None):
+        # Рендер идёт в пуле потоков, окно остаётся отзывчивым
+        worker = PDFExportWorker(data, file_path, cache)
+        worker.signals.progress.connect(lambda value, w=worker: self.on_export_progress(w, value))
+        worker.signals.finished.connect(lambda path, cached, w=worker: self.on_export_finished(w, path, cached))
+        worker.signals.failed.connect(lambda path, error, w=worker: self.on_export_failed(w, path, error))
+        worker.signals.cancelled.connect(lambda path, w=worker: self.on_export_cancelled(w, path))
+        self.export_workers.append(worker)
+        self.update_export_status()
+        self.thread_pool.start(worker)
+
+    def batch_export(self):
+        out_dir = QFileDialog.getExistingDirectory(self, "Папка для PDF всех моделей")
+        if not out_dir:
+            return
+        worker = BatchExportWorker(self.db, out_dir, batch_size=self.batch_size_spin.value())
+        worker.signals.progress.connect(
+            lambda done, total: self.statusBar().showMessage(f"Пакетный экспорт: {done} из {total}"))
+        worker.signals.finished.connect(self.on_batch_export_finished)
+        worker.signals.failed.connect(
+            lambda error: QMessageBox.critical(self, "Ошибка", f"Пакетный экспорт не выполнен:\n{error}"))
+        self.batch_worker = worker
+        self.thread_pool.start(worker)
+
+    def on_batch_export_finished(self, result):
+        self.statusBar().clearMessage()
+        message = (f"Сохранено PDF: {len(result['done'])} (из кэша: {result['cached']})\n"
+                   f"Время: {result['elapsed']:.1f} с ({result['per_minute']:.0f} док/мин)")
+        if result['cached']:
+            message += "\nВ PDF из кэша указана дата первого формирования."
+        if result['failed']:
+            message += "\n\nОшибки:\n" + "\n".join(f"{name}: {error}" for name, error in result['failed'])
+        QMessageBox.information(self, "Пакетный экспорт", message)
+
+    def cancel_exports(self):
+        for worker in self.export_workers:
+            worker.cancel()
+
+    def update_export_status(self):
+        if self.export_workers:
+            self.export_progress.setValue(min(w.progress for w in self.export_workers))
+            self.export_progress.setFormat(f"Экспорт PDF ({len(self.export_workers)}): %p%")
+            self.export_progress.show()
+            self.cancel_export_btn.show()
+        else:
+            self.export_progress.hide()
+            self.cancel_export_btn.hide()
 
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось создать PDF:\n{e}")
-            print(traceback.format_exc())
+    def on_export_progress(self, worker, value):
+        worker.progress = value
+        self.update_export_status()
+
+    def finish_export(self, worker):
+        if worker in self.export_workers:
+            self.export_workers.remove(worker)
+        self.update_export_status()
 
-    def add_page_number(self, canvas, doc):
-        page_num = canvas.getPageNumber()
-        text = f"Страница {page_num}"
-        canvas.setFont("DejaVu", 9)
-        canvas.drawRightString(195*mm, 10*mm, text)
+    def on_export_finished(self, worker, file_path, cached=False):
+        self.finish_export(worker)
+        if not cached:
+            QMessageBox.information(self, "Успех", f"PDF сохранён:\n{file_path}")
+            return
+        # PDF из кэша - байт в байт прежний документ, в том числе «Дата формирования»
+        answer = QMessageBox.question(
+            self, "Успех",
+            f"PDF сохранён:\n{file_path}\n\n"
+            "Техпроцесс не менялся, документ взят из кэша: в нём указана дата первого "
+            "формирования.\nСформировать заново с текущей датой?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if answer == QMessageBox.Yes:
+            self.start_export(dict(worker.process_data, timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+                              file_path, PDFCache(refresh=True))
+
+    def on_export_failed(self, worker, file_path, error):
+        self.finish_export(worker)
+        QMessageBox.critical(self, "Ошибка", f"Не удалось создать PDF:\n{error}")
+
+    def on_export_cancelled(self, worker, file_path):
+        self.finish_export(worker)
+        self.statusBar().showMessage(f"Экспорт отменён: {file_path}", 5000)
 
 
 if __name__ == '__main__':
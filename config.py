@@ -3,40 +3,74 @@ TABLE_CONFIG = {
         "title": "Спецификация",
         "headers": ["Номенклатура", "Код", "Кол-во"],
         "fields": ["name", "code", "quantity"],
+        "row_index": [1, 2, 3],
         "col_widths": [100, 35, 20],
         "row_height": 12,
         "color": "#4CAF50",
-        "wrap": [0]
+        "numbered": True,
+        "wrap": {0: 30}
     },
     "operations": {
         "title": "Операции",
-        "headers": ["№", "Код", "Наименование", "Оборудование", "Tподг", "Tшт"],
+        "headers": ["№", "Код", "Наименование", "Оборудование", "Tподг, ч", "Tшт, мин"],
         "fields": ["number", "code", "name", "equipment", "prep_time", "unit_time"],
+        "row_index": [1, 2, 3, 5, 7, 8],
         "col_widths": [15, 25, 60, 50, 20, 20],
         "row_height": 14,
         "color": "#2196F3",
-        "wrap": [2, 3]
+        "wrap": {2: 25, 3: 20}
     },
     "workshops": {
         "title": "Расцеховка",
         "headers": ["Цех", "Участок", "РМ"],
         "fields": ["workshop", "section", "workplace"],
+        "row_index": [1, 2, 3],
         "col_widths": [60, 60, 60],
         "row_height": 10,
         "color": "#FF9800",
-        "wrap": []
+        "wrap": {}
     },
     "equipment": {
         "title": "Оборудование",
         "headers": ["Наименование", "Артикул", "Примечание"],
         "fields": ["name", "article", "note"],
+        "row_index": [1, 2, 3],
         "col_widths": [70, 50, 60],
         "row_height": 12,
         "color": "#9C27B0",
-        "wrap": [0, 2]
+        "align": "LEFT",
+        "wrap": {0: 30, 2: 30}
     }
 }
 
+# Сводка трудоёмкости в PDF (строки LaborRollup); отдельно от TABLE_CONFIG - это не таблица БД
+LABOR_SECTION = {
+    "title": "Трудоёмкость",
+    "headers": ["Оборудование", "Операций", "Tподг, ч", "Tшт, мин", "Партия, шт", "Итого, ч"],
+    "fields": ["equipment", "operations", "prep_time", "unit_time", "batch_size", "total"],
+    "row_index": [1, 2, 3, 4, 5, 6],
+    "col_widths": [60, 20, 25, 25, 25, 25],
+    "row_height": 10,
+    "color": "#607D8B",
+    "wrap": {0: 30}
+}
+
+# Многоуровневый состав в PDF (строки BOMGraph.indented)
+BOM_SECTION = {
+    "title": "Состав изделия",
+    "headers": ["Ур.", "Наименование", "Код", "На сборку", "На изделие"],
+    "fields": ["level", "name", "code", "quantity", "total"],
+    "row_index": [0, 1, 2, 3, 4],
+    "col_widths": [12, 70, 38, 28, 28],
+    "row_height": 10,
+    "color": "#795548",
+    "align": "LEFT",
+    "wrap": {1: 35, 2: 20}
+}
+
+# "row_index" - позиции полей в кортежах CAPPDatabase.get_* (строки-словари читаются по "fields"),
+# "wrap" - номер колонки -> длина текста, после которой ячейка переносится.
+
 DETAIL_FIELDS = [
     ("Организация", "organization"),
     ("Обозначение изделия", "product_code"),
@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from metrics import trace_sql
+
+# Общие настройки соединений с capp.db. WAL позволяет читателям не блокировать запись,
+# synchronous=NORMAL в режиме WAL безопасен и убирает fsync на каждую фиксацию.
+PRAGMAS = [
+    ("synchronous", "NORMAL"),
+    ("cache_size", -20000),        # ~20 МБ страничного кэша
+    ("mmap_size", 268435456),      # 256 МБ
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),
+    ("foreign_keys", "ON"),        # каскадное удаление и проверка ссылок
+]
+
+
+def connect(db_name, read_only=False):
+    conn = sqlite3.connect(db_name, check_same_thread=False)
+    if not read_only:
+        # Действует только для новой БД (до первой записи и перехода в WAL);
+        # существующая переводится командой обслуживания (CAPPDatabase.maintenance)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # busy_timeout - до перехода в WAL: переход ждёт блокировку, если БД открывают одновременно
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    if db_name != ":memory:":
+        conn.execute("PRAGMA journal_mode = WAL")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    trace_sql(conn)
+    return conn
+
+
+# Ленивый источник строк на собственном соединении: недочитанный курсор держит снимок WAL
+# только своего соединения, а не читателя потока, поэтому остальные чтения видят свежие
+# данные и контрольная точка WAL не блокируется. Соединение закрывается, когда строки
+# кончились или при close() - владелец (RowTableModel) вызывает его, бросая источник.
+class LazyRows:
+    def __init__(self, conn, sql, params=()):
+        self._conn = conn
+        try:
+            self._cursor = conn.execute(sql, params)
+        except sqlite3.Error:
+            conn.close()
+            raise
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self._cursor, None) if self._conn is not None else None
+        if row is None:
+            self.close()
+            raise StopIteration
+        return row
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = self._cursor = None
+
+
+# Один сериализованный писатель и по одному читающему соединению на поток
+class ConnectionManager:
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.writer = connect(db_name)
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+
+    def reader(self):
+        if self.db_name == ":memory:":
+            # У каждой :memory: соединения своя БД - читаем через писателя
+            return self.writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_name, read_only=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def release_reader(self):
+        # Закрыть соединение текущего потока. Потоки QThreadPool входят в Python заново
+        # на каждую задачу, и threading.local задачи не переживает - без этого каждая
+        # задача пула оставляла бы своё соединение открытым до close()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._readers_lock:
+            self._readers.remove(conn)
+        conn.close()
+
+    def lazy(self, sql, params=()):
+        # :memory: не открыть вторым соединением - строки читаются сразу
+        if self.db_name == ":memory:":
+            return iter(self.writer.execute(sql, params).fetchall())
+        return LazyRows(connect(self.db_name, read_only=True), sql, params)
+
+    @contextmanager
+    def write(self):
+        with self.write_lock:
+            yield self.writer
+
+    def close(self):
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+        self._local = threading.local()
+        self.writer.close()
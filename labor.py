@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+NO_EQUIPMENT = "Без оборудования"
+
+
+# Трудоёмкость операции: Tподг (ч) - один раз на партию, Tшт (мин) - на каждую штуку.
+def batch_hours(prep_time, unit_time, batch_size):
+    return prep_time + batch_size * unit_time / 60
+
+
+# Сводка трудоёмкости по моделям, цехам и оборудованию для партии batch_size шт.
+# aggregates: {model_id: [(equipment_id, число операций, сумма Tподг, сумма Tшт)]} -
+# суммы из таблицы labor_totals (см. CAPPDatabase.get_labor_rollup). Модель, закреплённая за
+# несколькими цехами, входит в сумму каждого. Строки - кортежи
+# (id, наименование, операций, Tподг ч, Tшт мин, партия шт, итого ч).
+class LaborRollup:
+    def __init__(self, aggregates, models, workshops, equipment, links, batch_size=1):
+        self.batch_size = batch_size
+        by_model = {}
+        by_equipment = defaultdict(lambda: [0, 0.0, 0.0])
+        for model_id, rows in aggregates.items():
+            total = [0, 0.0, 0.0]
+            for equipment_id, count, prep_time, unit_time in rows:
+                for sums in (total, by_equipment[equipment_id]):
+                    sums[0] += count
+                    sums[1] += prep_time or 0.0
+                    sums[2] += unit_time or 0.0
+            by_model[model_id] = total
+        by_workshop = defaultdict(lambda: [0, 0.0, 0.0])
+        for model_id, workshop_id in links:
+            if model_id in by_model:
+                for i, value in enumerate(by_model[model_id]):
+                    by_workshop[workshop_id][i] += value
+
+        self.models = self._rows(by_model, models)
+        self.workshops = self._rows(by_workshop, workshops)
+        self.equipment = self._rows(by_equipment, {**equipment, None: NO_EQUIPMENT})
+        self.total = self._row(None, "Итого", [sum(sums[i] for sums in by_model.values()) for i in range(3)])
+
+    def _row(self, id, name, sums):
+        count, prep_time, unit_time = sums
+        return (id, name, count, prep_time, unit_time, self.batch_size, batch_hours(prep_time, unit_time, self.batch_size))
+
+    def _rows(self, sums_by_id, names):
+        # порядок строк - порядок справочника names
+        return [self._row(id, name, sums_by_id[id]) for id, name in names.items() if id in sums_by_id]
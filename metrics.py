@@ -0,0 +1,181 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Замеры времени горячих путей (снимок техпроцесса, загрузка модели, этапы PDF, SQL).
+# Включаются переменными окружения, без них timed() ничего не пишет и не засекает SQL:
+#   CAPP_METRICS=файл  - события JSON-строками (по одной на замер), "-" - в stderr
+#   CAPP_METRICS_SQL=1 - время каждого SQL-запроса внутри замера (set_trace_callback);
+#                        запрос на каждую строку executemany - заметные накладные расходы
+#   CAPP_PROFILE=папка - cProfile внешнего замера потока, дамп <замер>-<pid>-<n>.prof
+#                        (смотреть: python -m pstats файл или snakeviz)
+METRICS_PATH = os.environ.get("CAPP_METRICS")
+TRACE_SQL = bool(METRICS_PATH) and os.environ.get("CAPP_METRICS_SQL", "0") != "0"
+PROFILE_DIR = os.environ.get("CAPP_PROFILE")
+
+# Сколько самых долгих запросов попадает в событие замера
+SQL_TOP = 10
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_profile_count = [0]
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b|X'[0-9a-f]*'", re.IGNORECASE)
+_IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    # Запрос без значений параметров: трассировка отдаёт его с подставленными
+    # значениями, а группировать и писать в журнал нужно текст запроса. Списки IN
+    # любой длины сворачиваются в один "IN (...)" - это один и тот же запрос
+    return _IN_LISTS.sub("IN (...)", " ".join(_LITERALS.sub("?", sql).split()))
+
+
+class Span:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.stages = {}
+        self.sql = {}  # текст запроса -> [число, секунды]
+        self.start = self._mark = time.perf_counter()
+        self._statement = None  # (сырой текст, время начала) выполняемого запроса
+
+    def mark(self, stage, at=None):
+        # Этап закончился в момент at (по умолчанию сейчас) и начинается следующий
+        at = time.perf_counter() if at is None else at
+        self.stages[stage] = self.stages.get(stage, 0.0) + at - self._mark
+        self._mark = at
+
+    def statement(self, sql, now):
+        # Время запроса - до следующего запроса потока или до конца замера, включая
+        # чтение строк курсора. Шаги триггеров приходят тем же текстом внешнего запроса,
+        # внутренние запросы FTS5 - с префиксом "--": и те и другие входят во внешний.
+        if sql.startswith("--"):
+            return
+        if self._statement is not None:
+            if self._statement[0] == sql:
+                return
+            self._close_statement(now)
+        self._statement = (sql, now)
+
+    def _close_statement(self, now):
+        sql, started = self._statement
+        self._statement = None
+        totals = self.sql.setdefault(normalize_sql(sql), [0, 0.0])
+        totals[0] += 1
+        totals[1] += now - started
+
+    def finish(self):
+        end = time.perf_counter()
+        if self._statement is not None:
+            self._close_statement(end)
+        record = {'event': self.name, 'ts': time.time(), 'pid': os.getpid(),
+                  'thread': threading.current_thread().name, 'ms': round((end - self.start) * 1000, 3)}
+        record.update(self.fields)
+        if self.stages:
+            record['stages_ms'] = {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+        if self.sql:
+            top = sorted(self.sql.items(), key=lambda item: item[1][1], reverse=True)[:SQL_TOP]
+            record['sql'] = {
+                'count': sum(count for count, _ in self.sql.values()),
+                'ms': round(sum(seconds for _, seconds in self.sql.values()) * 1000, 3),
+                'top': [{'sql': sql, 'count': count, 'ms': round(seconds * 1000, 3)} for sql, (count, seconds) in top],
+            }
+        return record
+
+
+class _NullSpan:
+    @property
+    def fields(self):
+        return {}
+
+    def mark(self, stage, at=None):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def enabled():
+    return bool(METRICS_PATH or PROFILE_DIR)
+
+
+@contextmanager
+def timed(name, **fields):
+    # Замер блока: with timed('generate_process', model=name) as span: ... span.mark('этап')
+    if not enabled():
+        yield NULL_SPAN
+        return
+    stack = getattr(_local, "spans", None)
+    if stack is None:
+        stack = _local.spans = []
+    parent = stack[-1] if stack else None
+    if parent is not None and parent._statement is not None:
+        # запросы вложенного замера не засчитываются объемлющему
+        parent._close_statement(time.perf_counter())
+    span = Span(name, fields)
+    profiler = _start_profile() if PROFILE_DIR and not stack else None
+    stack.append(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.fields['error'] = type(e).__name__
+        raise
+    finally:
+        stack.pop()
+        if profiler is not None:
+            _dump_profile(profiler, name)
+        record = span.finish()
+        if METRICS_PATH:
+            write(record)
+
+
+def write(record):
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    try:
+        with _write_lock:
+            if METRICS_PATH == "-":
+                sys.stderr.write(line)
+            else:
+                # дозапись одной строкой: файл общий для процессов пакетного экспорта
+                with open(METRICS_PATH, "a", encoding="utf-8") as f:
+                    f.write(line)
+    except OSError as e:
+        print(f"Не удалось записать метрики: {e}", file=sys.stderr)
+
+
+def trace_sql(conn):
+    # Подключает замер запросов соединения к текущему замеру потока
+    if TRACE_SQL:
+        conn.set_trace_callback(_on_statement)
+
+
+def _on_statement(sql):
+    stack = getattr(_local, "spans", None)
+    if stack:
+        stack[-1].statement(sql, time.perf_counter())
+
+
+def _start_profile():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None  # профилировщик уже запущен (например, python -m cProfile)
+    return profiler
+
+
+def _dump_profile(profiler, name):
+    profiler.disable()
+    with _write_lock:
+        _profile_count[0] += 1
+        count = _profile_count[0]
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{os.getpid()}-{count}.prof"))
+    except OSError as e:
+        print(f"Не удалось сохранить профиль: {e}", file=sys.stderr)
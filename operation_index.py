@@ -0,0 +1,36 @@
+from bisect import bisect_left
+
+
+class PrefixIndex:
+    # Префиксный поиск без учёта регистра по отсортированным ключам:
+    # bisect находит начало диапазона, совпадения идут подряд.
+    def __init__(self, values):
+        self.values = sorted(filter(None, values), key=str.casefold)
+        self._keys = [value.casefold() for value in self.values]
+
+    def complete(self, prefix, limit=50):
+        prefix = prefix.casefold()
+        result = []
+        for i in range(bisect_left(self._keys, prefix), len(self._keys)):
+            if len(result) >= limit or not self._keys[i].startswith(prefix):
+                break
+            result.append(self.values[i])
+        return result
+
+
+# Индекс справочника операций (строки operation_catalog): раздельные словари
+# код -> наименование и наименование -> код и префиксный поиск для автодополнения.
+# Строится один раз и живёт до изменения справочника (см. CAPPDatabase.operation_index).
+class OperationIndex:
+    def __init__(self, rows):
+        self.code_to_name = {}
+        self.name_to_code = {}
+        for _, code, name in rows:
+            code = code or ""
+            name = name or ""
+            if code:
+                self.code_to_name.setdefault(code, name)
+            if name:
+                self.name_to_code.setdefault(name, code)
+        self.codes = PrefixIndex(self.code_to_name)
+        self.names = PrefixIndex(self.name_to_code)
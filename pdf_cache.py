@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from config import TABLE_CONFIG, LABOR_SECTION, BOM_SECTION
+from pdf_generator import generate_pdf, FONT_DIR, LOGO_PATH, TEMPLATE_VERSION
+from metrics import timed
+
+# Кэш готовых PDF по содержимому: ключ - хэш данных техпроцесса (без времени
+# формирования), TABLE_CONFIG, секций трудоёмкости и состава, версии шаблона, шрифта
+# и логотипа. Настройки из окружения:
+#   CAPP_PDF_CACHE=0        - отключить кэш
+#   CAPP_PDF_CACHE_DIR      - папка кэша (по умолчанию ~/.cache/capp/pdf)
+#   CAPP_PDF_CACHE_MB       - предельный размер, старые файлы удаляются (по умолчанию 500)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "capp", "pdf")
+
+
+class PDFCache:
+    # refresh=True - рендерить заново и заменить запись кэша (например, ради новой даты
+    # формирования: PDF из кэша - прежний документ с датой первого рендера)
+    def __init__(self, cache_dir=None, max_bytes=None, enabled=None, refresh=False):
+        env = os.environ
+        self.cache_dir = cache_dir or env.get("CAPP_PDF_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else int(env.get("CAPP_PDF_CACHE_MB", "500")) * 1024 * 1024
+        self.enabled = enabled if enabled is not None else env.get("CAPP_PDF_CACHE", "1") != "0"
+        self.refresh = refresh
+
+    def key(self, data, font_path):
+        payload = {
+            'data': {k: v for k, v in data.items() if k != 'timestamp'},
+            'config': TABLE_CONFIG,
+            'sections': [LABOR_SECTION, BOM_SECTION],
+            'template': TEMPLATE_VERSION,
+            'font': os.path.basename(font_path) if os.path.exists(font_path) else None,
+            'logo': os.path.getmtime(LOGO_PATH) if os.path.exists(LOGO_PATH) else None,
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pdf")
+
+    def fetch(self, key, file_path):
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, file_path)
+            os.utime(path)  # время использования для вытеснения
+            return True
+        except FileNotFoundError:
+            return False
+
+    def store(self, key, file_path):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Копия во временный файл и атомарная замена: пакетный экспорт пишет из нескольких процессов
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(file_path, tmp)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".pdf"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def render_pdf(data, file_path, font_dir=FONT_DIR, progress_callback=None, is_cancelled=None, cache=None):
+    # generate_pdf через кэш; возвращает True, если PDF взят из кэша
+    cache = cache or PDFCache()
+    with timed('render_pdf', model=data.get('model'), cached=False) as span:
+        if not cache.enabled:
+            generate_pdf(data, file_path, font_dir, progress_callback, is_cancelled)
+            return False
+        key = cache.key(data, os.path.join(font_dir, 'DejaVuSans.ttf'))
+        if not cache.refresh and cache.fetch(key, file_path):
+            span.fields['cached'] = True
+            if progress_callback:
+                progress_callback(100)
+            return True
+        generate_pdf(data, file_path, font_dir, progress_callback, is_cancelled)
+        try:
+            cache.store(key, file_path)
+        except OSError as e:
+            print(f"Не удалось сохранить PDF в кэш: {e}", file=sys.stderr)
+        return False
@@ -1,74 +1,300 @@
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.platypus import Flowable, SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from config import TABLE_CONFIG
+from xml.sax.saxutils import escape, unescape
+from config import TABLE_CONFIG, LABOR_SECTION, BOM_SECTION
+from metrics import timed
+import json
 import os
+from bisect import bisect_right
+import threading
+import time
 
-def generate_pdf(data, file_path, font_dir):
-    font_path = os.path.join(font_dir, 'DejaVuSans.ttf')
-    if os.path.exists(font_path):
-        pdfmetrics.registerFont(TTFont('DejaVu', font_path))
-        font_name = 'DejaVu'
-    else:
-        font_name = 'Helvetica'
+FONT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGO_PATH = os.path.join(os.path.dirname(__file__), 'logo.png')
+# Версия шаблона документа: увеличивать при изменении вёрстки, иначе pdf_cache отдаст старые PDF
+TEMPLATE_VERSION = 5
+# Отступы ячеек Table по умолчанию (пт)
+CELL_HPADDING = 6
+CELL_VPADDING = 3
+# Запас при делении таблицы: сумма высот строк в Table считается в другом порядке
+SPLIT_FUZZ = 0.01
+# Внутренние отступы Frame в SimpleDocTemplate (пт)
+FRAME_PADDING = 6
+DETAIL_LABELS = ["Организация", "Обозначение изделия", "Обозначение документа", "Разработал", "Проверил"]
 
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='TitleCenter', fontName=font_name, fontSize=16, alignment=TA_CENTER, spaceAfter=20))
-    styles.add(ParagraphStyle(name='Header', fontName=font_name, fontSize=12, spaceAfter=8))
-    styles.add(ParagraphStyle(name='Cell', fontName=font_name, fontSize=9, leading=10))
+
+class ExportCancelled(Exception):
+    pass
+
+
+# Раскладка секции, посчитанная один раз по TABLE_CONFIG: заголовки, ширины колонок,
+# пороги переноса и позиции полей в кортежах CAPPDatabase.
+class SectionPlan:
+    def __init__(self, key, cfg):
+        self.key = key
+        self.title = cfg["title"]
+        self.numbered = cfg.get("numbered", False)
+        self.fields = cfg["fields"]
+        self.row_index = cfg.get("row_index", list(range(len(self.fields))))
+        self.headers = (["№"] if self.numbered else []) + cfg["headers"]
+        self.col_widths = [w*mm for w in ([15] if self.numbered else []) + cfg["col_widths"]]
+        self.row_height = cfg["row_height"]*mm
+        wrap = cfg.get("wrap", {})
+        self.wrap_at = [wrap.get(j) for j in range(len(self.fields))]
+
+    def values(self, item, is_dict):
+        if is_dict:
+            return [item.get(field) for field in self.fields]
+        return [item[i] for i in self.row_index]
+
+    def rows(self, items, cell_style):
+        is_dict = isinstance(items[0], dict)
+        columns = list(zip(self.fields, self.wrap_at))
+        for i, item in enumerate(items, 1):
+            row = [str(i)] if self.numbered else []
+            for (field, wrap_at), value in zip(columns, self.values(item, is_dict)):
+                if field == "number":
+                    text = str(value) if value else str(i)
+                elif value is None or value == "":
+                    text = "—"
+                elif isinstance(value, float):
+                    text = f"{value:.2f}"
+                else:
+                    text = str(value)
+                if wrap_at is not None and len(text) > wrap_at:
+                    text = Paragraph(escape(text), cell_style)
+                row.append(text)
+            yield row
+
+    def measure(self, row):
+        # Высота строки по метрикам текста, но не меньше row_height из конфига
+        height = self.row_height
+        for cell, width in zip(row, self.col_widths):
+            if isinstance(cell, Paragraph):
+                height = max(height, self.measure_cell(cell, width))
+        return height
+
+    def fit(self, row, max_height, cell_style):
+        # Строка выше страницы не делится ReportLab (LayoutError): длинный текст в ячейках
+        # обрезается с многоточием по самой длинной части, помещающейся на страницу
+        fitted = []
+        for cell, width in zip(row, self.col_widths):
+            if isinstance(cell, Paragraph) and self.measure_cell(cell, width) > max_height:
+                text = unescape(cell.text)
+                low, high = 0, len(text)
+                while low < high:
+                    size = (low + high + 1) // 2
+                    if self.measure_cell(Paragraph(escape(text[:size]) + "…", cell_style), width) <= max_height:
+                        low = size
+                    else:
+                        high = size - 1
+                cell = Paragraph(escape(text[:low]) + "…", cell_style)
+            fitted.append(cell)
+        return fitted
+
+    @staticmethod
+    def measure_cell(cell, width):
+        return cell.wrap(width - 2*CELL_HPADDING, 1e6)[1] + 2*CELL_VPADDING
+
+    def table(self, items, cell_style, table_style, max_height):
+        # max_height - высота кадра страницы: шапка и строка должны поместиться на одну страницу
+        max_row = max_height - self.row_height - SPLIT_FUZZ
+        rows, heights = [], []
+        for row in self.rows(items, cell_style):
+            height = self.measure(row)
+            if height > max_row:
+                row = self.fit(row, max_row, cell_style)
+                height = self.measure(row)
+            rows.append(row)
+            heights.append(height)
+        return SectionTable(self, rows, heights, table_style)
+
+
+# Таблица секции, которая делится по месту на странице: кусок - Table из шапки и строк,
+# помещающихся в оставшуюся высоту, остаток - та же таблица с другой начальной строкой.
+# Шапка печатается только в начале секции и наверху каждой следующей страницы. Высоты
+# строк посчитаны заранее, поэтому деление - двоичный поиск по нарастающим суммам, а
+# ReportLab раскладывает только таблицы в страницу: время растёт линейно.
+class SectionTable(Flowable):
+    def __init__(self, plan, rows, heights, table_style, start=0, offsets=None):
+        super().__init__()
+        self.plan = plan
+        self.rows = rows
+        self.table_style = table_style
+        self.start = start
+        if offsets is None:
+            offsets = [0.0]
+            for height in heights:
+                offsets.append(offsets[-1] + height)
+        self.offsets = offsets  # offsets[i] - высота строк до i-й
+
+    @property
+    def section_rows(self):
+        return len(self.rows) - self.start
+
+    def wrap(self, availWidth, availHeight):
+        self.width = sum(self.plan.col_widths)
+        self.height = self.plan.row_height + self.offsets[-1] - self.offsets[self.start]
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        limit = self.offsets[self.start] + availHeight - self.plan.row_height - SPLIT_FUZZ
+        end = bisect_right(self.offsets, limit) - 1
+        if end <= self.start:
+            return []
+        return [self._table(self.start, end),
+                SectionTable(self.plan, self.rows, None, self.table_style, end, self.offsets)]
+
+    def draw(self):
+        table = self._table(self.start, len(self.rows))
+        table.wrapOn(self.canv, self.width, self.height)
+        table.drawOn(self.canv, 0, 0)
+
+    def _table(self, start, end):
+        heights = [self.plan.row_height] + [self.offsets[i + 1] - self.offsets[i] for i in range(start, end)]
+        t = Table([self.plan.headers] + self.rows[start:end], colWidths=self.plan.col_widths, rowHeights=heights)
+        t.setStyle(self.table_style)
+        t.section_rows = end - start
+        return t
+
+
+# Шрифты, стили абзацев, TableStyle и раскладки секций строятся один раз на процесс
+# и переиспользуются всеми рендерами (ключ - путь к шрифту и содержимое конфига).
+class RenderContext:
+    def __init__(self, font_path, table_config):
+        if font_path:
+            if 'DejaVu' not in pdfmetrics.getRegisteredFontNames():
+                pdfmetrics.registerFont(TTFont('DejaVu', font_path))
+            self.font_name = 'DejaVu'
+        else:
+            self.font_name = 'Helvetica'
+        font_name = self.font_name
+
+        self.styles = getSampleStyleSheet()
+        self.styles.add(ParagraphStyle(name='TitleCenter', fontName=font_name, fontSize=16, alignment=TA_CENTER, spaceAfter=20))
+        self.styles.add(ParagraphStyle(name='Header', fontName=font_name, fontSize=12, leading=14, spaceAfter=8))
+        self.styles.add(ParagraphStyle(name='Cell', fontName=font_name, fontSize=9, leading=10, alignment=TA_LEFT))
+        self.styles.add(ParagraphStyle(name='Footer', fontName=font_name, fontSize=9, alignment=TA_RIGHT))
+
+        self.details_style = TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2E7D32')),
+            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('FONTNAME', (0,0), (-1,-1), font_name),
+            ('FONTSIZE', (0,0), (-1,0), 11),
+            ('FONTSIZE', (0,1), (-1,-1), 10),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+        ])
+        sections = dict(table_config, bom=BOM_SECTION, labor=LABOR_SECTION)
+        self.plans = [SectionPlan(key, cfg) for key, cfg in sections.items()]
+        self.table_styles = {}
+        for key, cfg in sections.items():
+            self.table_styles[key] = TableStyle([
+                ('BACKGROUND', (0,0), (-1,0), colors.HexColor(cfg["color"])),
+                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+                ('ALIGN', (0,0), (-1,-1), cfg.get("align", 'CENTER')),
+                ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+                ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+                ('FONTNAME', (0,0), (-1,-1), font_name),
+                ('FONTSIZE', (0,0), (-1,0), 11),
+                ('FONTSIZE', (0,1), (-1,-1), 9),
+            ])
+
+    def add_page_number(self, canvas, doc):
+        canvas.setFont(self.font_name, 9)
+        canvas.drawRightString(195*mm, 10*mm, f"Страница {canvas.getPageNumber()}")
+
+
+_render_contexts = {}
+_render_contexts_lock = threading.Lock()
+
+
+def get_render_context(font_path=None, table_config=TABLE_CONFIG):
+    if font_path and not os.path.exists(font_path):
+        font_path = None
+    key = (font_path, json.dumps(table_config, sort_keys=True, ensure_ascii=False))
+    with _render_contexts_lock:
+        ctx = _render_contexts.get(key)
+        if ctx is None:
+            ctx = _render_contexts[key] = RenderContext(font_path, table_config)
+        return ctx
+
+
+# Единый рендер техпроцесса. Строки секций - кортежи CAPPDatabase.get_* или словари
+# с ключами из TABLE_CONFIG[...]["fields"]; реквизиты - кортежи (последние 5 значений).
+def generate_pdf(data, file_path, font_dir=FONT_DIR, progress_callback=None, is_cancelled=None):
+    # Этапы в метриках: story - построение содержимого, layout - вёрстка страниц,
+    # write - запись файла после последнего элемента
+    with timed('generate_pdf', model=data.get('model')) as span:
+        _build_pdf(data, file_path, font_dir, progress_callback, is_cancelled, span)
+
+
+def _build_pdf(data, file_path, font_dir, progress_callback, is_cancelled, span):
+    ctx = get_render_context(os.path.join(font_dir, 'DejaVuSans.ttf'))
+    styles = ctx.styles
 
     doc = SimpleDocTemplate(file_path, pagesize=A4, topMargin=20*mm, bottomMargin=20*mm, leftMargin=15*mm, rightMargin=15*mm)
     story = []
 
-    logo_path = os.path.join(os.path.dirname(__file__), 'logo.png')
-    if os.path.exists(logo_path):
-        story.append(Image(logo_path, width=50*mm, height=20*mm, hAlign='CENTER'))
+    if os.path.exists(LOGO_PATH):
+        story.append(Image(LOGO_PATH, width=50*mm, height=20*mm, hAlign='CENTER'))
         story.append(Spacer(1, 5*mm))
 
     story.append(Paragraph("ТЕХНОЛОГИЧЕСКИЙ ПРОЦЕСС", styles['TitleCenter']))
-    story.append(Paragraph(f"Модель: <b>{data['model']}</b>", styles['TitleCenter']))
+    story.append(Paragraph(f"Модель: <b>{escape(str(data['model']))}</b>", styles['TitleCenter']))
     story.append(Spacer(1, 10*mm))
 
-    if data['document_details']:
-        d = data['document_details'][0]
-        table_data = [["Параметр", "Значение"]] + [[k, v or "—"] for k, v in zip(["Организация", "Обозначение изделия", "Обозначение документа", "Разработал", "Проверил"], d)]
+    details = data.get('document_details', [])
+    if details:
+        table_data = [["Параметр", "Значение"]]
+        for row in details:
+            table_data += [[label, value or "—"] for label, value in zip(DETAIL_LABELS, row[-5:])]
         t = Table(table_data, colWidths=[50*mm, 120*mm])
-        t.setStyle(TableStyle([('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2E7D32')), ('TEXTCOLOR', (0,0), (-1,0), colors.white), ('GRID', (0,0), (-1,-1), 0.5, colors.grey)]))
-        story.append(Paragraph("Реквизиты", styles['Header']))
+        t.setStyle(ctx.details_style)
+        story.append(Paragraph("Реквизиты документа", styles['Header']))
         story.append(t)
         story.append(Spacer(1, 8*mm))
 
-    for key, cfg in TABLE_CONFIG.items():
-        items = data.get(key, [])
+    for plan in ctx.plans:
+        items = data.get(plan.key, [])
         if not items: continue
-        table_data = [cfg["headers"]]
-        for i, item in enumerate(items, 1):
-            row = []
-            for j, field in enumerate(cfg["fields"]):
-                val = str(item.get(field, "—"))
-                if j in cfg.get("wrap", []) and len(val) > 30:
-                    val = Paragraph(val, styles['Cell'])
-                row.append(val if field != "number" else (val or str(i)))
-            table_data.append(row)
-        col_widths = [w*mm for w in cfg["col_widths"]]
-        t = Table(table_data, colWidths=col_widths, rowHeights=cfg["row_height"]*mm)
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor(cfg["color"])),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-            ('FONTNAME', (0,0), (-1,-1), font_name),
-            ('FONTSIZE', (0,1), (-1,-1), 9),
-        ]))
-        story.append(Paragraph(cfg["title"], styles['Header']))
-        story.append(t)
+        story.append(Paragraph(plan.title, styles['Header']))
+        story.append(plan.table(items, styles['Cell'], ctx.table_styles[plan.key], doc.height - 2*FRAME_PADDING))
         story.append(Spacer(1, 8*mm))
 
-    story.append(Paragraph(f"Дата: {data['timestamp']}", ParagraphStyle(name='Footer', fontName=font_name, fontSize=9, alignment=TA_RIGHT)))
-    doc.build(story, onFirstPage=lambda c, d: c.drawString(180*mm, 10*mm, f"Страница {c.getPageNumber()}"))
+    story.append(Spacer(1, 7*mm))
+    story.append(Paragraph(f"Дата формирования: {data['timestamp']}", styles['Footer']))
+
+    if is_cancelled and is_cancelled():
+        raise ExportCancelled()
+    if progress_callback:
+        progress_callback(10)
+    span.mark('story')
+
+    # Прогресс - по строкам таблиц (секция выводится кусками по страницам) и остальным
+    # элементам story; служебные элементы ReportLab (смена страницы) не считаются
+    total = sum(getattr(flowable, 'section_rows', 1) for flowable in story)
+    story_ids = {id(flowable) for flowable in story}
+    laid_out = [0]
+    last_flowable = [None]
+
+    def after_flowable(flowable):
+        if is_cancelled and is_cancelled():
+            raise ExportCancelled()
+        if id(flowable) in story_ids or hasattr(flowable, 'section_rows'):
+            laid_out[0] += getattr(flowable, 'section_rows', 1)
+        last_flowable[0] = time.perf_counter()
+        if progress_callback:
+            progress_callback(10 + 90 * laid_out[0] // total)
+
+    doc.afterFlowable = after_flowable
+    doc.build(story, onFirstPage=ctx.add_page_number, onLaterPages=ctx.add_page_number)
+    span.mark('layout', last_flowable[0])
+    span.mark('write')
+    span.fields.update(flowables=total, pages=doc.page)
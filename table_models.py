@@ -0,0 +1,188 @@
+from itertools import islice
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QTableView, QAbstractItemView
+
+
+def text(value):
+    return "" if value is None else str(value)
+
+
+def hours(value):
+    return f"{value or 0:.2f}"
+
+
+# Модель таблицы над кортежами CAPPDatabase.get_*: источник (курсор или список)
+# читается порциями по мере прокрутки через canFetchMore/fetchMore, ячейки
+# форматируются только при отрисовке - без QTableWidgetItem на каждую ячейку.
+# После watch() модель слушает уведомления CAPPDatabase и правит только
+# затронутые строки вместо полной перезагрузки.
+class RowTableModel(QAbstractTableModel):
+    def __init__(self, headers, columns, batch_size=256, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.columns = columns  # [(позиция в кортеже, форматтер)]
+        self.batch_size = batch_size
+        self._rows = []
+        self._positions = {}  # id строки -> индекс в _rows
+        self._source = iter(())
+        self._exhausted = True
+        self._stale = False  # недочитанная часть источника устарела, см. on_db_change
+        self._db = None
+        self._table = None
+        self._scope = None
+        self._source_factory = None
+
+    def set_source(self, source):
+        self.beginResetModel()
+        self._close_source()
+        self._rows = []
+        self._positions = {}
+        self._source = iter(source)
+        self._exhausted = False
+        self._stale = False
+        self.endResetModel()
+
+    def _close_source(self):
+        # Недочитанный ленивый источник держит соединение и снимок БД - отпускаем его
+        close = getattr(self._source, "close", None)
+        if close:
+            close()
+        self._source = iter(())
+
+    def watch(self, db, table, scope, source_factory, source=None):
+        # scope - model_id строк этой таблицы (None для справочников);
+        # source_factory(after=None) - строки по возрастанию id, после after - только id > after;
+        # source - уже прочитанные строки (фоновая загрузка), иначе source_factory()
+        self.unwatch()
+        self._db = db
+        self._table = table
+        self._scope = scope
+        self._source_factory = source_factory
+        db.subscribe(self.on_db_change)
+        self.set_source(source_factory() if source is None else source)
+
+    def unwatch(self):
+        if self._db is not None:
+            self._db.unsubscribe(self.on_db_change)
+            self._db = None
+        if not self._exhausted:
+            self._close_source()
+            self._exhausted = True
+
+    def on_db_change(self, table, action, row_id, model_id):
+        if table != self._table:
+            return
+        if action == 'reset':
+            if model_id == self._scope:
+                self.set_source(self._source_factory())
+            return
+        if action == 'insert' and model_id != self._scope:
+            return
+        if row_id not in self._positions and not self._exhausted:
+            # Строка ещё не показана, а недочитанная часть источника - снимок до изменения.
+            # Следующая порция читается заново с последней показанной строки (по ключу),
+            # и строка из события придёт из fetchMore на своём месте в порядке запроса
+            self._stale = True
+            return
+        if action == 'insert':
+            row = self._db.get_row(table, row_id)
+            if row and row_id not in self._positions:
+                self.append_row(row)
+        elif row_id in self._positions:
+            if action == 'delete':
+                self.remove_row(row_id)
+            else:
+                row = self._db.get_row(table, row_id)
+                if row:
+                    self.replace_row(row)
+
+    def append_row(self, row):
+        pos = len(self._rows)
+        self.beginInsertRows(QModelIndex(), pos, pos)
+        self._rows.append(row)
+        self._positions[row[0]] = pos
+        self.endInsertRows()
+
+    def replace_row(self, row):
+        pos = self._positions[row[0]]
+        self._rows[pos] = row
+        self.dataChanged.emit(self.index(pos, 0), self.index(pos, len(self.columns) - 1))
+
+    def remove_row(self, row_id):
+        pos = self._positions.pop(row_id)
+        self.beginRemoveRows(QModelIndex(), pos, pos)
+        del self._rows[pos]
+        for i in range(pos, len(self._rows)):
+            self._positions[self._rows[i][0]] = i
+        self.endRemoveRows()
+
+    def row(self, index):
+        return self._rows[index]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            pos, fmt = self.columns[index.column()]
+            return fmt(row[pos])
+        if role == Qt.UserRole:
+            return row[0]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetch_all(self):
+        while self.canFetchMore():
+            self.fetchMore()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        if self._stale:
+            self._close_source()
+            self._source = iter(self._source_factory(after=self._rows[-1][0] if self._rows else None))
+            self._stale = False
+        batch = list(islice(self._source, self.batch_size))
+        if len(batch) < self.batch_size:
+            self._exhausted = True
+            self._close_source()
+        # строки, уже добавленные уведомлением append_row, не дублируем
+        batch = [row for row in batch if row[0] not in self._positions]
+        if batch:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(batch) - 1)
+            self._rows.extend(batch)
+            for i, row in enumerate(batch, start):
+                self._positions[row[0]] = i
+            self.endInsertRows()
+
+
+def make_table_view(headers, columns, style="font-size: 14px; color: #333;"):
+    view = QTableView()
+    view.setModel(RowTableModel(headers, columns, parent=view))
+    view.setSelectionBehavior(QAbstractItemView.SelectRows)
+    view.setSelectionMode(QAbstractItemView.SingleSelection)
+    view.horizontalHeader().setStretchLastSection(True)
+    view.setStyleSheet(style)
+    return view
+
+
+def current_row(view):
+    # Кортеж выбранной строки или None
+    index = view.currentIndex()
+    if not index.isValid():
+        return None
+    return view.model().row(index.row())
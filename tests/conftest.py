@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Окна Qt без дисплея; задаётся до первого импорта PyQt5 в модулях тестов
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from capp_db import CAPPDatabase  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = CAPPDatabase(str(tmp_path / "capp.db"))
+    yield database
+    database.close()
+
+
+@pytest.fixture(scope="session")
+def app():
+    QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
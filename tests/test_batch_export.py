@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+pytest.importorskip("reportlab")
+
+from batch_export import export_models_batch, pdf_file_names  # noqa: E402
+from pdf_cache import PDFCache  # noqa: E402
+
+
+def test_colliding_names_get_model_id():
+    names = pdf_file_names([(1, "A B"), (2, "A_B"), (3, "A/B"), (4, "C"), (5, "c"), (6, "D")])
+    assert names == {1: "Техпроцесс_A_B_1.pdf", 2: "Техпроцесс_A_B_2.pdf", 3: "Техпроцесс_A_B_3.pdf",
+                     4: "Техпроцесс_C_4.pdf", 5: "Техпроцесс_c_5.pdf", 6: "Техпроцесс_D.pdf"}
+
+
+def test_batch_export_writes_file_per_model(db, tmp_path):
+    for name in ["A B", "A_B", "A/B", "D"]:
+        db.insert_part(db.insert_model(name), "деталь", "P", 1)
+    out = tmp_path / "pdf"
+    result = export_models_batch(db, str(out), workers=1, cache=PDFCache(enabled=False))
+    assert result['failed'] == []
+    assert len(result['done']) == 4
+    assert sorted(os.listdir(out)) == sorted(os.path.basename(path) for path in result['done'])
+
+
+def test_repeated_names_exported_once(db, tmp_path):
+    for name in ["A", "B"]:
+        db.insert_part(db.insert_model(name), "деталь", "P", 1)
+    out = tmp_path / "pdf"
+    result = export_models_batch(db, str(out), ["A", "B", "A", "Нет такой", "B"], workers=2,
+                                 cache=PDFCache(enabled=False))
+    assert result['failed'] == [("Нет такой", "модель не найдена")]
+    assert sorted(os.listdir(out)) == ["Техпроцесс_A.pdf", "Техпроцесс_B.pdf"]
+    assert len(result['done']) == 2
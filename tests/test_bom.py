@@ -0,0 +1,71 @@
+import pytest
+
+from bom import BOMCycleError, BOMGraph
+
+# Ромб: Изделие -> Редуктор x2 -> Узел x3, Изделие -> Вал x1 -> Узел x2; Узел - 5 болтов
+MODELS = [(1, "Изделие"), (2, "Редуктор"), (3, "Вал"), (4, "Узел")]
+EDGES = [(1, 2, 2, "Редуктор"), (1, 3, 1, "Вал"), (2, 4, 3, "Узел"), (3, 4, 2, "Узел")]
+PARTS = [(1, 10, "Корпус", "К-1", 1), (2, 11, "Шестерня", "Ш-1", 2), (4, 12, "Болт", "Б-1", 5)]
+
+
+def graph(edges=EDGES):
+    return BOMGraph(MODELS, edges, PARTS)
+
+
+def test_explode_multiplies_quantities_down_the_diamond():
+    # Узел входит дважды: 2*3 + 1*2 = 8 узлов на изделие
+    assert graph().explode(1) == {("Корпус", "К-1"): 1, ("Шестерня", "Ш-1"): 4, ("Болт", "Б-1"): 40}
+    assert graph().explode(1, quantity=10)[("Болт", "Б-1")] == 400
+    assert graph().explode(3) == {("Болт", "Б-1"): 10}
+
+
+def test_implode_sums_every_path():
+    assert graph().implode(4) == {2: 3, 3: 2, 1: 8}
+    assert graph().implode(1) == {}
+
+
+def test_indented_expands_shared_assembly_in_each_place():
+    rows = graph().indented(1)
+    assert rows == [
+        (1, "Редуктор", "Редуктор", 2, 2),
+        (2, "Узел", "Узел", 3, 6),
+        (3, "Болт", "Б-1", 5, 30),
+        (2, "Шестерня", "Ш-1", 2, 4),
+        (1, "Вал", "Вал", 1, 1),
+        (2, "Узел", "Узел", 2, 2),
+        (3, "Болт", "Б-1", 5, 10),
+        (1, "Корпус", "К-1", 1, 1),
+    ]
+    assert graph().size(1) == len(rows)
+    assert graph().indented(1, limit=3) == rows[:3]
+    assert graph().indented(4) == [(1, "Болт", "Б-1", 5, 5)]
+
+
+def test_cycle_detected():
+    cyclic = graph(EDGES + [(4, 1, 1, "Изделие")])
+    with pytest.raises(BOMCycleError) as error:
+        cyclic.check(1)
+    assert error.value.cycle[0] == error.value.cycle[-1]
+    assert set(error.value.cycle) <= {"Изделие", "Редуктор", "Вал", "Узел"}
+    for walk in (cyclic.explode, cyclic.indented, cyclic.size, cyclic.implode):
+        with pytest.raises(BOMCycleError):
+            walk(1)
+    with pytest.raises(BOMCycleError) as error:
+        graph([(1, 1, 1, "Изделие")]).check(1)
+    assert error.value.cycle == ["Изделие", "Изделие"]
+
+
+def test_database_graph_follows_part_codes(db):
+    product, gearbox = db.insert_model("Изделие"), db.insert_model("Редуктор")
+    db.insert_part(product, "Редуктор в сборе", "Редуктор", 2)
+    db.insert_part(product, "Корпус", "К-1", 1)
+    db.insert_part(gearbox, "Шестерня", "Ш-1", 3)
+    assert db.has_subassemblies(product) and not db.has_subassemblies(gearbox)
+    assert db.get_bom().explode(product) == {("Корпус", "К-1"): 1, ("Шестерня", "Ш-1"): 6}
+
+    # граф перестраивается после правки любой модели
+    cycle = db.insert_part(gearbox, "Изделие", "Изделие", 1)
+    with pytest.raises(BOMCycleError):
+        db.get_bom().check(product)
+    db.delete_part(cycle)
+    assert db.get_bom().implode(gearbox) == {product: 2}
@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+# Бенчмарк записи спецификации: построчная фиксация против одной транзакции и
+# executemany. CAPP_BENCH=1 - спецификация на 5000 строк, как в реальных моделях.
+ROWS = 5000 if os.environ.get("CAPP_BENCH") else 1000
+
+
+def rows_per_second(write, repeat=3):
+    # лучший из нескольких прогонов: одиночный замер на тысяче строк шумный
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        write()
+        best = min(best, time.perf_counter() - started)
+    return ROWS / best
+
+
+def test_bulk_insert_is_faster_than_per_row_commits(db):
+    model_id = db.insert_model("A")
+    rows = [(f"деталь {i}", f"D{i}", 1) for i in range(ROWS)]
+
+    def per_row():
+        for row in rows:
+            db.insert_part(model_id, *row)
+
+    def in_transaction():
+        with db.transaction():
+            per_row()
+
+    speed = {
+        'построчно': rows_per_second(per_row),
+        'транзакция': rows_per_second(in_transaction),
+        'executemany': rows_per_second(lambda: db.insert_parts_many(model_id, rows)),
+    }
+    print("\n" + ", ".join(f"{name}: {value:.0f} строк/с" for name, value in speed.items()))
+    assert len(db.get_parts(model_id)) == 9 * ROWS
+    assert speed['транзакция'] > 2 * speed['построчно']
+    assert speed['executemany'] > 2 * speed['построчно']
+
+
+def test_error_inside_outer_transaction_rolls_back_everything(db):
+    model_id = db.insert_model("A")
+    bad = [("вал", "В-1", 1), (None, "без имени", 1)]
+    # вне транзакции ошибка становится результатом, частичной записи нет
+    assert db.insert_parts_many(model_id, bad) == 0
+    assert db.insert_part(model_id, None, "X", 1) is None
+
+    # внутри внешней транзакции ошибка доходит до неё, и откатываются все записи блока
+    with pytest.raises(sqlite3.Error):
+        with db.transaction():
+            db.insert_part(model_id, "ось", "О-1", 1)
+            db.insert_parts_many(model_id, bad)
+    with pytest.raises(sqlite3.Error):
+        with db.transaction():
+            db.insert_parts_many(model_id, bad[:1])
+            db.update_part(db.insert_part(model_id, "ось", "О-1", 1), None, "О-1", 1)
+    assert db.get_parts(model_id) == []
@@ -0,0 +1,49 @@
+import pytest
+
+
+def make_model(db, name, operations, equipment="Станок"):
+    model_id = db.insert_model(name)
+    for i in range(operations):
+        db.insert_operation(model_id, str(i + 1), f"{i:03d}", f"операция {i}", "", equipment, 0.5, 6.0)
+    return model_id
+
+
+def loads(capacity):
+    # Ненулевые загрузки, без следов вычитания и прибавления
+    return ({id: round(hours, 9) for id, hours in capacity.equipment_load.items() if abs(hours) > 1e-9},
+            {id: round(hours, 9) for id, hours in capacity.workshop_load.items() if abs(hours) > 1e-9})
+
+
+def test_unlinked_model_loads_every_workshop(db):
+    model_id = make_model(db, "A", 2)
+    workshops = [db.insert_workshop(f"Цех {i}", "", "") for i in range(2)]
+    capacity = db.get_capacity_plan({model_id: 10})
+    # 2 операции: Tподг 0.5 ч + 10 шт * 6 мин = 1.5 ч каждая
+    assert loads(capacity)[1] == {workshops[0]: 3.0, workshops[1]: 3.0}
+    names = {row[0]: row[1] for row in db.get_workshop()}
+    assert [row[1] for row in capacity.workshop_rows(names)] == ["Цех 0", "Цех 1"]
+
+
+def test_incremental_updates_match_full_rebuild(db):
+    a, b = make_model(db, "A", 2), make_model(db, "B", 1, equipment="Пресс")
+    first, second = (db.insert_workshop(name, "", "") for name in ("Цех 1", "Цех 2"))
+    db.set_model_workshops(a, [first])
+    capacity = db.get_capacity_plan({a: 10, b: 5})
+
+    steps = [
+        lambda: capacity.set_quantity(a, 20),
+        lambda: capacity.set_quantity(b, 0),
+        lambda: capacity.set_quantity(b, 3),
+        lambda: db.insert_operation(a, "9", "900", "ещё", "", "Пресс", 1.0, 12.0),
+        lambda: db.update_operation(db.get_operations(b)[0][0], "1", "000", "операция 0", "", "Станок", 2.0, 1.0),
+        lambda: db.set_model_workshops(b, [second]),
+        lambda: db.set_model_workshops(a, []),
+        lambda: db.insert_workshop("Цех 3", "", ""),
+        lambda: db.delete_operation(db.get_operations(a)[0][0]),
+    ]
+    for step in steps:
+        step()
+        assert db.refresh_capacity_plan(capacity)
+        rebuilt = loads(db.get_capacity_plan(dict(capacity.plan)))
+        for incremental, full in zip(loads(capacity), rebuilt):
+            assert incremental == pytest.approx(full)
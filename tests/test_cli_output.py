@@ -0,0 +1,44 @@
+import pytest
+
+import capp
+
+
+def cli(db, capsys, *args):
+    code = capp.main(["--db", db.pool.db_name, *args])
+    out, err = capsys.readouterr()
+    return code, out.splitlines(), err
+
+
+def test_bom_stdout_is_only_tsv(db, capsys):
+    product, unit = db.insert_model("Изделие"), db.insert_model("Узел")
+    db.insert_part(product, "Узел", "Узел", 2)
+    for i in range(3):
+        db.insert_part(unit, f"Деталь {i}", f"Д-{i}", 1)
+    code, out, err = cli(db, capsys, "bom", "--model", "Изделие", "--limit", "2")
+    assert code == 0
+    assert out[0].startswith("Уровень\t") and len(out) == 3
+    assert all(line.count("\t") == 4 for line in out)
+    assert "показано 2 из 4" in err
+
+    code, out, err = cli(db, capsys, "bom", "--model", "Нет такой")
+    assert (code, out) == (1, []) and "не найдена" in err
+
+
+def test_database_errors_go_to_stderr(db, capsys):
+    model_id = db.insert_model("A")
+    capsys.readouterr()
+    assert db.insert_part(model_id, None, "X", 1) is None
+    out, err = capsys.readouterr()
+    assert out == "" and "Ошибка вставки детали" in err
+
+
+def test_import_summary_goes_to_stderr(db, capsys, tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    wb.active.title = "Лист1"
+    wb.active.append(["№", "Номенклатура", "Количество"])
+    wb.active.append(["В-1", "Вал", 2])
+    wb.save(tmp_path / "bom.xlsx")
+    code, out, err = cli(db, capsys, "import-bom", str(tmp_path / "bom.xlsx"), "--model", "A", "--create")
+    assert (code, out) == (0, [])
+    assert "Импортировано строк: 1" in err
@@ -0,0 +1,57 @@
+def make_model(db, name="Исходная"):
+    model_id = db.insert_model(name)
+    db.insert_parts_many(model_id, [(f"деталь {i}", f"D{i}", i + 1) for i in range(5)])
+    for i in range(3):
+        db.insert_operation(model_id, str((i + 1) * 5), f"{i:03d}", f"операция {i}", f"описание {i}",
+                            f"станок {i % 2}", 0.5 * i, 1.25 + i)
+    db.insert_document_details(model_id, "Завод", "ИЗД-1", "ТП-1", "Иванов", "Петров")
+    workshops = [db.insert_workshop(f"Цех {i}", "Участок", "РМ") for i in range(3)]
+    db.set_model_workshops(model_id, workshops[:2])
+    return model_id
+
+
+def content(db, model_id):
+    # Строки модели без собственных id
+    return {
+        'parts': [row[1:] for row in db.get_parts(model_id)],
+        'operations': [row[1:] for row in db.get_operations(model_id)],
+        'document_details': [row[2:] for row in db.get_document_details(model_id)],
+        'workshops': db.get_model_workshops(model_id),
+    }
+
+
+def test_clone_copies_model_rows(db):
+    src_id = make_model(db)
+    new_id = db.clone_model(src_id, "Копия")
+    assert new_id is not None and new_id != src_id
+    assert db.get_model_id("Копия") == new_id
+    original, copy = content(db, src_id), content(db, new_id)
+    assert copy == original
+    assert len(copy['parts']) == 5 and len(copy['operations']) == 3 and len(copy['workshops']) == 2
+
+
+def test_clone_has_own_revision(db):
+    src_id = make_model(db)
+    new_id = db.clone_model(src_id, "Копия")
+    src_revision = db.get_revision(src_id)
+    assert db.get_revision(new_id)[0] > 0
+    snapshot = db.get_process_snapshot("Копия")
+    assert snapshot['model'] == "Копия" and len(snapshot['parts']) == 5
+
+    # правка копии не трогает исходную модель и сбрасывает снимок копии
+    db.insert_part(new_id, "новая", "N", 1)
+    assert db.get_revision(src_id) == src_revision
+    assert len(db.get_parts(src_id)) == 5
+    assert len(db.get_process_snapshot("Копия")['parts']) == 6
+
+
+def test_clone_to_existing_name_returns_none(db, capsys):
+    src_id = make_model(db)
+    other_id = db.insert_model("Занята")
+    parts = len(db.get_parts(src_id))
+    assert db.clone_model(src_id, "Занята") is None
+    assert "Ошибка копирования модели" in capsys.readouterr().err
+    # транзакция откатилась целиком: ни новой модели, ни лишних строк
+    assert [name for _, name in db.get_models()] == ["Исходная", "Занята"]
+    assert db.get_parts(other_id) == []
+    assert len(db.get_parts(src_id)) == parts
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+
+def test_write_from_other_thread_waits_for_transaction(db):
+    model_id = db.insert_model("A")
+    started, inserted = threading.Event(), []
+
+    def other():
+        started.wait()
+        inserted.append(db.insert_part(model_id, "x", "X", 1))
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert_part(model_id, "откат", "R", 1)
+            started.set()
+            time.sleep(0.2)
+            raise RuntimeError
+    thread.join()
+    # запись другого потока не вошла в откаченную транзакцию
+    assert inserted[0] and db.get_row('parts', inserted[0])
+    assert [row[1] for row in db.get_parts(model_id)] == ["x"]
+
+
+def test_concurrent_reads_and_writes(db):
+    model_id = db.insert_model("A")
+    writers, per_writer = 4, 50
+    ids, errors, read_latency = [], [], []
+    stop = threading.Event()
+
+    def write(n):
+        for i in range(per_writer):
+            row_id = db.insert_part(model_id, f"w{n}-{i}", "W", 1)
+            if row_id is None:
+                errors.append((n, i))
+            ids.append(row_id)
+
+    def rollback_loop():
+        # длинные транзакции, которые откатываются, пока пишут другие потоки
+        while not stop.is_set():
+            try:
+                with db.transaction():
+                    db.insert_part(model_id, "откат", "R", 1)
+                    time.sleep(0.01)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+    def read():
+        while not stop.is_set():
+            started = time.perf_counter()
+            db.get_parts(model_id)
+            db.get_process_snapshot("A")
+            read_latency.append(time.perf_counter() - started)
+
+    background = [threading.Thread(target=rollback_loop)] + [threading.Thread(target=read) for _ in range(3)]
+    for thread in background:
+        thread.start()
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    for thread in background:
+        thread.join()
+
+    assert not errors
+    names = {row[1] for row in db.get_parts(model_id)}
+    assert names == {f"w{n}-{i}" for n in range(writers) for i in range(per_writer)}
+    assert all(db.get_row('parts', row_id) for row_id in ids)
+    assert read_latency
+
+
+def test_readers_do_not_wait_for_writer(db):
+    model_id = db.insert_model("A")
+    db.insert_parts_many(model_id, [(f"p{i}", "P", 1) for i in range(1000)])
+    in_transaction, done = threading.Event(), threading.Event()
+
+    def long_write():
+        with db.transaction():
+            db.insert_part(model_id, "new", "N", 1)
+            in_transaction.set()
+            done.wait(5)
+
+    writer = threading.Thread(target=long_write)
+    writer.start()
+    in_transaction.wait()
+    started = time.perf_counter()
+    rows = db.get_parts(model_id)
+    elapsed = time.perf_counter() - started
+    done.set()
+    writer.join()
+    # чтение идёт по своему снимку WAL и не ждёт незафиксированную запись
+    assert len(rows) == 1000
+    assert elapsed < 0.5
@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+ROWS = [
+    ("Д-1", "Вал", 2, "лишняя колонка"),
+    ("Д-2", None, 1, ""),           # без наименования - пропускается
+    ("Д-3", "Ось", None, ""),       # без количества - пропускается
+    (None, "Втулка", 4, ""),        # без кода - вставляется
+    ("Д-5",),                       # короткая строка - пропускается
+    ("Д-6", "Шайба", 0, ""),
+    ("Д-7", "Гайка", 8, ""),
+]
+
+
+def workbook(path, sheet="Лист1", headers=("№", "Номенклатура", "Количество", "Примечание")):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = sheet
+    ws.append(headers)
+    for row in ROWS:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def test_import_skips_bad_rows(db, tmp_path):
+    model_id = db.insert_model("A")
+    progress = []
+    # пачки по 2 строки - несколько вызовов insert_parts_many в одной транзакции
+    imported = db.import_from_excel(workbook(tmp_path / "bom.xlsx"), "A", chunk_size=2,
+                                    progress_callback=lambda count, speed: progress.append(count))
+    assert imported == 4
+    assert progress[-1] == 4
+    assert [row[1:] for row in db.get_parts(model_id)] == [
+        ("Вал", "Д-1", 2), ("Втулка", None, 4), ("Шайба", "Д-6", 0), ("Гайка", "Д-7", 8)]
+
+
+def test_import_rejects_bad_workbook(db, tmp_path):
+    model_id = db.insert_model("A")
+    assert db.import_from_excel(workbook(tmp_path / "sheet.xlsx", sheet="Спецификация"), "A") == 0
+    assert db.import_from_excel(workbook(tmp_path / "cols.xlsx", headers=("Код", "Номенклатура", "Количество")), "A") == 0
+    assert db.import_from_excel(workbook(tmp_path / "bom.xlsx"), "Нет такой") == 0
+    assert db.get_parts(model_id) == []
+
+
+def test_failed_chunk_cancels_whole_import(db, tmp_path, monkeypatch):
+    model_id = db.insert_model("A")
+    insert, calls = db.insert_parts_many, []
+
+    def failing(model, chunk):
+        calls.append(chunk)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError("database is locked")
+        return insert(model, chunk)
+    monkeypatch.setattr(db, "insert_parts_many", failing)
+    assert db.import_from_excel(workbook(tmp_path / "bom.xlsx"), "A", chunk_size=2) == 0
+    # первая пачка уже была вставлена, но откатилась вместе с транзакцией импорта
+    assert db.get_parts(model_id) == []
@@ -0,0 +1,47 @@
+from capp import main
+
+
+def make_model(db, name, operations=2):
+    model_id = db.insert_model(name)
+    for i in range(operations):
+        db.insert_operation(model_id, str(i + 1), f"{i:03d}", f"операция {i}", "", "Станок", 1.0, 30.0)
+    return model_id
+
+
+def workshop_hours(rollup):
+    return {name: total for _, name, *_, total in rollup.workshops}
+
+
+def test_unlinked_model_counts_in_every_shown_workshop(db):
+    model_id = make_model(db, "A")
+    for name in ("Цех 1", "Цех 2"):
+        db.insert_workshop(name, "", "")
+    rollup = db.get_labor_rollup(batch_size=2)
+    # цеха в сводке - те же, что показываются для модели
+    shown = [row[1] for row in db.get_model_workshops(model_id)]
+    assert list(workshop_hours(rollup)) == shown == ["Цех 1", "Цех 2"]
+    # 2 операции: Tподг 1 ч + 2 шт * 30 мин = 2 ч каждая
+    assert workshop_hours(rollup) == {"Цех 1": 4.0, "Цех 2": 4.0}
+    assert db.get_labor_rollup(model_ids=[model_id]).workshops == db.get_labor_rollup().workshops
+
+
+def test_linked_model_counts_only_in_its_workshops(db):
+    linked, unlinked = make_model(db, "A"), make_model(db, "B", operations=1)
+    first, second = (db.insert_workshop(name, "", "") for name in ("Цех 1", "Цех 2"))
+    db.set_model_workshops(linked, [second])
+    assert [row[0] for row in db.get_model_workshops(linked)] == [second]
+    hours = workshop_hours(db.get_labor_rollup())
+    assert hours == {"Цех 1": 1.5, "Цех 2": 4.5}
+
+
+def test_workshops_command_links_model(db, capsys):
+    make_model(db, "A")
+    first, second = (db.insert_workshop(name, "", "") for name in ("Цех 1", "Цех 2"))
+    path = db.pool.db_name
+    assert main(["--db", path, "workshops", "--model", "A", "--set", str(second)]) == 0
+    assert capsys.readouterr().out.splitlines()[1:] == [f"{second}\tЦех 2\t\t"]
+    assert main(["--db", path, "labor", "--by", "workshops"]) == 0
+    assert "Цех 2" in capsys.readouterr().out
+    assert main(["--db", path, "workshops", "--model", "A", "--clear"]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 3
+    assert main(["--db", path, "workshops", "--model", "A", "--set", "999"]) == 1
@@ -0,0 +1,24 @@
+def fill(db, parts=3000):
+    model_id = db.insert_model("A")
+    db.insert_parts_many(model_id, [(f"деталь {i} " + "x" * 200, f"D{i}", 1) for i in range(parts)])
+    return model_id
+
+
+def test_reclaimed_pages_not_negative(db):
+    # Свободных страниц нет, а слияние индекса поиска и ANALYZE занимают новые
+    fill(db)
+    report = db.maintenance()
+    assert report['free_pages'] == 0
+    assert report['reclaimed_pages'] >= 0
+    assert report['free_pages_after'] >= 0
+
+
+def test_freed_pages_reclaimed(db):
+    model_id = fill(db)
+    db.maintenance()
+    db.delete_model(model_id)
+    report = db.maintenance()
+    assert report['free_pages'] > 0
+    if report['incremental']:
+        assert report['reclaimed_pages'] > 0
+        assert report['free_pages_after'] < report['free_pages']
@@ -0,0 +1,64 @@
+import json
+import sqlite3
+
+import pytest
+
+import metrics
+from metrics import normalize_sql, timed, trace_sql
+
+
+def test_normalize_sql_folds_literals_and_in_lists():
+    assert normalize_sql("SELECT * FROM parts WHERE code = 'Ш-''12' AND quantity > 2.5e3 AND data = X'0aF'") == \
+        "SELECT * FROM parts WHERE code = ? AND quantity > ? AND data = ?"
+    short = normalize_sql("SELECT name FROM models WHERE id IN (1, 2) ORDER BY name")
+    long = normalize_sql("SELECT name FROM models\n  WHERE id IN ( 10,20 , 30,'40' ) ORDER BY name")
+    assert short == long == "SELECT name FROM models WHERE id IN (...) ORDER BY name"
+    # числа в именах и подзапросы IN не трогаются
+    assert normalize_sql("SELECT t1.id FROM t1 WHERE id IN (SELECT value FROM json_each('[1,2]'))") == \
+        "SELECT t1.id FROM t1 WHERE id IN (SELECT value FROM json_each(?))"
+
+
+@pytest.fixture
+def metrics_file(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.jsonl"
+    monkeypatch.setattr(metrics, "METRICS_PATH", str(path))
+    monkeypatch.setattr(metrics, "TRACE_SQL", True)
+    return lambda: [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_trace_sql_counts_statements(metrics_file):
+    conn = sqlite3.connect(":memory:", isolation_level=None)  # без неявного BEGIN
+    trace_sql(conn)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)")
+    with timed('load', model="A") as span:
+        conn.executemany("INSERT INTO t (name) VALUES (?)", [("a",), ("b",), ("c",)])
+        span.mark('insert')
+        for ids in ((1,), (1, 2), (1, 2, 3)):
+            conn.execute(f"SELECT name FROM t WHERE id IN ({', '.join('?' * len(ids))})", ids).fetchall()
+        with timed('inner'):
+            conn.execute("SELECT count(*) FROM t").fetchone()
+    conn.close()
+
+    inner, outer = metrics_file()
+    assert inner['event'] == 'inner' and inner['sql']['count'] == 1
+    # запрос вложенного замера не засчитан объемлющему; executemany - запрос на строку
+    assert outer['event'] == 'load' and outer['model'] == "A" and set(outer['stages_ms']) == {'insert'}
+    assert outer['sql']['count'] == 6
+    assert {entry['sql']: entry['count'] for entry in outer['sql']['top']} == {
+        "INSERT INTO t (name) VALUES (?)": 3,
+        "SELECT name FROM t WHERE id IN (...)": 3,
+    }
+
+
+def test_database_statements_counted(metrics_file, tmp_path, monkeypatch):
+    from capp_db import CAPPDatabase
+    monkeypatch.setattr(metrics, "SQL_TOP", 100)  # в топ-10 по времени быстрый запрос попадает не всегда
+    db = CAPPDatabase(str(tmp_path / "capp.db"))  # соединения пула открываются с трассировкой
+    try:
+        db.insert_model("A")
+        db.get_process_snapshot("A")
+    finally:
+        db.close()
+    snapshot, = [record for record in metrics_file() if record['event'] == 'get_process_snapshot']
+    assert snapshot['sql']['count'] >= 5
+    assert "SELECT id FROM models WHERE name = ?" in {entry['sql'] for entry in snapshot['sql']['top']}
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from capp_prototype import EditTPDialog  # noqa: E402
+
+
+def fill_models(db, models=5, parts=2000):
+    with db.transaction():
+        for m in range(models):
+            model_id = db.insert_model(f"M{m}")
+            db.insert_parts_many(model_id, [(f"деталь {m}-{i}", f"P{m}-{i}", 1) for i in range(parts)])
+
+
+def switch(app, dialog, name, timeout=5.0):
+    # Время от выбора модели до строк в таблице, без паузы перебора списка
+    started = time.perf_counter()
+    dialog.model_combo.setCurrentText(name)
+    dialog.load_timer.stop()
+    dialog.load_model_data()
+    model = dialog.parts_table.model()
+    while time.perf_counter() - started < timeout:
+        app.processEvents()
+        if model.canFetchMore():
+            model.fetchMore()  # первую порцию строк видимая таблица запрашивает сама
+        if model.rowCount() and model.data(model.index(0, 1)).startswith(f"деталь {name[1:]}-"):
+            return time.perf_counter() - started
+        time.sleep(0.001)
+    raise AssertionError(f"модель {name} не загружена за {timeout} с")
+
+
+def test_model_switch_latency(app, db):
+    fill_models(db)
+    dialog = EditTPDialog(db)
+    try:
+        switch(app, dialog, "M0")
+        readers = len(db.pool._readers)
+        latencies = [switch(app, dialog, f"M{i % 5}") for i in range(1, 21)]
+        print(f"\nпереключение модели: медиана {sorted(latencies)[10] * 1000:.1f} мс, "
+              f"максимум {max(latencies) * 1000:.1f} мс")
+        assert max(latencies) < 1.0
+        # соединения потоков пула закрываются после каждой загрузки
+        assert len(db.pool._readers) == readers == 1
+    finally:
+        dialog.done(0)
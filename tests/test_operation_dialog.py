@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtCore import Qt  # noqa: E402
+from PyQt5.QtTest import QTest  # noqa: E402
+
+from capp_prototype import OperationDialog  # noqa: E402
+
+
+def test_enter_does_not_add_typed_text_to_shared_lists(app, db):
+    db.insert_catalog_operation("010", "Токарная")
+    dialog = OperationDialog(is_edit_db=True, db=db)
+    names = dialog.name_combo.model()
+    before = names.stringList()
+    dialog.name_combo.lineEdit().setText("Опечатка")
+    QTest.keyClick(dialog.name_combo.lineEdit(), Qt.Key_Return)
+    dialog.code_combo.lineEdit().setText("999")
+    QTest.keyClick(dialog.code_combo.lineEdit(), Qt.Key_Return)
+    assert dialog.get_values() == ("999", "Опечатка")
+    assert names.stringList() == before
+
+    # следующий диалог видит только справочник
+    other = OperationDialog(is_edit_db=True, db=db)
+    assert other.name_combo.model().stringList() == ["Токарная"]
+    assert other.code_combo.model().stringList() == ["010"]
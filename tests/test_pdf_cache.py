@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+pytest.importorskip("reportlab")
+
+import pdf_cache  # noqa: E402
+from pdf_cache import PDFCache, render_pdf  # noqa: E402
+
+
+def process(model="M", timestamp="2026-01-01 00:00:00"):
+    return {'model': model, 'parts': [(1, "Вал", "В-1", 2)],
+            'operations': [(1, "5", "010", "Токарная", "", "Станок", None, 0.5, 1.0)],
+            'workshops': [], 'equipment': [], 'document_details': [], 'timestamp': timestamp}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PDFCache(str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024, enabled=True)
+
+
+def entries(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.endswith(".pdf"))
+
+
+def no_render(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("PDF отрисован заново")
+    monkeypatch.setattr(pdf_cache, "generate_pdf", fail)
+
+
+def test_hit_after_identical_render(cache, tmp_path, monkeypatch):
+    first, second = tmp_path / "first.pdf", tmp_path / "second.pdf"
+    assert render_pdf(process(), str(first), cache=cache) is False
+    no_render(monkeypatch)
+    progress = []
+    # время формирования в ключ не входит: тот же документ берётся из кэша
+    assert render_pdf(process(timestamp="2026-02-02 12:00:00"), str(second), cache=cache,
+                      progress_callback=progress.append) is True
+    assert second.read_bytes() == first.read_bytes()
+    assert progress == [100]
+    assert len(entries(cache)) == 1
+
+
+def test_miss_after_data_or_template_change(cache, tmp_path, monkeypatch):
+    out = str(tmp_path / "out.pdf")
+    render_pdf(process(), out, cache=cache)
+    changed = process()
+    changed['parts'] = [(1, "Вал", "В-1", 3)]
+    assert render_pdf(changed, out, cache=cache) is False
+    monkeypatch.setattr(pdf_cache, "TEMPLATE_VERSION", pdf_cache.TEMPLATE_VERSION + 1)
+    assert render_pdf(process(), out, cache=cache) is False
+    assert len(entries(cache)) == 3
+
+
+def test_refresh_replaces_entry(cache, tmp_path):
+    out = tmp_path / "out.pdf"
+    render_pdf(process(), str(out), cache=cache)
+    old = out.read_bytes()
+    refresh = PDFCache(cache.cache_dir, enabled=True, refresh=True)
+    assert render_pdf(process(timestamp="2026-02-02 12:00:00"), str(out), cache=refresh) is False
+    assert out.read_bytes() != old
+    # следующий экспорт получает документ с новой датой
+    again = tmp_path / "again.pdf"
+    assert render_pdf(process(), str(again), cache=cache) is True
+    assert again.read_bytes() == out.read_bytes()
+
+
+def test_eviction_at_size_limit(cache, tmp_path):
+    font_path = os.path.join(pdf_cache.FONT_DIR, "DejaVuSans.ttf")
+    paths = {}
+    for i, model in enumerate("ABC"):
+        render_pdf(process(model), str(tmp_path / "out.pdf"), cache=cache)
+        paths[model] = os.path.join(cache.cache_dir, cache.key(process(model), font_path) + ".pdf")
+        os.utime(paths[model], (1000 + i, 1000 + i))
+    # предел на два документа: вытесняется давно не использованный A
+    cache.max_bytes = os.path.getsize(paths["B"]) + os.path.getsize(paths["C"])
+    cache.evict()
+    assert [os.path.exists(paths[model]) for model in "ABC"] == [False, True, True]
+
+
+def test_disabled_cache_always_renders(tmp_path):
+    cache = PDFCache(str(tmp_path / "cache"), enabled=False)
+    out = str(tmp_path / "out.pdf")
+    assert render_pdf(process(), out, cache=cache) is False
+    assert render_pdf(process(), out, cache=cache) is False
+    assert not os.path.exists(cache.cache_dir)
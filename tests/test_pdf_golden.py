@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+pytest.importorskip("reportlab")
+pypdf = pytest.importorskip("pypdf")
+
+from config import TABLE_CONFIG, LABOR_SECTION, BOM_SECTION  # noqa: E402
+from pdf_generator import generate_pdf  # noqa: E402
+
+# Эталонный текст PDF по страницам. После намеренной правки вёрстки эталон
+# пересобирается: CAPP_UPDATE_GOLDEN=1 python -m pytest tests/test_pdf_golden.py
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "process.txt")
+PAGE_BREAK = "\n=== страница ===\n"
+SECTIONS = dict(TABLE_CONFIG, bom=BOM_SECTION, labor=LABOR_SECTION)
+
+
+def process():
+    # Все секции, перенос длинных значений, пустые значения и таблица на несколько страниц
+    return {
+        'model': 'Редуктор <Р-1>',
+        'parts': [(i, f"Деталь {i}" + (" с очень длинным наименованием" if i % 7 == 0 else ""), f"D-{i:03d}", i % 5 + 1)
+                  for i in range(1, 41)],
+        'operations': [(i, str(i * 5), f"{i:03d}", f"Операция {i}" + (" токарная черновая и чистовая" if i % 3 == 0 else ""),
+                        i % 4 + 1, f"Станок {i % 4 + 1}", None, 0.25 * i, 1.5 + i)
+                       for i in range(1, 61)],
+        'workshops': [(1, "Цех 1", "Участок А", "РМ-1"), (2, "Цех 2", "", "РМ-7")],
+        'equipment': [(1, "Станок 1", "16К20", ""), (2, "Станок 2 с числовым программным управлением", "ЧПУ-5", "Поверка раз в год")],
+        'document_details': [(1, 1, "Иванов", "Петров", "Сидоров", "Кузнецов", "ТП-001")],
+        'labor': [(1, "Станок 1", 15, 12.5, 160.0, 10, 39.17), (2, "Станок 2", 15, 3.0, 175.0, 10, 32.17)],
+        'bom': [(1, "Сборка", "", 1, 1), (2, "Вал", "В-1", 2, 2), (2, "Шестерня", "Ш-3", 4, 4)],
+        'timestamp': '2026-01-01 00:00:00',
+    }
+
+
+def as_dicts(data):
+    result = dict(data)
+    for key, cfg in SECTIONS.items():
+        index = cfg.get("row_index", list(range(len(cfg["fields"]))))
+        result[key] = [{field: row[i] for field, i in zip(cfg["fields"], index)} for row in data[key]]
+    return result
+
+
+def render_text(data, path):
+    generate_pdf(data, path)
+    return PAGE_BREAK.join(page.extract_text() for page in pypdf.PdfReader(path).pages)
+
+
+def test_matches_golden(tmp_path):
+    text = render_text(process(), str(tmp_path / "process.pdf"))
+    if os.environ.get("CAPP_UPDATE_GOLDEN"):
+        os.makedirs(os.path.dirname(GOLDEN), exist_ok=True)
+        with open(GOLDEN, "w", encoding="utf-8") as f:
+            f.write(text)
+    with open(GOLDEN, encoding="utf-8") as f:
+        expected = f.read()
+    assert text.split(PAGE_BREAK) == expected.split(PAGE_BREAK)
+
+
+def test_dict_rows_render_like_tuples(tmp_path):
+    assert render_text(as_dicts(process()), str(tmp_path / "dicts.pdf")) == render_text(process(), str(tmp_path / "tuples.pdf"))
@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("reportlab")
+pypdf = pytest.importorskip("pypdf")
+
+from pdf_generator import generate_pdf  # noqa: E402
+
+HEADER = "Оборудование"
+
+
+def operations(count):
+    return [(i, str(i), f"{i:03d}", f"Операция {i} с длинным наименованием для переноса", "", "Станок", None, 0.5, 1.25)
+            for i in range(count)]
+
+
+def process(count):
+    return {'model': 'M', 'parts': [], 'operations': operations(count), 'workshops': [], 'equipment': [],
+            'document_details': [], 'timestamp': '2026-01-01 00:00:00'}
+
+
+def test_header_once_per_page(tmp_path):
+    path = str(tmp_path / "ops.pdf")
+    progress = []
+    generate_pdf(process(1500), path, progress_callback=progress.append)
+    pages = [page.extract_text() for page in pypdf.PdfReader(path).pages]
+    assert len(pages) > 10
+    # шапка в начале секции и наверху каждой следующей страницы, без повторов внутри
+    assert all(text.count(HEADER) == 1 for text in pages)
+    assert progress == sorted(progress) and progress[-1] == 100
+
+
+def test_all_rows_rendered(tmp_path):
+    path = str(tmp_path / "ops.pdf")
+    generate_pdf(process(700), path)
+    text = "".join(page.extract_text() for page in pypdf.PdfReader(path).pages)
+    assert "Операция 0 " in text and "Операция 699 " in text
+
+
+# Бенчмарк: время рендера растёт линейно с числом операций.
+# CAPP_BENCH=1 добавляет прогон на 50 000 строк.
+def test_render_time_is_linear(tmp_path):
+    sizes = [1000, 4000] + ([50000] if os.environ.get("CAPP_BENCH") else [])
+    per_row = []
+    for size in sizes:
+        started = time.perf_counter()
+        generate_pdf(process(size), str(tmp_path / f"{size}.pdf"))
+        elapsed = time.perf_counter() - started
+        per_row.append(elapsed / size)
+        print(f"{size} строк: {elapsed:.2f} с, {elapsed / size * 1000:.3f} мс/строку")
+    assert max(per_row) < 2.5 * min(per_row)
+
+
+def test_row_taller_than_page_is_truncated(tmp_path):
+    # Наименование на несколько страниц: раньше LayoutError и весь документ в ошибках
+    data = process(30)
+    long_name = " ".join(f"переход{i}" for i in range(3000))
+    data['operations'][5] = data['operations'][5][:3] + (long_name,) + data['operations'][5][4:]
+    path = str(tmp_path / "long.pdf")
+    generate_pdf(data, path)
+    text = "".join(page.extract_text() for page in pypdf.PdfReader(path).pages)
+    assert "переход0 " in text and "переход2999" not in text and "…" in text
+    assert "Операция 29 " in text
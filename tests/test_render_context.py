@@ -0,0 +1,46 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("reportlab")
+
+import pdf_generator  # noqa: E402
+from config import TABLE_CONFIG  # noqa: E402
+from pdf_generator import FONT_DIR, generate_pdf, get_render_context  # noqa: E402
+
+FONT_PATH = os.path.join(FONT_DIR, 'DejaVuSans.ttf')
+# Бенчмарк подряд идущих рендеров, как в пакетном экспорте. CAPP_BENCH=1 - 1000 документов.
+RENDERS = 1000 if os.environ.get("CAPP_BENCH") else 50
+
+
+def process(i):
+    return {'model': f"M{i}", 'parts': [(j, f"Деталь {j}", f"D{j}", 1) for j in range(20)],
+            'operations': [(j, str(j), f"{j:03d}", f"Операция {j}", "", "Станок", None, 0.5, 1.0) for j in range(20)],
+            'workshops': [], 'equipment': [], 'document_details': [], 'timestamp': '2026-01-01 00:00:00'}
+
+
+def test_context_cached_by_font_and_config():
+    ctx = get_render_context(FONT_PATH)
+    assert get_render_context(FONT_PATH) is ctx
+    changed = dict(TABLE_CONFIG, parts=dict(TABLE_CONFIG['parts'], col_widths=[90, 45, 20]))
+    assert get_render_context(FONT_PATH, changed) is not ctx
+
+
+def test_back_to_back_renders_reuse_context(tmp_path, monkeypatch):
+    generate_pdf(process(0), str(tmp_path / "warm.pdf"))
+
+    # шрифт и стили уже в кэше - повторный разбор TTF или таблица стилей были бы ошибкой
+    def fail(*args, **kwargs):
+        raise AssertionError("контекст рендера собран заново")
+    monkeypatch.setattr(pdf_generator, "TTFont", fail)
+    monkeypatch.setattr(pdf_generator, "getSampleStyleSheet", fail)
+
+    times = []
+    for i in range(RENDERS):
+        started = time.perf_counter()
+        generate_pdf(process(i), str(tmp_path / "doc.pdf"))
+        times.append(time.perf_counter() - started)
+    times.sort()
+    print(f"\n{RENDERS} рендеров: медиана {times[len(times) // 2] * 1000:.1f} мс/док, "
+          f"всего {sum(times):.2f} с")
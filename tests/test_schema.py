@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from capp_db import CAPPDatabase, ROW_QUERIES, SCHEMA_MIGRATIONS
+
+LATEST = SCHEMA_MIGRATIONS[-1][0]
+
+# Схема capp.db до миграций (user_version = 0)
+OLD_SCHEMA = """
+    CREATE TABLE models (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE parts (id INTEGER PRIMARY KEY AUTOINCREMENT, model_id INTEGER, name TEXT NOT NULL, code TEXT,
+                        quantity INTEGER, FOREIGN KEY (model_id) REFERENCES models(id));
+    CREATE TABLE operations (id INTEGER PRIMARY KEY AUTOINCREMENT, model_id INTEGER, number TEXT, code TEXT,
+                             name TEXT NOT NULL, description TEXT, equipment TEXT, document TEXT,
+                             prep_time REAL DEFAULT 0.0, unit_time REAL DEFAULT 0.0,
+                             FOREIGN KEY (model_id) REFERENCES models(id));
+    CREATE TABLE workshop (id INTEGER PRIMARY KEY AUTOINCREMENT, workshop_name TEXT NOT NULL, section TEXT, rm TEXT);
+    CREATE TABLE equipment (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, article TEXT, note TEXT);
+    CREATE TABLE document_details (id INTEGER PRIMARY KEY AUTOINCREMENT, model_id INTEGER, organization TEXT NOT NULL,
+                                   product_code TEXT, document_code TEXT, developed_by TEXT, checked_by TEXT,
+                                   FOREIGN KEY (model_id) REFERENCES models(id));
+    INSERT INTO models (name) VALUES ('Старая');
+    INSERT INTO parts (model_id, name, code, quantity) VALUES (1, 'Вал', 'В-1', 2);
+    INSERT INTO operations (model_id, number, code, name, description, equipment, prep_time, unit_time)
+        VALUES (1, '5', '010', 'Токарная', '', 'Станок', 0.5, 2.0);
+    INSERT INTO operations (model_id, code, name) VALUES (NULL, '020', 'Фрезерная');
+    INSERT INTO document_details (model_id, organization) VALUES (1, 'Завод');
+"""
+
+
+def plan(db, sql, params):
+    return [row[-1] for row in db.conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def test_old_database_upgraded_in_place(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA)
+    conn.close()
+
+    db = CAPPDatabase(path)
+    try:
+        assert db.conn.execute("PRAGMA user_version").fetchone()[0] == LATEST
+        model_id = db.get_model_id("Старая")
+        assert [row[1:] for row in db.get_parts(model_id)] == [("Вал", "В-1", 2)]
+        assert [row[1:4] for row in db.get_operations(model_id)] == [("5", "010", "Токарная")]
+        assert {row[1:] for row in db.get_operation_catalog()} >= {("010", "Токарная"), ("020", "Фрезерная")}
+        assert [row[1] for row in db.get_document_details(model_id)] == ["Завод"]
+        # индекс поиска пересобран из перенесённых данных
+        assert [hit[4] for hit in db.search("т")] == ["Токарная", "Токарная"]
+    finally:
+        db.close()
+
+
+def test_model_queries_use_indexes(db):
+    # Запросы, которые идут при каждом переключении модели и в поиске применяемости
+    queries = [
+        ROW_QUERIES['parts'][0] + " WHERE model_id = ? ORDER BY id",
+        ROW_QUERIES['operations'][0] + " WHERE r.model_id = ? ORDER BY r.id",
+        ROW_QUERIES['document_details'][0] + " WHERE model_id = ? ORDER BY id",
+        "SELECT model_id FROM parts WHERE code = ?",
+        "SELECT model_id FROM route_operations WHERE catalog_id = ?",
+        "SELECT model_id FROM route_operations WHERE equipment_id = ?",
+        "SELECT model_id FROM model_workshops WHERE workshop_id = ?",
+    ]
+    for sql in queries:
+        steps = plan(db, sql, (1,))
+        # первый шаг - поиск по индексу таблицы, без полного просмотра и сортировки
+        assert "USING" in steps[0] and "INDEX" in steps[0], (sql, steps)
+        assert not any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in steps), (sql, steps)
+
+
+OPEN_DB = """
+import sys
+from capp_db import CAPPDatabase
+db = CAPPDatabase(sys.argv[1])
+print(len(db.get_operations(db.get_model_id("Старая"))), len(db.get_operation_catalog()))
+"""
+
+
+def test_concurrent_clients_migrate_once(tmp_path):
+    # Несколько клиентов открывают общую старую БД одновременно: каждый шаг миграции
+    # применяется один раз, остальные видят новую версию и пропускают его
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for trial in range(3):
+        path = str(tmp_path / f"shared{trial}.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(OLD_SCHEMA)
+        conn.close()
+        clients = [subprocess.Popen([sys.executable, "-c", OPEN_DB, path], cwd=root, text=True,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE) for _ in range(3)]
+        results = [client.communicate() + (client.returncode,) for client in clients]
+        assert [(out, code) for out, _, code in results] == [("1 2\n", 0)] * 3, [err for _, err, _ in results]
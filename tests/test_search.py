@@ -0,0 +1,92 @@
+import os
+import time
+
+
+def found(db, text):
+    return [(table, row_id) for table, row_id, *_ in db.search(text)]
+
+
+def fill(db):
+    model_id = db.insert_model("Редуктор")
+    gear = db.insert_part(model_id, "Шестерня ведомая", "Ш-12", 2)
+    shaft = db.insert_part(model_id, "Вал", "В-3", 1)
+    db.insert_operation(model_id, "5", "010", "Фрезерная", "нарезание зубьев: шестерня", "Станок ЗФС", 0.5, 3.0)
+    return model_id, gear, shaft
+
+
+def test_result_row(db):
+    model_id, gear, _ = fill(db)
+    assert db.search("Ш-12")[0] == ('parts', gear, model_id, "Редуктор", "Шестерня ведомая", "Ш-12")
+
+
+def test_name_matches_rank_above_body_matches(db):
+    _, gear, _ = fill(db)
+    hits = db.search("шестерня")
+    assert [table for table, *_ in hits] == ['parts', 'operations']
+    assert hits[0][1] == gear
+
+
+def test_last_word_is_prefix(db):
+    _, gear, shaft = fill(db)
+    assert found(db, "шест")[0] == ('parts', gear)
+    assert found(db, "ш")[0] == ('parts', gear)
+    assert found(db, "шестерня вед") == [('parts', gear)]
+    # префиксом считается только последнее слово
+    assert found(db, "шест ведомая") == []
+    assert found(db, "ВАЛ") == [('parts', shaft)]
+    assert found(db, "  ") == []
+
+
+def test_index_follows_part_update_and_delete(db):
+    model_id, gear, shaft = fill(db)
+    assert db.update_part(shaft, "Ось", "О-1", 1)
+    assert found(db, "вал") == []
+    assert found(db, "ось") == [('parts', shaft)]
+    assert found(db, "О-1") == [('parts', shaft)]
+
+    assert db.delete_part(gear)
+    assert found(db, "ведомая") == []
+    assert found(db, "шестерня") == [('operations', db.get_operations(model_id)[0][0])]
+
+
+def test_index_follows_catalog_rename_and_clone(db):
+    model_id, _, _ = fill(db)
+    catalog_id = db.get_operation_catalog()[0][0]
+    assert db.update_catalog_operation(catalog_id, "010", "Зубофрезерная")
+    assert [table for table, *_ in db.search("зубофрезерная")] == ['operation_catalog', 'operations']
+    assert found(db, "фрезерная") == []
+
+    assert db.clone_model(model_id, "Копия")
+    assert {hit[3] for hit in db.search("ведомая")} == {"Редуктор", "Копия"}
+
+
+NOUNS = ["шестерня", "вал", "ось", "втулка", "шайба", "гайка", "болт", "корпус", "крышка", "фланец",
+         "кронштейн", "пружина", "штифт", "шпонка", "муфта", "подшипник", "звёздочка", "рычаг", "планка",
+         "стойка", "кольцо", "палец", "тяга", "шкив", "винт", "заглушка", "прокладка", "опора", "ролик", "упор"]
+ADJECTIVES = ["ведомая", "ведущий", "длинный", "короткая", "верхний", "нижняя", "левый", "правая", "упорное",
+              "стопорная", "регулировочный", "промежуточный", "опорная", "натяжной", "защитная", "уплотнительное",
+              "установочный", "распорная", "приводной", "крепёжный"]
+
+
+def test_search_latency_on_large_index(db):
+    # Поиск по мере ввода на большой БД: каждое слово - в десятках тысяч строк, первая
+    # буква - почти во всех, ранжируются последние SEARCH_RANK_WINDOW совпадений.
+    # CAPP_BENCH=1 - 1 млн деталей в 100 моделях.
+    rows = 1_000_000 if os.environ.get("CAPP_BENCH") else 20_000
+    per_model = rows // 100
+    with db.transaction():
+        for start in range(0, rows, per_model):
+            model_id = db.insert_model(f"Модель {start // per_model}")
+            db.insert_parts_many(model_id, ((f"{NOUNS[i % 30].capitalize()} {ADJECTIVES[i // 30 % 20]} {i % 997}",
+                                             f"{NOUNS[i % 30][:2].upper()}-{i}", 1)
+                                            for i in range(start, start + per_model)))
+    last = rows - 1
+    for text in ["ш", "шест", "вал ведущий", "опора 12", f"{NOUNS[last % 30][:2]}-{last}", "с", "к"]:
+        times = []
+        for _ in range(3):
+            started = time.perf_counter()
+            hits = db.search(text)
+            times.append(time.perf_counter() - started)
+        print(f"\n{rows} строк, «{text}»: {min(times) * 1000:.1f} мс, найдено {len(hits)}")
+        assert hits
+        assert min(times) < 0.05
@@ -0,0 +1,64 @@
+import pytest
+
+from snapshot_cache import SnapshotCache
+
+
+def test_lru_counts_and_eviction():
+    cache, built = SnapshotCache(maxsize=2), []
+
+    def build(key):
+        return lambda: built.append(key) or key.upper()
+    assert cache.get("a", build("a")) == "A"
+    assert cache.get("a", build("a")) == "A"
+    cache.get("b", build("b"))
+    cache.get("a", build("a"))  # a - недавно использованный, вытесняется b
+    cache.get("c", build("c"))
+    cache.get("a", build("a"))
+    cache.get("b", build("b"))
+    assert built == ["a", "b", "c", "b"]
+    assert cache.stats() == {'hits': 3, 'misses': 4, 'size': 2, 'hit_rate': 3 / 7}
+    cache.clear()
+    assert cache.stats()['size'] == 0
+
+
+def test_write_bumps_revision_and_invalidates_snapshot(db):
+    model_id = db.insert_model("A")
+    other = db.insert_model("Б")
+    db.insert_part(model_id, "Вал", "В-1", 1)
+    db.insert_operation(model_id, "5", "010", "Токарная", "", "Станок", 0.5, 1.0)
+
+    first = db.get_process_snapshot("A")
+    second = db.get_process_snapshot("A")
+    assert db.snapshots.stats()['misses'] == 1 and db.snapshots.stats()['hits'] == 1
+    # словарь каждый раз новый, секции - общие неизменяемые кортежи
+    assert second is not first and second['parts'] is first['parts']
+
+    # запись в другую модель снимок не трогает
+    revision = db.get_revision(model_id)
+    db.insert_part(other, "Ось", "О-1", 1)
+    assert db.get_revision(model_id) == revision
+    assert db.get_process_snapshot("A")['parts'] is first['parts']
+
+    db.insert_part(model_id, "Шайба", "Ш-1", 4)
+    assert db.get_revision(model_id) != revision
+    assert [row[1] for row in db.get_process_snapshot("A")['parts']] == ["Вал", "Шайба"]
+    assert db.snapshots.stats()['misses'] == 2
+
+    # правка справочника меняет снимки всех моделей, где есть операция
+    catalog_id = db.get_operation_catalog()[0][0]
+    db.update_catalog_operation(catalog_id, "010", "Токарная чистовая")
+    assert db.get_process_snapshot("A")['operations'][0][3] == "Токарная чистовая"
+
+
+def test_uncommitted_data_not_cached(db):
+    model_id = db.insert_model("A")
+    revision = db.get_revision(model_id)
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert_part(model_id, "Вал", "В-1", 1)
+            assert len(db.get_process_snapshot("A")['parts']) == 1
+            raise RuntimeError
+    # после отката ревизия прежняя, и снимок с откаченной деталью не должен найтись по ней
+    assert db.get_revision(model_id) == revision
+    assert db.get_process_snapshot("A")['parts'] == ()
+    assert db.snapshots.stats()['misses'] == 1
@@ -0,0 +1,41 @@
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Холодный старт: отдельный интерпретатор на каждый замер. CAPP_BENCH=1 - медиана 9 запусков.
+RUNS = 9 if os.environ.get("CAPP_BENCH") else 3
+
+
+def run(code):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    assert result.returncode == 0, result.stderr
+    return result.stdout, elapsed
+
+
+def cold_start(code):
+    return statistics.median(run(code)[1] for _ in range(RUNS))
+
+
+def test_cli_does_not_import_qt_or_pdf():
+    # reportlab и openpyxl подгружаются только командами export и import-bom
+    out, _ = run("import sys, capp; print(sorted(m for m in ('PyQt5', 'reportlab', 'openpyxl') if m in sys.modules))")
+    assert out.strip() == "[]"
+
+
+@pytest.mark.skipif(importlib.util.find_spec("PyQt5") is None, reason="PyQt5 не установлен")
+def test_cli_cold_start_against_gui():
+    bare = cold_start("pass")
+    cli = cold_start("import capp")
+    gui = cold_start("import capp_prototype")
+    print(f"\nинтерпретатор {bare * 1000:.0f} мс, import capp {cli * 1000:.0f} мс, "
+          f"import capp_prototype {gui * 1000:.0f} мс")
+    assert cli - bare < (gui - bare) / 3
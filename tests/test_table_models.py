@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from table_models import RowTableModel, text  # noqa: E402
+
+
+def catalog_model(db, rows=600):
+    with db.transaction():
+        db.cursor.executemany("INSERT INTO equipment (name, article, note) VALUES (?, '', '')",
+                              ((f"Станок {i}",) for i in range(rows)))
+    model = RowTableModel(['Наименование'], [(1, text)], batch_size=256)
+    model.watch(db, 'equipment', None, lambda after=None: db.get_equipment(lazy=True, after=after))
+    model.fetchMore()
+    return model
+
+
+def test_partly_fetched_source_does_not_pin_thread_reader(db):
+    model = catalog_model(db)
+    assert model.canFetchMore()
+    model_id = db.insert_model("A")
+    db.insert_part(model_id, "деталь", "D", 1)
+    # чтения потока идут по свежему снимку, пока ленивый источник недочитан
+    assert [row[1] for row in db.get_parts(model_id)] == ["деталь"]
+    assert db.get_process_snapshot("A")['parts']
+    model.unwatch()
+    assert not model.canFetchMore()
+    db.insert_part(model_id, "ещё", "E", 1)
+    assert len(db.get_parts(model_id)) == 2
+
+
+def test_lazy_source_connection_closed_when_replaced(db):
+    model = catalog_model(db)
+    source = model._source
+    model.set_source([])
+    assert source._conn is None
+
+
+def test_insert_before_source_exhausted_keeps_query_order(db):
+    model = catalog_model(db)
+    row_id = db.insert_equipment("Новый", "", "")
+    model.fetch_all()
+    ids = [model.row(i)[0] for i in range(model.rowCount())]
+    assert ids == sorted(ids) and ids[-1] == row_id and len(ids) == 601
+
+
+def test_update_of_unfetched_row_is_shown(db):
+    model = catalog_model(db)
+    last_id = db.get_equipment()[-1][0]
+    db.update_equipment(last_id, "Изменён", "", "")
+    db.delete_equipment(last_id - 1)
+    model.fetch_all()
+    names = {row[0]: row[1] for row in (model.row(i) for i in range(model.rowCount()))}
+    assert names[last_id] == "Изменён" and last_id - 1 not in names
+
+
+def test_event_past_fetched_window_keeps_paging(db):
+    model = catalog_model(db)
+    last_id = db.get_equipment()[-1][0]
+    db.update_equipment(last_id, "Изменён", "", "")
+    db.insert_equipment("Новый", "", "")
+    # строки за прочитанной порцией не дочитываются целиком - их принесёт fetchMore
+    assert model.rowCount() == 256 and model.canFetchMore()
+    model.fetchMore()
+    ids = [model.row(i)[0] for i in range(model.rowCount())]
+    assert model.rowCount() == 512 and ids == sorted(ids)
+
+
+# Бенчмарк (CAPP_BENCH=1): первая правка в справочнике на 100 000 строк после первой
+# порции не читает весь источник
+@pytest.mark.skipif(not os.environ.get("CAPP_BENCH"), reason="CAPP_BENCH=1")
+def test_first_edit_latency_on_large_catalog(db):
+    model = catalog_model(db, rows=100000)
+    last_id = db.get_equipment()[-1][0]
+    started = time.perf_counter()
+    db.update_equipment(last_id, "Изменён", "", "")
+    db.insert_equipment("Новый", "", "")
+    model.fetchMore()
+    elapsed = time.perf_counter() - started
+    print(f"\nправка и следующая порция: {elapsed * 1000:.1f} мс, строк в модели {model.rowCount()}")
+    assert model.rowCount() == 512
+    assert elapsed < 0.05
@@ -0,0 +1,58 @@
+import capp
+
+
+def fill(db):
+    # Вал - в двух моделях (в Б дважды), Станок - в операциях трёх моделей
+    a, b, c = db.insert_model("А"), db.insert_model("Б"), db.insert_model("В")
+    db.insert_part(b, "Вал", "В-1", 2)
+    db.insert_part(b, "Вал длинный", "В-1", 3)
+    db.insert_part(a, "Вал", "В-1", 1)
+    db.insert_part(c, "Ось", "О-1", 4)
+    for model_id in (a, b, b, c):
+        db.insert_operation(model_id, "5", "010", "Токарная", "", "Станок", 0.5, 1.0)
+    db.insert_operation(c, "10", "010", "Токарная чистовая", "", "Пресс", 0.5, 1.0)
+    return a, b, c
+
+
+def test_not_used_anywhere(db):
+    fill(db)
+    unused_equipment = db.insert_equipment("Фреза", "", "")
+    unused_operation = db.insert_catalog_operation("090", "Контроль")
+    unused_workshop = db.insert_workshop("Цех 9", "", "")
+    assert db.where_used_part("Н-1") == []
+    assert db.where_used_equipment("Фреза") == []
+    assert db.where_used_operation("090") == []
+    assert db.where_used('equipment', unused_equipment) == []
+    assert db.where_used('operation_catalog', unused_operation) == []
+    assert db.where_used('workshop', unused_workshop) == []
+    # неиспользуемую запись справочника можно удалить
+    assert db.delete_equipment(unused_equipment)
+    assert db.delete_catalog_operation(unused_operation)
+
+
+def test_used_by_several_models(db):
+    a, b, c = fill(db)
+    assert db.where_used_part("В-1") == [(a, "А", 1, 1), (b, "Б", 2, 5)]
+    assert db.where_used_equipment("Станок") == [(a, "А", 1), (b, "Б", 2), (c, "В", 1)]
+    # все наименования операции с этим кодом
+    assert db.where_used_operation("010") == [(a, "А", 1), (b, "Б", 2), (c, "В", 2)]
+
+    catalog_id = next(id for id, code, name in db.get_operation_catalog() if name == "Токарная")
+    assert db.where_used('operation_catalog', catalog_id) == [(a, "А", 1), (b, "Б", 2), (c, "В", 1)]
+    equipment_id = next(row[0] for row in db.get_equipment() if row[1] == "Пресс")
+    assert db.where_used('equipment', equipment_id) == [(c, "В", 1)]
+    workshop_id = db.insert_workshop("Цех 1", "", "")
+    db.set_model_workshops(c, [workshop_id])
+    db.set_model_workshops(a, [workshop_id])
+    assert db.where_used('workshop', workshop_id) == [(a, "А", 1), (c, "В", 1)]
+    # используемую запись удалить нельзя
+    assert not db.delete_catalog_operation(catalog_id)
+    assert not db.delete_equipment(equipment_id)
+
+
+def test_cli_where_used(db, capsys):
+    fill(db)
+    assert capp.main(["--db", db.pool.db_name, "where-used", "--part", "В-1"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["Модель\tПозиций\tКоличество", "А\t1\t1", "Б\t2\t5"]
+    assert capp.main(["--db", db.pool.db_name, "where-used", "--equipment", "Фреза"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["Модель\tОпераций"]